@@ -1,6 +1,10 @@
+import hashlib
+import json
+import time
 from collections import defaultdict
 from datetime import datetime, timedelta
 
+from django.core.cache import cache
 from elasticutils import F
 from rest_framework import views, fields, exceptions
 from rest_framework.response import Response
@@ -14,6 +18,15 @@ from kitsune.wiki.models import RevisionMetricsMappingType
 # section.  There isn't a way to tell ES to just return everything.
 BIG_NUMBER = 10000
 
+# How long to cache the metrics for a set of filters.
+METRICS_CACHE_TIMEOUT = 60 * 5
+# While one request computes the metrics for a set of filters, others
+# with the same filters wait for them, checking every METRICS_LOCK_WAIT
+# seconds, up to METRICS_LOCK_TRIES times.
+METRICS_LOCK_TIMEOUT = 30
+METRICS_LOCK_WAIT = 0.1
+METRICS_LOCK_TRIES = 50
+
 
 class InvalidFilterNameException(exceptions.APIException):
     """A filter was requested which does not exist."""
@@ -41,6 +54,41 @@ class TopContributorsBase(views.APIView):
     def get_allowed_orderings(self):
         return []
 
+    def get_cached_metrics(self, compute):
+        """Returns ``compute()`` for the current filters, cached.
+
+        Only one request at a time computes the metrics for a set of
+        filters. The others wait for its result instead of running the
+        same queries.
+
+        """
+        filters = dict((k, v) for k, v in self.query_values.items()
+                       if k not in ('page', 'page_size', 'ordering'))
+        key = 'community:metrics:{0}:{1}'.format(
+            self.__class__.__name__,
+            hashlib.md5(json.dumps(filters, sort_keys=True)).hexdigest())
+        lock_key = key + ':lock'
+
+        metrics = cache.get(key)
+        if metrics is not None:
+            return metrics
+
+        locked = cache.add(lock_key, 1, METRICS_LOCK_TIMEOUT)
+        if not locked:
+            for i in range(METRICS_LOCK_TRIES):
+                time.sleep(METRICS_LOCK_WAIT)
+                metrics = cache.get(key)
+                if metrics is not None:
+                    return metrics
+
+        try:
+            metrics = compute()
+            cache.set(key, metrics, METRICS_CACHE_TIMEOUT)
+        finally:
+            if locked:
+                cache.delete(lock_key)
+        return metrics
+
     def get_filters(self):
         self.query_values = self.get_default_query()
         # request.GET is a multidict, so simple `.update(request.GET)` causes
@@ -175,67 +223,74 @@ class TopContributorsQuestions(TopContributorsBase):
         f &= F(by_asker=False)
         return f
 
-    def get_data(self, request):
-        super(TopContributorsQuestions, self).get_data(request)
+    def get_metrics(self, base_filters):
+        """Returns the metrics of every contributor, by user id.
 
-        # This is the base of all the metrics. Each metric branches off from
-        # this to get a particular metric type, since we can't do Aggregates.
-        query = AnswerMetricsMappingType.search()
-        base_filters = self.get_filters()
+        Each metric is a facet with its own filter, since we can't do
+        Aggregates, and they all go in a single search that doesn't
+        return any hits.
 
-        # This branch is to get the total number of answers for each user.
-        answer_query = (
-            query
-            .filter(base_filters)
-            .facet('creator_id', filtered=True, size=BIG_NUMBER))
-
-        # This branch gets the number of answers that are solutions for each user.
-        solutions_filter = base_filters & F(is_solution=True)
-        solutions_query = (
-            query
-            .filter(solutions_filter)
-            .facet('creator_id', filtered=True, size=BIG_NUMBER))
-
-        # This branch gets the number of helpful votes across all answers for
-        # each user. It is a raw facet because elasticutils only supports the
-        # term facet type in non-raw facets. Because it is raw facet, we have
-        # to also put the filter in the facet ourselves.
-        helpful_query = (
-            query
-            .facet_raw(
-                creator_id={
-                    'terms_stats': {
-                        'key_field': 'creator_id',
-                        'value_field': 'helpful_count',
-                    },
-                    'facet_filter': query._process_filters(base_filters.filters),
-                }))
-
-        # Collect three lists of objects that correlates users and the appropriate metric count
-        creator_answer_counts = answer_query.facet_counts()['creator_id']['terms']
-        creator_solutions_counts = solutions_query.facet_counts()['creator_id']['terms']
-        creator_helpful_counts = helpful_query.facet_counts()['creator_id']['terms']
+        """
+        query = AnswerMetricsMappingType.search()
 
-        # Combine all the metric types into one big list.
+        def facet_filter(f):
+            return query._process_filters(f.filters)
+
+        # The helpful votes facet is terms_stats, which elasticutils only
+        # supports as a raw facet, so all of them are raw facets with
+        # their filters put in ourselves.
+        metrics_query = query.facet_raw(
+            # The total number of answers for each user.
+            answers={
+                'terms': {'field': 'creator_id', 'size': BIG_NUMBER},
+                'facet_filter': facet_filter(base_filters),
+            },
+            # The number of answers that are solutions for each user.
+            solutions={
+                'terms': {'field': 'creator_id', 'size': BIG_NUMBER},
+                'facet_filter': facet_filter(
+                    base_filters & F(is_solution=True)),
+            },
+            # The number of helpful votes across all answers for each user.
+            helpful={
+                'terms_stats': {
+                    'key_field': 'creator_id',
+                    'value_field': 'helpful_count',
+                },
+                'facet_filter': facet_filter(base_filters),
+            })[:0]
+        facets = metrics_query.facet_counts()
+
+        # Combine all the metric types into one big dict.
         combined = defaultdict(lambda: {
             'answer_count': 0,
             'solution_count': 0,
             'helpful_vote_count': 0,
         })
 
-        for d in creator_answer_counts:
+        for d in facets['answers']['terms']:
             combined[d['term']]['user_id'] = d['term']
             combined[d['term']]['answer_count'] = d['count']
 
-        for d in creator_solutions_counts:
+        for d in facets['solutions']['terms']:
             combined[d['term']]['user_id'] = d['term']
             combined[d['term']]['solution_count'] = d['count']
 
-        for d in creator_helpful_counts:
+        for d in facets['helpful']['terms']:
             combined[d['term']]['user_id'] = d['term']
             # Since this is a term_stats filter, not just a term filter, it is total, not count.
             combined[d['term']]['helpful_vote_count'] = int(d['total'])
 
+        # A plain dict, so it can be cached.
+        return dict(combined)
+
+    def get_data(self, request):
+        super(TopContributorsQuestions, self).get_data(request)
+
+        base_filters = self.get_filters()
+        combined = self.get_cached_metrics(
+            lambda: self.get_metrics(base_filters))
+
         # Sort by answer count, and get just the ids into a list.
         sort_key = self.query_values['ordering']
         if sort_key[0] == '-':
@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 
+import mock
 from nose.tools import eq_
 
 from django.test.client import RequestFactory
@@ -27,6 +28,38 @@ class TestTopContributorsBase(ElasticTestCase):
         self.api.get_filters()
         eq_(self.api.warnings, ['Unknown filter not_valid'])
 
+    def test_cached_metrics(self):
+        """Metrics are cached per filter, ignoring paging and ordering."""
+        compute = mock.Mock(return_value={1: {'answer_count': 1}})
+
+        self.api.request = self.factory.get('/', {'page': 1})
+        self.api.get_filters()
+        eq_({1: {'answer_count': 1}}, self.api.get_cached_metrics(compute))
+
+        self.api.request = self.factory.get('/', {'page': 2, 'page_size': 5})
+        self.api.get_filters()
+        eq_({1: {'answer_count': 1}}, self.api.get_cached_metrics(compute))
+        eq_(1, compute.call_count)
+
+        self.api.request = self.factory.get('/', {'locale': 'de'})
+        self.api.get_filters()
+        self.api.get_cached_metrics(compute)
+        eq_(2, compute.call_count)
+
+    @mock.patch.object(api, 'METRICS_LOCK_WAIT', 0)
+    @mock.patch.object(api.cache, 'add')
+    def test_cached_metrics_coalesced(self, add):
+        """While another request has the lock, wait for its result."""
+        add.return_value = False
+        self.api.request = self.factory.get('/')
+        self.api.get_filters()
+
+        compute = mock.Mock(return_value={})
+        get = mock.Mock(side_effect=[None, None, {2: {}}])
+        with mock.patch.object(api.cache, 'get', get):
+            eq_({2: {}}, self.api.get_cached_metrics(compute))
+        eq_(0, compute.call_count)
+
 
 class TestTopContributorsQuestions(ElasticTestCase):
     def setUp(self):
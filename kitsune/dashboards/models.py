@@ -16,6 +16,9 @@ from kitsune.wiki.models import Document
 
 log = logging.getLogger('k.dashboards')
 
+# How many visit rows to write per query.
+VISITS_BATCH_SIZE = 1000
+
 
 def period_dates(period):
     """Return when each period begins and ends."""
@@ -66,9 +69,10 @@ class WikiDocumentVisits(ModelBase):
                 [period])
 
             # Now we create them again with fresh data.
-            for doc_id, visits in counts.iteritems():
-                cls.objects.create(document=Document(pk=doc_id), visits=visits,
-                                   period=period)
+            cls.objects.bulk_create(
+                [cls(document_id=doc_id, visits=visits, period=period)
+                 for doc_id, visits in counts.iteritems()],
+                batch_size=VISITS_BATCH_SIZE)
         else:
             # Don't erase interesting data if there's nothing to replace it:
             log.warning('Google Analytics returned no interesting data,'
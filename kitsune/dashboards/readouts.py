@@ -11,6 +11,7 @@ from datetime import datetime
 
 from django.conf import settings
 from django.db import connections, router
+from django.db.models import Max, Q
 from django.template.loader import render_to_string
 from django.utils.datastructures import SortedDict
 from django.utils.translation import ugettext as _, ugettext_lazy as _lazy, pgettext_lazy
@@ -23,7 +24,7 @@ from kitsune.questions.models import QuestionLocale
 from kitsune.sumo.templatetags.jinja_helpers import urlparams
 from kitsune.sumo.redis_utils import redis_client, RedisError
 from kitsune.sumo.urlresolvers import reverse
-from kitsune.wiki.models import Document
+from kitsune.wiki.models import Document, Revision
 from kitsune.wiki.config import (
     MEDIUM_SIGNIFICANCE, MAJOR_SIGNIFICANCE,
     TYPO_SIGNIFICANCE, REDIRECT_HTML,
@@ -218,11 +219,61 @@ def kb_overview_rows(mode=None, max=None, locale=None, product=None, category=No
     if max:
         docs = docs[:max]
 
-    rows = []
-
-    if docs.count():
-        max_visits = docs[0].num_visits
+    docs = list(docs.select_related('current_revision'))
+    if not docs:
+        return []
+
+    max_visits = docs[0].num_visits
+    doc_ids = [d.id for d in docs]
+
+    # The rest of what the rows need comes from a fixed number of grouped
+    # queries over all the documents instead of a few per document.
+    ready_for_l10n = set(
+        Revision.objects.filter(document__in=doc_ids,
+                                is_approved=True,
+                                is_ready_for_localization=True)
+                        .values_list('document', flat=True)
+                        .distinct())
+
+    # The unreviewed revision after the current one, or the first one if
+    # there's no current revision yet.
+    no_current_ids = [d.id for d in docs if not d.current_revision_id]
+    current_ids = dict((d.id, d.current_revision_id) for d in docs)
+    unreviewed = {}
+    for doc_id, rev_id, comment in (
+            Revision.objects.filter(Q(document__in=doc_ids, reviewed=None) |
+                                    Q(document__in=no_current_ids))
+                            .order_by('id')
+                            .values_list('document', 'id', 'comment')):
+        current_id = current_ids[doc_id]
+        if doc_id not in unreviewed and (current_id is None or
+                                         rev_id > current_id):
+            unreviewed[doc_id] = comment
+
+    # The translations, and whether their parents had significant enough
+    # revisions since they were based on, which is what is_outdated checks.
+    translations = {}
+    latest_significant = {}
+    if locale != settings.WIKI_DEFAULT_LANGUAGE:
+        translations = dict(
+            (parent_id, (current_id, based_on_id))
+            for parent_id, current_id, based_on_id in (
+                Document.objects.filter(parent__in=doc_ids,
+                                        locale=locale,
+                                        is_archived=False)
+                                .values_list('parent', 'current_revision',
+                                             'current_revision__based_on')))
+        latest_significant = dict(
+            Revision.objects.filter(document__in=translations.keys(),
+                                    is_approved=True,
+                                    is_ready_for_localization=True,
+                                    significance__gte=MEDIUM_SIGNIFICANCE)
+                            .values('document')
+                            .order_by()
+                            .annotate(latest=Max('id'))
+                            .values_list('document', 'latest'))
 
+    rows = []
     for d in docs:
         data = {
             'url': reverse('wiki.document', args=[d.slug],
@@ -231,8 +282,7 @@ def kb_overview_rows(mode=None, max=None, locale=None, product=None, category=No
                                  locale=settings.WIKI_DEFAULT_LANGUAGE),
             'title': d.title,
             'num_visits': d.num_visits,
-            'ready_for_l10n': d.revisions.filter(is_approved=True,
-                                                 is_ready_for_localization=True).exists()
+            'ready_for_l10n': d.id in ready_for_l10n
         }
 
         if d.current_revision:
@@ -245,25 +295,19 @@ def kb_overview_rows(mode=None, max=None, locale=None, product=None, category=No
             data['stale'] = data['expiry_date'] < datetime.now()
 
         # Check L10N status
-        if d.current_revision:
-            unapproved_revs = d.revisions.filter(
-                reviewed=None, id__gt=d.current_revision.id)[:1]
-        else:
-            unapproved_revs = d.revisions.all()
-
-        if unapproved_revs.count():
-            data['revision_comment'] = unapproved_revs[0].comment
+        if d.id in unreviewed:
+            data['revision_comment'] = unreviewed[d.id]
         else:
             data['latest_revision'] = True
 
         # Get the translated doc
         if locale != settings.WIKI_DEFAULT_LANGUAGE:
-            transdoc = d.translations.filter(
-                locale=locale,
-                is_archived=False).first()
-
-            if transdoc:
-                data['needs_update'] = transdoc.is_outdated()
+            if d.id in translations:
+                current_id, based_on_id = translations[d.id]
+                latest = latest_significant.get(d.id)
+                data['needs_update'] = bool(
+                    current_id and latest and
+                    (not based_on_id or latest > based_on_id))
         else:  # For en-US we show the needs_changes comment.
             data['needs_update'] = d.needs_change
             data['needs_update_comment'] = d.needs_change_comment
@@ -64,6 +64,34 @@ class KBOverviewTests(TestCase):
         data = kb_overview_rows()
         eq_(True, data[0]['ready_for_l10n'])
 
+    def test_translation_status(self):
+        d = ApprovedRevisionFactory(is_ready_for_localization=True).document
+        RevisionFactory(document=d, comment='Unreviewed')
+        t = ApprovedRevisionFactory(document__locale='de', document__parent=d,
+                                    based_on=d.current_revision).document
+
+        data = kb_overview_rows(locale='de')
+        eq_('Unreviewed', data[0]['revision_comment'])
+        eq_(False, data[0]['needs_update'])
+
+        ApprovedRevisionFactory(document=d, is_ready_for_localization=True,
+                                significance=MEDIUM_SIGNIFICANCE)
+        data = kb_overview_rows(locale='de')
+        eq_(True, data[0]['needs_update'])
+        eq_(t.is_outdated(), data[0]['needs_update'])
+
+    def test_fixed_queries(self):
+        """The number of queries doesn't depend on the number of rows."""
+        for i in range(5):
+            d = ApprovedRevisionFactory(is_ready_for_localization=True).document
+            RevisionFactory(document=d)
+            ApprovedRevisionFactory(document__locale='de', document__parent=d,
+                                    based_on=d.current_revision)
+
+        with self.assertNumQueries(5):
+            data = kb_overview_rows(locale='de')
+        eq_(5, len(data))
+
     def test_filter_by_category(self):
         RevisionFactory(document__category=CATEGORIES[1][0])
 
@@ -1,3 +1,4 @@
+import collections
 import datetime
 import time
 
@@ -240,47 +241,80 @@ class ThreadMappingType(SearchMappingType):
             model = cls.get_model()
             obj = model.objects.select_related('last_post').get(pk=obj_id)
 
-        d = {}
-        d['id'] = obj.id
-        d['model'] = cls.get_mapping_type_name()
-        d['url'] = obj.get_absolute_url()
-        d['indexed_on'] = int(time.time())
-
-        # TODO: Sphinx stores created and updated as seconds since the
-        # epoch, so we convert them to that format here so that the
-        # search view works correctly. When we ditch Sphinx, we should
-        # see if it's faster to filter on ints or whether we should
-        # switch them to dates.
-        d['created'] = int(time.mktime(obj.created.timetuple()))
-
-        if obj.last_post is not None:
-            d['updated'] = int(time.mktime(obj.last_post.created.timetuple()))
-        else:
-            d['updated'] = None
-
-        d['post_forum_id'] = obj.forum.id
-        d['post_title'] = obj.title
-        d['post_is_sticky'] = obj.is_sticky
-        d['post_is_locked'] = obj.is_locked
-
-        d['post_replies'] = obj.replies
-
-        author_ids = set()
-        author_ords = set()
-        content = []
-
-        posts = Post.objects.filter(
-            thread_id=obj.id).select_related('author')
-        for post in posts:
-            author_ids.add(post.author.id)
-            author_ords.add(post.author.username)
-            content.append(post.content)
-
-        d['post_author_id'] = list(author_ids)
-        d['post_author_ord'] = list(author_ords)
-        d['post_content'] = content
-
-        return d
+        return cls._documents_from_objects([obj])[0]
+
+    @classmethod
+    def extract_documents(cls, ids):
+        """Extracts interesting things from a batch of Threads"""
+        model = cls.get_model()
+        objs = list(model.objects.select_related('last_post', 'forum')
+                                 .filter(pk__in=ids))
+        return zip([obj.id for obj in objs],
+                   cls._documents_from_objects(objs))
+
+    @classmethod
+    def _documents_from_objects(cls, objs):
+        """Builds documents from a list of Threads.
+
+        The posts for all the threads are pulled in with one query.
+
+        """
+        if not objs:
+            return []
+
+        posts = collections.defaultdict(list)
+        post_values = (Post.objects
+                           .filter(thread__in=[obj.id for obj in objs])
+                           .values_list('thread_id', 'author_id',
+                                        'author__username', 'content'))
+        for thread_id, author_id, author_username, content in post_values:
+            posts[thread_id].append((author_id, author_username, content))
+
+        now = int(time.time())
+        documents = []
+        for obj in objs:
+            d = {}
+            d['id'] = obj.id
+            d['model'] = cls.get_mapping_type_name()
+            d['url'] = obj.get_absolute_url()
+            d['indexed_on'] = now
+
+            # TODO: Sphinx stores created and updated as seconds since the
+            # epoch, so we convert them to that format here so that the
+            # search view works correctly. When we ditch Sphinx, we should
+            # see if it's faster to filter on ints or whether we should
+            # switch them to dates.
+            d['created'] = int(time.mktime(obj.created.timetuple()))
+
+            if obj.last_post is not None:
+                d['updated'] = int(
+                    time.mktime(obj.last_post.created.timetuple()))
+            else:
+                d['updated'] = None
+
+            d['post_forum_id'] = obj.forum_id
+            d['post_title'] = obj.title
+            d['post_is_sticky'] = obj.is_sticky
+            d['post_is_locked'] = obj.is_locked
+
+            d['post_replies'] = obj.replies
+
+            author_ids = set()
+            author_ords = set()
+            content = []
+
+            for author_id, author_username, post_content in posts[obj.id]:
+                author_ids.add(author_id)
+                author_ords.add(author_username)
+                content.append(post_content)
+
+            d['post_author_id'] = list(author_ids)
+            d['post_author_ord'] = list(author_ords)
+            d['post_content'] = content
+
+            documents.append(d)
+
+        return documents
 
 
 register_for_indexing('forums', Thread)
@@ -2,6 +2,7 @@ from nose.tools import eq_
 
 from kitsune.forums.models import ThreadMappingType
 from kitsune.forums.tests import ThreadFactory, PostFactory
+from kitsune.search.tests import ExtractDocumentsTestCase
 from kitsune.search.tests.test_es import ElasticTestCase
 from kitsune.users.tests import UserFactory
 
@@ -54,3 +55,15 @@ class TestPostUpdate(ElasticTestCase):
         u.save()
         self.refresh()
         eq_(search.query(post_title='hello')[0]['post_author_ord'], [u'walter'])
+
+
+class TestExtractDocuments(ExtractDocumentsTestCase):
+    def test_threads_match_extract_document(self):
+        t1 = ThreadFactory()
+        PostFactory(thread=t1)
+        PostFactory(thread=t1)
+        t2 = ThreadFactory()
+
+        extracted = self.assert_extract_documents(
+            ThreadMappingType, [t1.id, t2.id], 2)
+        eq_(len(extracted[t1.id]['post_content']), 3)
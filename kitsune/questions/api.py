@@ -4,7 +4,7 @@ import actstream.actions
 import django_filters
 import json
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Q
+from django.db.models import Prefetch, Q
 from rest_framework import serializers, viewsets, permissions, filters, status, pagination
 from rest_framework.decorators import detail_route
 from rest_framework.response import Response
@@ -249,6 +249,35 @@ class QuestionViewSet(viewsets.ModelViewSet):
     # Default, if not overwritten
     ordering = ('-id',)
 
+    def get_queryset(self):
+        queryset = super(QuestionViewSet, self).get_queryset()
+        if self.action != 'list':
+            return queryset
+
+        # Get everything QuestionSerializer needs for a page in a fixed
+        # number of queries. The vote count is a subquery rather than
+        # an annotation so the filters' joins can't inflate it.
+        return (
+            queryset
+            .select_related(
+                'creator__profile', 'updated_by__profile',
+                'taken_by__profile', 'solution__creator__profile',
+                'product', 'topic')
+            .prefetch_related(
+                'metadata_set', 'tags',
+                Prefetch('answers', queryset=Answer.objects.select_related(
+                    'creator__profile')))
+            .extra(select={'_num_votes': (
+                'SELECT COUNT(*) FROM questions_questionvote '
+                'WHERE questions_questionvote.question_id = '
+                'questions_question.id')}))
+
+    def paginate_queryset(self, queryset):
+        page = super(QuestionViewSet, self).paginate_queryset(queryset)
+        if page is not None:
+            Question.prefetch_content_parsed(page)
+        return page
+
     @detail_route(methods=['POST'])
     def solve(self, request, pk=None):
         """Accept an answer as the solution to the question."""
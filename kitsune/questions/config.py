@@ -21,6 +21,19 @@ ESCALATE_EXCLUDE_PRODUCTS = ['thunderbird', 'webmaker', 'open-badges']
 # How long until a question is automatically taken away from a user
 TAKE_TIMEOUT = 600
 
+# How long related documents and questions are fresh for, how long stale
+# ones are served while a task refreshes them, and how long to wait for
+# that task before scheduling another.
+RELATED_FRESH_TIMEOUT = 60 * 60
+RELATED_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+RELATED_REFRESH_LOCK_TIMEOUT = 60 * 5
+
+# Rolling counts of recently asked questions, in hourly buckets.
+RECENT_COUNT_KEY = u'questions:recent:{kind}:{locale}:{product}:{bucket}'
+RECENT_MEMBERS_KEY = u'questions:recent:{kind}:{bucket}:members'
+RECENT_COUNT_HOURS = 24
+RECENT_COUNT_TIMEOUT = 60 * 60 * 26
+
 # AAQ config:
 products = SortedDict([
     ('desktop', {
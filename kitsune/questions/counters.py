@@ -0,0 +1,203 @@
+"""Rolling counts of the questions asked in the last 24 hours.
+
+The question list shows how many questions were asked in the last 24
+hours and how many of those don't have a reply yet. Rather than count
+them in the db on every view, we keep counters in redis in hourly
+buckets per locale and product, plus one per locale for all products.
+
+Each bucket also has a hash of the questions it counts, mapped to their
+"locale:product", so updating a question more than once doesn't count
+it twice and moving it to another locale or product moves its count.
+The ``reconcile_recent_question_counts`` cron rebuilds everything from
+the db now and then to fix any drift.
+
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from redis import ConnectionError
+
+from kitsune.questions import config
+from kitsune.sumo.redis_utils import redis_client, RedisError
+
+
+ASKED = 'asked'
+UNANSWERED = 'unanswered'
+KINDS = (ASKED, UNANSWERED)
+
+# The product of the counters that count every product.
+ALL_PRODUCTS = 'all'
+
+
+def _bucket(dt):
+    return dt.strftime('%Y%m%d%H')
+
+
+def _buckets(now=None):
+    """Returns the buckets in the window, newest first.
+
+    The window is made of whole hours, so it spans between 23 and 24
+    hours depending on the time of the hour.
+
+    """
+    now = now or datetime.now()
+    return [_bucket(now - timedelta(hours=i))
+            for i in range(config.RECENT_COUNT_HOURS)]
+
+
+def window_start(now=None):
+    """Returns the datetime the oldest bucket in the window starts."""
+    now = now or datetime.now()
+    oldest = now - timedelta(hours=config.RECENT_COUNT_HOURS - 1)
+    return oldest.replace(minute=0, second=0, microsecond=0)
+
+
+def _count_key(kind, locale, product, bucket):
+    return config.RECENT_COUNT_KEY.format(
+        kind=kind, locale=locale, product=product, bucket=bucket)
+
+
+def _members_key(kind, bucket):
+    return config.RECENT_MEMBERS_KEY.format(kind=kind, bucket=bucket)
+
+
+def _member(locale, product_id):
+    return u'%s:%s' % (locale, product_id or 'none')
+
+
+def _count_keys(kind, member, bucket):
+    """Returns the keys of the counters that count a member."""
+    locale, product = member.split(':')
+    return [_count_key(kind, locale, product, bucket),
+            _count_key(kind, locale, ALL_PRODUCTS, bucket)]
+
+
+def recent_question_counts(locales, product_ids=None):
+    """Returns the (asked, unanswered) counts for the last 24 hours.
+
+    This is a single multi-get, no matter how many locales and products
+    there are.
+
+    :arg locales: the locales to count
+    :arg product_ids: the ids of the products to count, or ``None`` for
+        all the products
+
+    :throws RedisError: if redis is unavailable
+
+    """
+    products = product_ids or [ALL_PRODUCTS]
+    buckets = _buckets()
+    keys = [_count_key(kind, locale, product, bucket)
+            for kind in KINDS
+            for locale in locales
+            for product in products
+            for bucket in buckets]
+
+    try:
+        values = redis_client('default').mget(keys)
+    except ConnectionError:
+        raise RedisError('Unable to get the recent question counts.')
+
+    per_kind = len(values) / len(KINDS)
+    asked = sum(int(v or 0) for v in values[:per_kind])
+    unanswered = sum(int(v or 0) for v in values[per_kind:])
+    return asked, unanswered
+
+
+def update_recent_question_counts(question_id, locale, product_id, created,
+                                  asked, unanswered):
+    """Counts a question, or stops counting it, in its bucket.
+
+    :arg asked: whether the question counts as asked
+    :arg unanswered: whether the question counts as unanswered
+
+    :throws RedisError: if redis is unavailable
+
+    """
+    if created < window_start():
+        return
+
+    bucket = _bucket(created)
+    member = _member(locale, product_id)
+    redis = redis_client('default')
+    try:
+        for kind, counted in ((ASKED, asked), (UNANSWERED, unanswered)):
+            members_key = _members_key(kind, bucket)
+            old = redis.hget(members_key, question_id)
+            new = member if counted else None
+            if old == new:
+                continue
+
+            pipe = redis.pipeline()
+            if old is not None:
+                pipe.hdel(members_key, question_id)
+                for key in _count_keys(kind, old, bucket):
+                    pipe.decr(key)
+            if new is not None:
+                pipe.hset(members_key, question_id, new)
+                pipe.expire(members_key, config.RECENT_COUNT_TIMEOUT)
+                for key in _count_keys(kind, new, bucket):
+                    pipe.incr(key)
+                    pipe.expire(key, config.RECENT_COUNT_TIMEOUT)
+            pipe.execute()
+    except ConnectionError:
+        raise RedisError('Unable to update the recent question counts.')
+
+
+def reconcile_recent_question_counts(questions, now=None):
+    """Rebuilds the counts from scratch.
+
+    :arg questions: dicts with the ``id``, ``locale``, ``product_id``,
+        ``created`` and ``unanswered`` of every question with an active
+        creator created since ``window_start()``
+
+    :throws RedisError: if redis is unavailable
+
+    """
+    buckets = _buckets(now)
+    members = dict(((kind, bucket), {})
+                   for kind in KINDS for bucket in buckets)
+    for q in questions:
+        bucket = _bucket(q['created'])
+        if (ASKED, bucket) not in members:
+            continue
+        member = _member(q['locale'], q['product_id'])
+        members[(ASKED, bucket)][q['id']] = member
+        if q['unanswered']:
+            members[(UNANSWERED, bucket)][q['id']] = member
+
+    redis = redis_client('default')
+    try:
+        # Zero out the counters we had before, in case they don't have
+        # any questions anymore.
+        pipe = redis.pipeline()
+        for kind, bucket in members:
+            pipe.hvals(_members_key(kind, bucket))
+        old_members = pipe.execute()
+
+        counts = {}
+        for (kind, bucket), old in zip(members.keys(), old_members):
+            for member in old:
+                for key in _count_keys(kind, member, bucket):
+                    counts[key] = 0
+
+        new_counts = defaultdict(int)
+        for (kind, bucket), new in members.items():
+            for member in new.values():
+                for key in _count_keys(kind, member, bucket):
+                    new_counts[key] += 1
+        counts.update(new_counts)
+
+        pipe = redis.pipeline()
+        for (kind, bucket), new in members.items():
+            members_key = _members_key(kind, bucket)
+            pipe.delete(members_key)
+            if new:
+                pipe.hmset(members_key, new)
+                pipe.expire(members_key, config.RECENT_COUNT_TIMEOUT)
+        for key, count in counts.items():
+            pipe.set(key, count)
+            pipe.expire(key, config.RECENT_COUNT_TIMEOUT)
+        pipe.execute()
+    except ConnectionError:
+        raise RedisError('Unable to reconcile the recent question counts.')
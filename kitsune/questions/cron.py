@@ -9,14 +9,19 @@ from django.core.mail import send_mail
 from django.db import connection, transaction
 
 import cronjobs
+from statsd import statsd
 
 from kitsune.questions import config
+from kitsune.questions.counters import (
+    reconcile_recent_question_counts, window_start)
 from kitsune.questions.models import (
     Question, QuestionVote, QuestionMappingType, QuestionVisits, Answer)
 from kitsune.questions.tasks import (
-    escalate_question, update_question_vote_chunk)
-from kitsune.search.es_utils import ES_EXCEPTIONS, get_documents
+    escalate_question, refresh_question_list_chunk,
+    update_question_vote_chunk)
+from kitsune.search.es_utils import ES_EXCEPTIONS
 from kitsune.search.tasks import index_task
+from kitsune.sumo.redis_utils import RedisError
 from kitsune.sumo.utils import chunked
 
 
@@ -47,6 +52,45 @@ def update_weekly_votes():
         update_question_vote_chunk.apply_async(args=[chunk])
 
 
+@cronjobs.register
+def rebuild_question_list():
+    """Rebuild the question list entries of every question.
+
+    The entries are kept up to date as questions change, so this only
+    needs to run once to fill the table after migrating, or to repair it.
+
+    """
+    q_ids = list(Question.objects.values_list('id', flat=True)
+                                 .order_by('id'))
+
+    for chunk in chunked(q_ids, 500):
+        refresh_question_list_chunk.apply_async(args=[chunk])
+
+
+@cronjobs.register
+def reconcile_recent_counts():
+    """Rebuild the rolling counts of recent questions from the db.
+
+    The counts are updated as questions change, but some changes, like
+    deactivating a user, don't update them.
+
+    """
+    questions = list(Question.objects
+                     .filter(created__gte=window_start(),
+                             creator__is_active=True)
+                     .values('id', 'locale', 'product_id', 'created',
+                             'num_answers', 'is_locked', 'is_archived'))
+    for q in questions:
+        q['unanswered'] = (not q['num_answers'] and not q['is_locked'] and
+                           not q['is_archived'])
+
+    try:
+        reconcile_recent_question_counts(questions)
+    except RedisError as e:
+        statsd.incr('redis.error')
+        log.error('Redis error: %s' % e)
+
+
 @cronjobs.register
 def auto_archive_old_questions():
     """Archive all questions that were created over 180 days ago"""
@@ -77,31 +121,16 @@ def auto_archive_old_questions():
 
         if settings.ES_LIVE_INDEXING:
             try:
-                # So... the first time this runs, it'll handle 160K
-                # questions or so which stresses everything. Thus we
-                # do it in chunks because otherwise this won't work.
-                #
-                # After we've done this for the first time, we can nix
-                # the chunking code.
-
+                # Only the archived flag changed, so update just that
+                # in the index rather than reindexing the documents.
                 from kitsune.search.utils import chunked
-                for chunk in chunked(q_ids, 100):
-
-                    # Fetch all the documents we need to update.
-                    es_docs = get_documents(QuestionMappingType, chunk)
-
-                    log.info('Updating %d index documents', len(es_docs))
-
-                    documents = []
-
-                    # For each document, update the data and stick it
-                    # back in the index.
-                    for doc in es_docs:
-                        doc[u'question_is_archived'] = True
-                        doc[u'indexed_on'] = int(time.time())
-                        documents.append(doc)
+                for chunk in chunked(q_ids, 1000):
+                    log.info('Updating %d index documents', len(chunk))
 
-                    QuestionMappingType.bulk_index(documents)
+                    QuestionMappingType.update_fields(
+                        chunk,
+                        {'question_is_archived': True,
+                         'indexed_on': int(time.time())})
 
             except ES_EXCEPTIONS:
                 # Something happened with ES, so let's push index
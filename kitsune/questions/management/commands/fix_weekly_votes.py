@@ -2,6 +2,11 @@ import time
 
 from django.core.management.base import NoArgsCommand
 from django.db import connection, transaction
+from django.db.models import F
+
+from kitsune.questions.models import QuestionListEntry
+from kitsune.questions.tasks import refresh_question_list_chunk
+from kitsune.sumo.utils import chunked
 
 
 class Command(NoArgsCommand):
@@ -23,5 +28,15 @@ class Command(NoArgsCommand):
         """)
         transaction.commit()
         transaction.leave_transaction_management()
+
+        # The update skipped the post_save signals, so bring the question
+        # list entries whose votes changed up to date by hand.
+        stale = list(QuestionListEntry.objects
+                     .exclude(num_votes_past_week=F(
+                         'question__num_votes_past_week'))
+                     .values_list('question_id', flat=True))
+        for chunk in chunked(stale, 1000):
+            refresh_question_list_chunk(chunk)
+
         d = time.time() - start
         print u'Updated %d rows in %0.3f seconds.' % (rows, d)
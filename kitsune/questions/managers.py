@@ -59,6 +59,57 @@ class QuestionManager(Manager):
         return self.filter(tags__slug__in=[config.ESCALATE_TAG_NAME])
 
 
+class QuestionListEntryManager(Manager):
+    """The QuestionManager filters, for the denormalized question list.
+
+    These are plain column filters on QuestionListEntry, so they don't
+    need joins.
+
+    """
+    def done(self):
+        return self.filter(status='done')
+
+    def responded(self):
+        return self.filter(status='responded')
+
+    def needs_attention(self):
+        return self.filter(status='needs-attention',
+                           updated__gte=datetime.now() - timedelta(days=7))
+
+    def recently_unanswered(self):
+        return self.filter(has_answers=False, is_locked=False,
+                           created__gte=datetime.now() - timedelta(hours=24))
+
+    def new(self):
+        return self.filter(has_answers=False, is_locked=False,
+                           created__gte=datetime.now() - timedelta(days=7))
+
+    def unhelpful_answers(self):
+        return self.filter(is_solved=False, is_locked=False,
+                           last_answer_by_creator=True,
+                           created__gte=datetime.now() - timedelta(days=7))
+
+    def needs_info(self):
+        return self.filter(is_solved=False, is_locked=False, needs_info=True,
+                           last_answer_by_creator=False)
+
+    def solution_provided(self):
+        return self.filter(is_solved=False, is_locked=False,
+                           last_answer_by_creator=False)
+
+    def locked(self):
+        return self.filter(is_locked=True)
+
+    def solved(self):
+        return self.filter(is_solved=True)
+
+    def escalated(self):
+        return self.filter(is_escalated=True)
+
+    def tagged(self, name):
+        return self.filter(tags__contains=u'|%s|' % name)
+
+
 class QuestionLocaleManager(Manager):
     def locales_list(self):
         return self.values_list('locale', flat=True)
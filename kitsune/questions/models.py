@@ -1,6 +1,7 @@
 import logging
 import re
 import time
+from collections import defaultdict
 from datetime import datetime, timedelta, date
 from urlparse import urlparse
 
@@ -11,9 +12,9 @@ from django.core.cache import cache
 from django.core.urlresolvers import resolve
 from django.conf import settings
 from django.dispatch import receiver
-from django.db import models, connection, close_old_connections
-from django.db.models import Q
-from django.db.models.signals import post_save, pre_save
+from django.db import models, connection, close_old_connections, transaction
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.db.utils import IntegrityError
 from django.http import Http404
 
@@ -26,18 +27,25 @@ from taggit.models import Tag, TaggedItem
 from kitsune.flagit.models import FlaggedObject
 from kitsune.products.models import Product, Topic
 from kitsune.questions import config
-from kitsune.questions.managers import AnswerManager, QuestionManager, QuestionLocaleManager
+from kitsune.questions.counters import (
+    recent_question_counts, update_recent_question_counts)
+from kitsune.questions.managers import (
+    AnswerManager, QuestionManager, QuestionListEntryManager, QuestionLocaleManager)
 from kitsune.questions.signals import tag_added
-from kitsune.questions.tasks import update_question_votes, update_answer_pages, escalate_question
+from kitsune.questions.tasks import (
+    update_question_votes, update_answer_pages, escalate_question,
+    update_related_content)
 from kitsune.search.es_utils import UnindexMeBro, ES_EXCEPTIONS
 from kitsune.search.models import (
     SearchMappingType, SearchMixin, register_for_indexing,
     register_mapping_type)
-from kitsune.search.tasks import index_task
+from kitsune.search.tasks import update_fields_task
 from kitsune.sumo.templatetags.jinja_helpers import urlparams
 from kitsune.sumo.models import ModelBase, LocaleField
+from kitsune.sumo.redis_utils import RedisError
 from kitsune.sumo.templatetags.jinja_helpers import wiki_to_html
 from kitsune.sumo.urlresolvers import reverse, split_path
+from kitsune.sumo.utils import chunked, touch_modified_time
 from kitsune.tags.models import BigVocabTaggableMixin
 from kitsune.tags.utils import add_existing_tag
 from kitsune.upload.models import ImageAttachment
@@ -98,7 +106,10 @@ class Question(ModelBase, BigVocabTaggableMixin, SearchMixin):
 
     html_cache_key = u'question:html:%s'
     tags_cache_key = u'question:tags:%s'
+    related_cache_key = u'questions_question:related:%s'
+    related_lock_key = u'questions_question:related:lock:%s'
     contributors_cache_key = u'question:contributors:%s'
+    page_modified_key = u'question:page:modified:%s'
 
     objects = QuestionManager()
 
@@ -130,13 +141,44 @@ class Question(ModelBase, BigVocabTaggableMixin, SearchMixin):
 
     @property
     def content_parsed(self):
+        if getattr(self, '_content_html', None) is not None:
+            return self._content_html
         return _content_parsed(self, self.locale)
 
+    @classmethod
+    def prefetch_content_parsed(cls, questions):
+        """Gets the rendered content of many questions at once.
+
+        This does one cache get_many and one set_many for whatever wasn't
+        cached, instead of a cache get per question.
+
+        """
+        questions = dict((cls.html_cache_key % q.id, q) for q in questions)
+        cached = cache.get_many(questions.keys())
+
+        rendered = {}
+        for key, question in questions.items():
+            html = cached.get(key)
+            if html is None:
+                html = wiki_to_html(question.content, question.locale)
+                rendered[key] = html
+            question._content_html = html
+
+        if rendered:
+            cache.set_many(rendered, CACHE_TIMEOUT)
+
     def clear_cached_html(self):
         cache.delete(self.html_cache_key % self.id)
+        self._content_html = None
+        self.touch_page()
 
     def clear_cached_tags(self):
         cache.delete(self.tags_cache_key % self.id)
+        self.touch_page()
+
+    def touch_page(self):
+        """Marks the question page as modified for conditional GETs."""
+        touch_modified_time(self.page_modified_key % self.id)
 
     def clear_cached_contributors(self):
         cache.delete(self.contributors_cache_key % self.id)
@@ -413,6 +455,27 @@ class Question(ModelBase, BigVocabTaggableMixin, SearchMixin):
             qs = qs.filter(extra_filter)
         return qs.count()
 
+    @classmethod
+    def recent_counts(cls, locales, products=None):
+        """Returns the (asked, unanswered) counts for the last 24 hours.
+
+        These come from the rolling counters in redis, or from the db if
+        redis is unavailable.
+
+        """
+        try:
+            return recent_question_counts(
+                locales, [p.id for p in products] if products else None)
+        except RedisError as e:
+            statsd.incr('redis.error')
+            log.error('Redis error: %s' % e)
+
+        extra_filter = Q(locale__in=locales)
+        if products:
+            extra_filter &= Q(product__in=products)
+        return (cls.recent_asked_count(extra_filter),
+                cls.recent_unanswered_count(extra_filter))
+
     @classmethod
     def from_url(cls, url, id_only=False):
         """Returns the question that the URL represents.
@@ -493,84 +556,107 @@ class Question(ModelBase, BigVocabTaggableMixin, SearchMixin):
     @property
     def related_documents(self):
         """Return documents that are 'morelikethis' one"""
-        if not self.product:
-            return []
-
-        # First try to get the results from the cache
-        key = 'questions_question:related_docs:%s' % self.id
-        documents = cache.get(key)
-        if documents is not None:
-            statsd.incr('questions.related_documents.cache.hit')
-            log.debug('Getting MLT documents for {question} from cache.'
-                      .format(question=repr(self)))
-            return documents
-
-        try:
-            statsd.incr('questions.related_documents.cache.miss')
-            s = Document.get_mapping_type().search()
-            documents = (
-                s.values_dict('id', 'document_title', 'url')
-                .filter(document_locale=self.locale,
-                        document_is_archived=False,
-                        document_category__in=settings.IA_DEFAULT_CATEGORIES,
-                        product__in=[self.product.slug])
-                .query(__mlt={
-                    'fields': ['document_title', 'document_summary',
-                               'document_content'],
-                    'like_text': self.title,
-                    'min_term_freq': 1,
-                    'min_doc_freq': 1})
-                [:3])
-            documents = list(documents)
-            cache.add(key, documents)
-        except ES_EXCEPTIONS:
-            statsd.incr('questions.related_documents.esexception')
-            log.exception('ES MLT related_documents')
-            documents = []
-
-        return documents
+        return self.related_content()['documents']
 
     @property
     def related_questions(self):
         """Return questions that are 'morelikethis' one"""
-        if not self.product:
-            return []
+        return self.related_content()['questions']
 
-        # First try to get the results from the cache
-        key = 'questions_question:related_questions:%s' % self.id
-        questions = cache.get(key)
-        if questions is not None:
-            statsd.incr('questions.related_questions.cache.hit')
-            log.debug('Getting MLT questions for {question} from cache.'
-                      .format(question=repr(self)))
-            return questions
+    def related_content(self):
+        """Returns the related documents and questions.
 
-        try:
-            statsd.incr('questions.related_questions.cache.miss')
-            max_age = settings.SEARCH_DEFAULT_MAX_QUESTION_AGE
-            start_date = int(time.time()) - max_age
+        Once cached results go stale, they're still served while a task
+        refreshes them, so only a question without any cached results
+        waits on ES.
 
-            s = self.get_mapping_type().search()
-            questions = (
-                s.values_dict('id', 'question_title', 'url')
-                .filter(question_locale=self.locale,
-                        product__in=[self.product.slug],
-                        question_has_helpful=True,
-                        created__gte=start_date)
-                .query(__mlt={
-                    'fields': ['question_title', 'question_content'],
-                    'like_text': self.title,
-                    'min_term_freq': 1,
-                    'min_doc_freq': 1})
-                [:3])
-            questions = list(questions)
-            cache.add(key, questions)
-        except ES_EXCEPTIONS:
-            statsd.incr('questions.related_questions.esexception')
-            log.exception('ES MLT related_questions')
-            questions = []
+        """
+        if not self.product_id:
+            return {'documents': [], 'questions': []}
+
+        if getattr(self, '_related', None) is not None:
+            return self._related
+
+        related = cache.get(self.related_cache_key % self.id)
+        if related is None:
+            statsd.incr('questions.related.cache.miss')
+            related = self.fetch_related_content()
+        elif related['fresh_until'] < time.time():
+            statsd.incr('questions.related.cache.stale')
+            lock_key = self.related_lock_key % self.id
+            if cache.add(lock_key, 1, config.RELATED_REFRESH_LOCK_TIMEOUT):
+                update_related_content.delay(self.id)
+        else:
+            statsd.incr('questions.related.cache.hit')
 
-        return questions
+        self._related = related
+        return related
+
+    def fetch_related_content(self):
+        """Gets the related documents and questions from ES and caches them.
+
+        Both more like this queries go in a single multi-search.
+
+        """
+        related = {'documents': [], 'questions': []}
+        if not self.product:
+            return related
+
+        max_age = settings.SEARCH_DEFAULT_MAX_QUESTION_AGE
+        start_date = int(time.time()) - max_age
+
+        documents = (
+            Document.get_mapping_type().search()
+            .values_dict('id', 'document_title', 'url')
+            .filter(document_locale=self.locale,
+                    document_is_archived=False,
+                    document_category__in=settings.IA_DEFAULT_CATEGORIES,
+                    product__in=[self.product.slug])
+            .query(__mlt={
+                'fields': ['document_title', 'document_summary',
+                           'document_content'],
+                'like_text': self.title,
+                'min_term_freq': 1,
+                'min_doc_freq': 1})
+            [:3])
+        questions = (
+            self.get_mapping_type().search()
+            .values_dict('id', 'question_title', 'url')
+            .filter(question_locale=self.locale,
+                    product__in=[self.product.slug],
+                    question_has_helpful=True,
+                    created__gte=start_date)
+            .query(__mlt={
+                'fields': ['question_title', 'question_content'],
+                'like_text': self.title,
+                'min_term_freq': 1,
+                'min_doc_freq': 1})
+            [:3])
+
+        body = []
+        for s in (documents, questions):
+            body.append({'index': s.get_indexes(), 'type': s.get_doctypes()})
+            body.append(s.build_search())
+
+        try:
+            responses = documents.get_es().msearch(body)['responses']
+        except ES_EXCEPTIONS:
+            statsd.incr('questions.related.esexception')
+            log.exception('ES MLT related content')
+            return related
+
+        for name, response in zip(('documents', 'questions'), responses):
+            if 'error' in response:
+                statsd.incr('questions.related.esexception')
+                log.error('ES MLT related %s: %s' % (name, response['error']))
+                return related
+            related[name] = [hit.get('fields', {})
+                             for hit in response['hits']['hits']]
+
+        related['fresh_until'] = time.time() + config.RELATED_FRESH_TIMEOUT
+        cache.set(self.related_cache_key % self.id, related,
+                  config.RELATED_CACHE_TIMEOUT)
+        return related
 
     # Permissions
 
@@ -737,85 +823,155 @@ class QuestionMappingType(SearchMappingType):
             }
         }
 
+    # Note: Need to keep this in sync with
+    # tasks.update_question_vote_chunk.
+    _extract_fields = [
+        'id', 'title', 'content', 'num_answers', 'solution_id',
+        'is_locked', 'is_archived', 'created', 'updated',
+        'num_votes_past_week', 'locale', 'product_id', 'topic_id',
+        'is_spam']
+
     @classmethod
     def extract_document(cls, obj_id, obj=None):
         """Extracts indexable attributes from a Question and its answers."""
-        fields = ['id', 'title', 'content', 'num_answers', 'solution_id',
-                  'is_locked', 'is_archived', 'created', 'updated',
-                  'num_votes_past_week', 'locale', 'product_id', 'topic_id',
-                  'is_spam']
-        composed_fields = ['creator__username']
-        all_fields = fields + composed_fields
-
         if obj is None:
-            # Note: Need to keep this in sync with
-            # tasks.update_question_vote_chunk.
             model = cls.get_model()
-            obj = model.objects.values(*all_fields).get(pk=obj_id)
+            obj = (model.objects.values(*cls._extract_fields +
+                                        ['creator__username'])
+                                .get(pk=obj_id))
         else:
             fixed_obj = dict([(field, getattr(obj, field))
-                              for field in fields])
+                              for field in cls._extract_fields])
             fixed_obj['creator__username'] = obj.creator.username
             obj = fixed_obj
 
         if obj['is_spam']:
             raise UnindexMeBro()
 
-        d = {}
-        d['id'] = obj['id']
-        d['model'] = cls.get_mapping_type_name()
-
-        # We do this because get_absolute_url is an instance method
-        # and we don't want to create an instance because it's a DB
-        # hit and expensive. So we do it by hand. get_absolute_url
-        # doesn't change much, so this is probably ok.
-        d['url'] = reverse('questions.details',
-                           kwargs={'question_id': obj['id']})
+        return cls._documents_from_values([obj])[0]
 
-        d['indexed_on'] = int(time.time())
-
-        d['created'] = int(time.mktime(obj['created'].timetuple()))
-        d['updated'] = int(time.mktime(obj['updated'].timetuple()))
-
-        topics = Topic.objects.filter(id=obj['topic_id'])
-        products = Product.objects.filter(id=obj['product_id'])
-        d['topic'] = [t.slug for t in topics]
-        d['product'] = [p.slug for p in products]
+    @classmethod
+    def extract_documents(cls, ids):
+        """Extracts indexable attributes for a batch of Questions.
 
-        d['question_title'] = obj['title']
-        d['question_content'] = obj['content']
-        d['question_num_answers'] = obj['num_answers']
-        d['question_is_solved'] = bool(obj['solution_id'])
-        d['question_is_locked'] = obj['is_locked']
-        d['question_is_archived'] = obj['is_archived']
-        d['question_has_answers'] = bool(obj['num_answers'])
+        This does a fixed number of queries regardless of how many ids
+        there are.
 
-        d['question_creator'] = obj['creator__username']
-        d['question_num_votes'] = (QuestionVote.objects
-                                               .filter(question=obj['id'])
-                                               .count())
-        d['question_num_votes_past_week'] = obj['num_votes_past_week']
+        """
+        model = cls.get_model()
+        objs = list(model.objects.filter(pk__in=ids)
+                                 .values(*cls._extract_fields +
+                                         ['creator__username']))
 
-        d['question_tag'] = list(TaggedItem.tags_for(
-            Question, Question(pk=obj_id)).values_list('name', flat=True))
+        ret = [(obj['id'], None) for obj in objs if obj['is_spam']]
+        objs = [obj for obj in objs if not obj['is_spam']]
+        ret.extend(zip([obj['id'] for obj in objs],
+                       cls._documents_from_values(objs)))
+        return ret
 
-        d['question_locale'] = obj['locale']
+    @classmethod
+    def _documents_from_values(cls, objs):
+        """Builds documents from a list of Question values dicts.
 
-        answer_values = list(Answer.objects
-                                   .filter(question=obj_id, is_spam=False)
-                                   .values_list('content',
-                                                'creator__username'))
+        All the related data is pulled in with one query per kind of
+        thing for the whole list.
 
-        d['question_answer_content'] = [a[0] for a in answer_values]
-        d['question_answer_creator'] = list(set(a[1] for a in answer_values))
+        """
+        if not objs:
+            return []
 
-        if not answer_values:
-            d['question_has_helpful'] = False
-        else:
-            d['question_has_helpful'] = Answer.objects.filter(
-                question=obj_id).filter(votes__helpful=True).exists()
+        ids = [obj['id'] for obj in objs]
+
+        topics = dict(Topic.objects
+                           .filter(id__in=set(obj['topic_id'] for obj in objs))
+                           .values_list('id', 'slug'))
+        products = dict(Product.objects
+                               .filter(id__in=set(obj['product_id']
+                                                  for obj in objs))
+                               .values_list('id', 'slug'))
+
+        num_votes = dict(QuestionVote.objects
+                                     .filter(question__in=ids)
+                                     .values('question')
+                                     .order_by()
+                                     .annotate(num=Count('id'))
+                                     .values_list('question', 'num'))
+
+        tags = defaultdict(list)
+        tagged = (TaggedItem.objects
+                            .filter(content_type=ContentType.objects
+                                                            .get_for_model(Question),
+                                    object_id__in=ids)
+                            .values_list('object_id', 'tag__name'))
+        for question_id, tag_name in tagged:
+            tags[question_id].append(tag_name)
+
+        answers = defaultdict(list)
+        answer_values = (Answer.objects
+                               .filter(question__in=ids, is_spam=False)
+                               .values_list('question_id', 'content',
+                                            'creator__username'))
+        for question_id, content, creator in answer_values:
+            answers[question_id].append((content, creator))
+
+        has_helpful = set(Answer.objects
+                                .filter(question__in=ids,
+                                        votes__helpful=True)
+                                .values_list('question_id', flat=True)
+                                .order_by()
+                                .distinct())
+
+        now = int(time.time())
+        documents = []
+        for obj in objs:
+            d = {}
+            d['id'] = obj['id']
+            d['model'] = cls.get_mapping_type_name()
+
+            # We do this because get_absolute_url is an instance method
+            # and we don't want to create an instance because it's a DB
+            # hit and expensive. So we do it by hand. get_absolute_url
+            # doesn't change much, so this is probably ok.
+            d['url'] = reverse('questions.details',
+                               kwargs={'question_id': obj['id']})
+
+            d['indexed_on'] = now
+
+            d['created'] = int(time.mktime(obj['created'].timetuple()))
+            d['updated'] = int(time.mktime(obj['updated'].timetuple()))
+
+            d['topic'] = ([topics[obj['topic_id']]]
+                          if obj['topic_id'] in topics else [])
+            d['product'] = ([products[obj['product_id']]]
+                            if obj['product_id'] in products else [])
+
+            d['question_title'] = obj['title']
+            d['question_content'] = obj['content']
+            d['question_num_answers'] = obj['num_answers']
+            d['question_is_solved'] = bool(obj['solution_id'])
+            d['question_is_locked'] = obj['is_locked']
+            d['question_is_archived'] = obj['is_archived']
+            d['question_has_answers'] = bool(obj['num_answers'])
+
+            d['question_creator'] = obj['creator__username']
+            d['question_num_votes'] = num_votes.get(obj['id'], 0)
+            d['question_num_votes_past_week'] = obj['num_votes_past_week']
+
+            d['question_tag'] = tags[obj['id']]
+
+            d['question_locale'] = obj['locale']
+
+            answer_values = answers[obj['id']]
+            d['question_answer_content'] = [a[0] for a in answer_values]
+            d['question_answer_creator'] = list(
+                set(a[1] for a in answer_values))
+
+            d['question_has_helpful'] = (bool(answer_values) and
+                                         obj['id'] in has_helpful)
+
+            documents.append(d)
 
-        return d
+        return documents
 
 
 register_for_indexing('questions', Question)
@@ -847,6 +1003,10 @@ class QuestionMetaData(ModelBase):
         return u'%s: %s' % (self.name, self.value[:50])
 
 
+# How many visit rows to write per query.
+VISITS_BATCH_SIZE = 1000
+
+
 class QuestionVisits(ModelBase):
     """Web stats for questions."""
     question = models.ForeignKey(Question, unique=True)
@@ -863,31 +1023,35 @@ class QuestionVisits(ModelBase):
             # them out at 5 minutes and the GA calls take forever.
             close_old_connections()
 
-            for question_id, visits in counts.iteritems():
-                # We are trying to minimize db calls here. Let's try to update
-                # first, that will be the common case.
-                num = cls.objects.filter(
-                    question_id=question_id).update(visits=visits)
-
-                # If we were able to update, we are done.
-                if num > 0:
+            # Upsert the visits, a batch at a time, skipping questions
+            # that don't exist anymore.
+            cursor = connection.cursor()
+            for batch in chunked(counts.items(), VISITS_BATCH_SIZE):
+                existing = set(Question.objects.filter(
+                    pk__in=[question_id for question_id, _ in batch])
+                    .values_list('id', flat=True))
+                rows = [(question_id, visits) for question_id, visits in batch
+                        if question_id in existing]
+                if not rows:
                     continue
-                # If it doesn't exist yet, create it.
                 try:
-                    # For some reason unbeknowest to me,
-                    # IntegrityError doesn't get kicked up in the
-                    # QuestionVisits tests when running the tests with
-                    # a clean db. So to deal with that, we explicitly
-                    # check the db to see if the question exists.
-                    # This happens with Django 1.4.6 and South
-                    # 0.8.2. If we update either, we might want to see
-                    # if this is still a problem.
-                    Question.objects.get(pk=question_id)
-                    cls.objects.create(
-                        question_id=question_id, visits=visits)
-                except (Question.DoesNotExist, IntegrityError):
-                    # The question doesn't exist anymore, move on.
-                    continue
+                    cursor.execute(
+                        'INSERT INTO `questions_questionvisits` '
+                        '    (`question_id`, `visits`) VALUES ' +
+                        ', '.join(['(%s, %s)'] * len(rows)) +
+                        '    ON DUPLICATE KEY UPDATE `visits` = VALUES(`visits`)',
+                        [value for row in rows for value in row])
+                except IntegrityError:
+                    # A question got deleted in the meantime. We'll get
+                    # these next time.
+                    log.warning('Skipped a batch of question visits.')
+
+            # The question list sorts by visits too.
+            cursor.execute(
+                'UPDATE `questions_questionlistentry` AS `e` '
+                '    JOIN `questions_questionvisits` AS `v` '
+                '    ON `v`.`question_id` = `e`.`question_id` '
+                '    SET `e`.`num_visits` = `v`.`visits`')
         else:
             log.warning('Google Analytics returned no interesting data,'
                         ' so I kept what I had.')
@@ -905,6 +1069,116 @@ class QuestionLocale(ModelBase):
         verbose_name = 'AAQ enabled locale'
 
 
+class QuestionListEntry(ModelBase):
+    """A question as the question list sees it.
+
+    This denormalizes everything question_list filters and sorts on into
+    one row per question, so listing is a range scan over one table
+    instead of joins over answers, users and tags. The rows are kept up
+    to date with ``refresh`` whenever a question, its answers or its tags
+    change.
+
+    """
+    question = models.OneToOneField(Question, primary_key=True,
+                                    related_name='list_entry')
+    locale = LocaleField()
+    product = models.ForeignKey(Product, null=True)
+    topic = models.ForeignKey(Topic, null=True)
+    creator = models.ForeignKey(User)
+    creator_is_active = models.BooleanField(default=True)
+    is_spam = models.BooleanField(default=False)
+
+    # One of 'needs-attention', 'responded' or 'done', like the
+    # QuestionManager filters, ignoring how long ago it was updated.
+    status = models.CharField(max_length=16)
+    is_solved = models.BooleanField(default=False)
+    is_locked = models.BooleanField(default=False)
+    has_answers = models.BooleanField(default=False)
+    last_answer_by_creator = models.BooleanField(default=False)
+    needs_info = models.BooleanField(default=False)
+    is_escalated = models.BooleanField(default=False)
+    # Tag names, like u'|tag one|tag two|'.
+    tags = models.TextField(blank=True)
+
+    created = models.DateTimeField()
+    updated = models.DateTimeField()
+    num_answers = models.IntegerField(default=0)
+    num_votes_past_week = models.PositiveIntegerField(default=0)
+    num_visits = models.IntegerField(default=0)
+
+    objects = QuestionListEntryManager()
+
+    class Meta:
+        index_together = [('locale', 'status', 'updated'),
+                          ('product', 'locale', 'status', 'updated')]
+
+    @classmethod
+    def refresh(cls, question_ids):
+        """Rebuilds the entries of these questions.
+
+        This does a fixed number of queries regardless of how many
+        questions there are.
+
+        """
+        question_ids = list(question_ids)
+        if not question_ids:
+            return
+
+        questions = Question.objects.filter(pk__in=question_ids).values(
+            'id', 'locale', 'product_id', 'topic_id', 'creator_id',
+            'creator__is_active', 'is_spam', 'solution_id', 'is_locked',
+            'last_answer_id', 'last_answer__creator_id', 'created',
+            'updated', 'num_answers', 'num_votes_past_week',
+            'questionvisits__visits')
+
+        tags = defaultdict(list)
+        for question_id, name, slug in (
+                TaggedItem.objects
+                .filter(content_type=ContentType.objects.get_for_model(Question),
+                        object_id__in=question_ids)
+                .values_list('object_id', 'tag__name', 'tag__slug')):
+            tags[question_id].append((name, slug))
+
+        entries = []
+        for q in questions:
+            last_answer_by_creator = (
+                q['last_answer__creator_id'] == q['creator_id'])
+            if q['solution_id'] or q['is_locked']:
+                status = 'done'
+            elif q['last_answer_id'] and not last_answer_by_creator:
+                status = 'responded'
+            else:
+                status = 'needs-attention'
+
+            names = [name for name, slug in tags[q['id']]]
+            entries.append(cls(
+                question_id=q['id'],
+                locale=q['locale'],
+                product_id=q['product_id'],
+                topic_id=q['topic_id'],
+                creator_id=q['creator_id'],
+                creator_is_active=q['creator__is_active'],
+                is_spam=q['is_spam'],
+                status=status,
+                is_solved=bool(q['solution_id']),
+                is_locked=q['is_locked'],
+                has_answers=bool(q['last_answer_id']),
+                last_answer_by_creator=last_answer_by_creator,
+                needs_info=config.NEEDS_INFO_TAG_NAME in [
+                    slug for name, slug in tags[q['id']]],
+                is_escalated=config.ESCALATE_TAG_NAME in names,
+                tags=u'|%s|' % u'|'.join(names) if names else u'',
+                created=q['created'],
+                updated=q['updated'],
+                num_answers=q['num_answers'],
+                num_votes_past_week=q['num_votes_past_week'],
+                num_visits=q['questionvisits__visits'] or 0))
+
+        with transaction.atomic():
+            cls.objects.filter(question__in=question_ids).delete()
+            cls.objects.bulk_create(entries)
+
+
 class Answer(ModelBase, SearchMixin):
     """An answer to a support question."""
     question = models.ForeignKey('Question', related_name='answers')
@@ -1179,68 +1453,102 @@ class AnswerMetricsMappingType(SearchMappingType):
             }
         }
 
+    _extract_fields = ['id', 'created', 'creator_id', 'question_id']
+    _extract_composed_fields = [
+        'question__locale',
+        'question__solution_id',
+        'question__creator_id',
+        'question__product_id']
+
     @classmethod
     def extract_document(cls, obj_id, obj=None):
         """Extracts indexable attributes from an Answer."""
-        fields = ['id', 'created', 'creator_id', 'question_id']
-        composed_fields = [
-            'question__locale',
-            'question__solution_id',
-            'question__creator_id',
-            'question__product_id']
-        all_fields = fields + composed_fields
-
         if obj is None:
             model = cls.get_model()
-            obj_dict = model.objects.values(*all_fields).get(pk=obj_id)
+            obj_dict = model.objects.values(
+                *cls._extract_fields + cls._extract_composed_fields).get(
+                    pk=obj_id)
         else:
             obj_dict = dict([(field, getattr(obj, field))
-                             for field in fields])
+                             for field in cls._extract_fields])
             obj_dict['question__locale'] = obj.question.locale
             obj_dict['question__solution_id'] = obj.question.solution_id
             obj_dict['question__creator_id'] = obj.question.creator_id
             obj_dict['question__product_id'] = obj.question.product_id
 
-        d = {}
-        d['id'] = obj_dict['id']
-        d['model'] = cls.get_mapping_type_name()
-
-        # We do this because get_absolute_url is an instance method
-        # and we don't want to create an instance because it's a DB
-        # hit and expensive. So we do it by hand. get_absolute_url
-        # doesn't change much, so this is probably ok.
-        url = reverse('questions.details',
-                      kwargs={'question_id': obj_dict['question_id']})
-        d['url'] = urlparams(url, hash='answer-%s' % obj_dict['id'])
-
-        d['indexed_on'] = int(time.time())
+        return cls._documents_from_values([obj_dict])[0]
 
-        d['created'] = obj_dict['created']
-
-        d['locale'] = obj_dict['question__locale']
-        d['is_solution'] = (
-            obj_dict['id'] == obj_dict['question__solution_id'])
-        d['creator_id'] = obj_dict['creator_id']
-        d['by_asker'] = (
-            obj_dict['creator_id'] == obj_dict['question__creator_id'])
+    @classmethod
+    def extract_documents(cls, ids):
+        """Extracts indexable attributes for a batch of Answers."""
+        model = cls.get_model()
+        obj_dicts = list(model.objects.filter(pk__in=ids).values(
+            *cls._extract_fields + cls._extract_composed_fields))
+        return zip([obj_dict['id'] for obj_dict in obj_dicts],
+                   cls._documents_from_values(obj_dicts))
 
-        products = Product.objects.filter(id=obj_dict['question__product_id'])
-        d['product'] = [p.slug for p in products]
+    @classmethod
+    def _documents_from_values(cls, obj_dicts):
+        """Builds documents from a list of Answer values dicts."""
+        if not obj_dicts:
+            return []
 
-        related_votes = AnswerVote.objects.filter(answer_id=obj_dict['id'])
-        d['helpful_count'] = related_votes.filter(helpful=True).count()
-        d['unhelpful_count'] = related_votes.filter(helpful=False).count()
+        ids = [obj_dict['id'] for obj_dict in obj_dicts]
+
+        products = dict(Product.objects
+                               .filter(id__in=set(obj_dict['question__product_id']
+                                                  for obj_dict in obj_dicts))
+                               .values_list('id', 'slug'))
+
+        vote_counts = defaultdict(int)
+        votes = (AnswerVote.objects
+                           .filter(answer__in=ids)
+                           .values('answer', 'helpful')
+                           .order_by()
+                           .annotate(num=Count('id'))
+                           .values_list('answer', 'helpful', 'num'))
+        for answer_id, helpful, num in votes:
+            vote_counts[(answer_id, helpful)] = num
+
+        now = int(time.time())
+        documents = []
+        for obj_dict in obj_dicts:
+            d = {}
+            d['id'] = obj_dict['id']
+            d['model'] = cls.get_mapping_type_name()
+
+            # We do this because get_absolute_url is an instance method
+            # and we don't want to create an instance because it's a DB
+            # hit and expensive. So we do it by hand. get_absolute_url
+            # doesn't change much, so this is probably ok.
+            url = reverse('questions.details',
+                          kwargs={'question_id': obj_dict['question_id']})
+            d['url'] = urlparams(url, hash='answer-%s' % obj_dict['id'])
+
+            d['indexed_on'] = now
+
+            d['created'] = obj_dict['created']
+
+            d['locale'] = obj_dict['question__locale']
+            d['is_solution'] = (
+                obj_dict['id'] == obj_dict['question__solution_id'])
+            d['creator_id'] = obj_dict['creator_id']
+            d['by_asker'] = (
+                obj_dict['creator_id'] == obj_dict['question__creator_id'])
+
+            product_id = obj_dict['question__product_id']
+            d['product'] = ([products[product_id]]
+                            if product_id in products else [])
+
+            d['helpful_count'] = vote_counts[(obj_dict['id'], True)]
+            d['unhelpful_count'] = vote_counts[(obj_dict['id'], False)]
+
+            documents.append(d)
 
-        return d
+        return documents
 
 
 register_for_indexing('answers', Answer)
-# This below is needed to update the is_solution field on the answer.
-register_for_indexing(
-    'answers',
-    Question,
-    instance_to_indexee=(
-        lambda i: i.solution))
 
 
 register_for_indexing(
@@ -1249,12 +1557,18 @@ register_for_indexing(
 
 # This below is needed to update the is_solution field on the answer.
 def reindex_questions_answers(sender, instance, **kw):
-    """When a question is saved, we need to reindex it's answers.
+    """When a question is saved, we need to update its answers.
 
-    This is needed because the solution may have changed."""
-    if instance.id:
+    This is needed because the solution may have changed. Only the
+    is_solution field depends on the question, so that's all we
+    update."""
+    if instance.id and settings.ES_LIVE_INDEXING:
         answer_ids = instance.answers.all().values_list('id', flat=True)
-        index_task.delay(AnswerMetricsMappingType, list(answer_ids))
+        updates = dict(
+            (id_, {'is_solution': id_ == instance.solution_id})
+            for id_ in answer_ids)
+        if updates:
+            update_fields_task.delay(AnswerMetricsMappingType, updates)
 
 post_save.connect(
     reindex_questions_answers, sender=Question,
@@ -1282,6 +1596,76 @@ pre_save.connect(
     user_pre_save, sender=User, dispatch_uid='questions_user_pre_save')
 
 
+def update_recent_counts(sender, instance, **kw):
+    """Keeps the rolling counts of recent questions up to date."""
+    recent = datetime.now() - timedelta(hours=config.RECENT_COUNT_HOURS)
+    if kw.get('raw') or instance.created < recent:
+        return
+
+    if kw['signal'] is post_delete:
+        asked = unanswered = False
+    else:
+        asked = instance.creator.is_active
+        unanswered = (asked and not instance.num_answers and
+                      not instance.is_locked and not instance.is_archived)
+
+    try:
+        update_recent_question_counts(
+            instance.id, instance.locale, instance.product_id,
+            instance.created, asked, unanswered)
+    except RedisError as e:
+        statsd.incr('redis.error')
+        log.error('Redis error: %s' % e)
+
+post_save.connect(
+    update_recent_counts, sender=Question,
+    dispatch_uid='questions_save_recent_counts')
+post_delete.connect(
+    update_recent_counts, sender=Question,
+    dispatch_uid='questions_delete_recent_counts')
+
+
+def refresh_question_list_entry(sender, instance, **kw):
+    """Keeps the question list entry of a saved question up to date.
+
+    Saving an answer saves its question, so this covers answers too.
+
+    """
+    if not kw.get('raw'):
+        QuestionListEntry.refresh([instance.id])
+
+post_save.connect(
+    refresh_question_list_entry, sender=Question,
+    dispatch_uid='questions_refresh_list_entry')
+
+
+def refresh_question_list_tags(sender, instance, **kw):
+    """Keeps the tags in the question list entries up to date."""
+    question_type = ContentType.objects.get_for_model(Question)
+    if instance.content_type_id == question_type.id and not kw.get('raw'):
+        QuestionListEntry.refresh([instance.object_id])
+
+post_save.connect(
+    refresh_question_list_tags, sender=TaggedItem,
+    dispatch_uid='questions_taggeditem_save_list_entry')
+post_delete.connect(
+    refresh_question_list_tags, sender=TaggedItem,
+    dispatch_uid='questions_taggeditem_delete_list_entry')
+
+
+def user_post_save_question_list(sender, instance, **kw):
+    """Hides the questions of deactivated users from the question list."""
+    if not kw.get('raw'):
+        (QuestionListEntry.objects
+         .filter(creator=instance)
+         .exclude(creator_is_active=instance.is_active)
+         .update(creator_is_active=instance.is_active))
+
+post_save.connect(
+    user_post_save_question_list, sender=User,
+    dispatch_uid='questions_user_post_save_list_entry')
+
+
 class QuestionVote(ModelBase):
     """I have this problem too.
     Keeps track of users that have problem over time."""
@@ -1339,6 +1723,20 @@ def send_vote_update_task(**kwargs):
 post_save.connect(send_vote_update_task, sender=QuestionVote)
 
 
+def touch_question_page(sender, instance, **kwargs):
+    """Vote counts are on the question page, so it changes with them."""
+    if sender is AnswerVote:
+        question_id = instance.answer.question_id
+    else:
+        question_id = instance.question_id
+    touch_modified_time(Question.page_modified_key % question_id)
+
+post_save.connect(touch_question_page, sender=QuestionVote,
+                  dispatch_uid='questionvote_touch_page')
+post_save.connect(touch_question_page, sender=AnswerVote,
+                  dispatch_uid='answervote_touch_page')
+
+
 _tenths_version_pattern = re.compile(r'(\d+\.\d+).*')
 
 
@@ -1396,3 +1794,17 @@ def add_action_for_new_answer(sender, instance, created, **kwargs):
             verb='answered',
             action_object=instance,
             target=instance.question)
+
+
+@receiver(post_save, sender=Question, dispatch_uid='question_create_related')
+@receiver(post_save, sender=Answer, dispatch_uid='answer_create_related')
+def precompute_related_content(sender, instance, created, **kwargs):
+    """Fills the related content cache of new and newly answered questions.
+
+    These are the questions people are about to look at, so this saves
+    them from waiting on ES.
+
+    """
+    if created and not kwargs.get('raw') and settings.ES_LIVE_INDEXING:
+        question = instance if sender is Question else instance.question
+        update_related_content.delay(question.id)
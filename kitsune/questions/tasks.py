@@ -4,6 +4,7 @@ from datetime import date
 
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.db import connection, transaction
 
 # NOTE: This import is just so _fire_task gets registered with celery.
@@ -69,6 +70,10 @@ def update_question_vote_chunk(data):
     if not transaction.get_connection().in_atomic_block:
         transaction.commit()
 
+    # The update skipped the post_save signals, so bring the question
+    # list entries up to date by hand.
+    refresh_question_list_chunk(data)
+
     # Next we update our index with the changes we made directly in
     # the db.
     if data and settings.ES_LIVE_INDEXING:
@@ -86,20 +91,12 @@ def update_question_vote_chunk(data):
         id_to_num = dict(cursor.fetchall())
 
         try:
-            # Fetch all the documents we need to update.
+            # Update just that field in the index instead of
+            # reindexing the whole documents.
             from kitsune.questions.models import QuestionMappingType
-            from kitsune.search import es_utils
-            es_docs = es_utils.get_documents(QuestionMappingType, data)
-
-            # For each document, update the data and stick it back in the
-            # index.
-            for doc in es_docs:
-                # Note: Need to keep this in sync with
-                # Question.extract_document.
-                num = id_to_num[int(doc[u'id'])]
-                doc[u'question_num_votes_past_week'] = num
-
-                QuestionMappingType.index(doc, id_=doc['id'])
+            QuestionMappingType.bulk_update_fields(dict(
+                (id_, {'question_num_votes_past_week': num})
+                for id_, num in id_to_num.items()))
         except ES_EXCEPTIONS:
             # Something happened with ES, so let's push index updating
             # into an index_task which retries when it fails because
@@ -107,6 +104,32 @@ def update_question_vote_chunk(data):
             index_task.delay(QuestionMappingType, id_to_num.keys())
 
 
+@task(rate_limit='4/s')
+@timeit
+def refresh_question_list_chunk(data):
+    """Rebuild the question list entries for a number of questions."""
+    from kitsune.questions.models import QuestionListEntry
+
+    log.info('Refreshing list entries for %s questions.' % len(data))
+    QuestionListEntry.refresh(data)
+
+
+@task()
+@timeit
+def update_related_content(question_id):
+    """Refresh the cached related documents and questions of a question."""
+    from kitsune.questions.models import Question
+
+    try:
+        question = Question.objects.get(id=question_id)
+    except Question.DoesNotExist:
+        log.info('Question id=%s deleted before task.' % question_id)
+        return
+
+    question.fetch_related_content()
+    cache.delete(question.related_lock_key % question_id)
+
+
 @task(rate_limit='4/m')
 @timeit
 def update_answer_pages(question):
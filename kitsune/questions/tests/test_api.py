@@ -4,6 +4,8 @@ from datetime import datetime, timedelta
 import mock
 import actstream.actions
 from actstream.models import Follow
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from nose.tools import eq_, ok_, raises
 from rest_framework.test import APIClient
 from rest_framework.exceptions import APIException
@@ -233,6 +235,37 @@ class TestQuestionViewSet(TestCase):
         q = Question.objects.get(id=q.id)
         eq_(q.solution, a)
 
+    def test_list_fixed_queries(self):
+        """The number of queries doesn't grow with the number of questions."""
+        def make_question():
+            q = QuestionFactory(tags=['foo'], metadata={'os': 'linux'})
+            AnswerFactory(question=q)
+            q.solution = AnswerFactory(question=q)
+            q.save()
+            QuestionVoteFactory(question=q)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.get(reverse('question-list'))
+            eq_(200, res.status_code)
+            return len(queries)
+
+        make_question()
+        one = count_queries()
+
+        for i in range(4):
+            make_question()
+        five = count_queries()
+
+        eq_(one, five)
+
+    def test_list_num_votes(self):
+        q = QuestionFactory()
+        QuestionVoteFactory(question=q)
+        QuestionVoteFactory(question=q)
+        res = self.client.get(reverse('question-list'))
+        eq_(2, res.data['results'][0]['num_votes'])
+
     def test_filter_is_taken_true(self):
         q1 = QuestionFactory()
         q2 = QuestionFactory()
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import mock
+from nose import SkipTest
+from nose.tools import eq_
+
+from kitsune.products.tests import ProductFactory
+from kitsune.questions import cron, models
+from kitsune.questions.counters import recent_question_counts
+from kitsune.questions.cron import reconcile_recent_counts
+from kitsune.questions.models import Question
+from kitsune.questions.tests import AnswerFactory, QuestionFactory
+from kitsune.sumo.redis_utils import redis_client, RedisError
+from kitsune.sumo.tests import TestCase
+
+
+class RecentQuestionCountsTests(TestCase):
+    def setUp(self):
+        super(RecentQuestionCountsTests, self).setUp()
+        try:
+            self.redis = redis_client('default')
+            self.redis.flushdb()
+        except RedisError:
+            raise SkipTest
+
+    def tearDown(self):
+        try:
+            self.redis.flushdb()
+        except (KeyError, AttributeError):
+            raise SkipTest
+        super(RecentQuestionCountsTests, self).tearDown()
+
+    def test_counts(self):
+        now = datetime.now()
+        QuestionFactory(created=now)
+        QuestionFactory(created=now - timedelta(hours=12), is_locked=True)
+        q = QuestionFactory(created=now - timedelta(hours=2))
+        AnswerFactory(question=q)
+        QuestionFactory(created=now - timedelta(hours=25))
+        QuestionFactory(created=now, locale='pt-BR')
+
+        eq_((3, 1), recent_question_counts(['en-US']))
+        eq_((4, 2), recent_question_counts(['en-US', 'pt-BR']))
+
+    def test_counted_once(self):
+        q = QuestionFactory()
+        q.save()
+        q.save()
+        eq_((1, 1), recent_question_counts(['en-US']))
+
+        AnswerFactory(question=q)
+        AnswerFactory(question=q)
+        eq_((1, 0), recent_question_counts(['en-US']))
+
+    def test_products(self):
+        p1 = ProductFactory()
+        p2 = ProductFactory()
+        QuestionFactory(product=p1)
+        q = QuestionFactory(product=p1)
+        eq_((2, 2), recent_question_counts(['en-US'], [p1.id]))
+        eq_((0, 0), recent_question_counts(['en-US'], [p2.id]))
+
+        q.product = p2
+        q.save()
+        eq_((1, 1), recent_question_counts(['en-US'], [p1.id]))
+        eq_((1, 1), recent_question_counts(['en-US'], [p2.id]))
+        eq_((2, 2), recent_question_counts(['en-US'], [p1.id, p2.id]))
+        eq_((2, 2), recent_question_counts(['en-US']))
+
+    def test_delete(self):
+        q = QuestionFactory()
+        q.delete()
+        eq_((0, 0), recent_question_counts(['en-US']))
+
+    def test_reconcile(self):
+        QuestionFactory()
+        q = QuestionFactory()
+        AnswerFactory(question=q)
+        q = QuestionFactory()
+        q.creator.is_active = False
+        q.creator.save()
+        eq_((3, 2), recent_question_counts(['en-US']))
+
+        reconcile_recent_counts()
+        eq_((2, 1), recent_question_counts(['en-US']))
+
+        self.redis.flushdb()
+        reconcile_recent_counts()
+        eq_((2, 1), recent_question_counts(['en-US']))
+
+    @mock.patch.object(models, 'recent_question_counts')
+    def test_db_fallback(self, recent_question_counts):
+        recent_question_counts.side_effect = RedisError
+        QuestionFactory()
+        q = QuestionFactory()
+        AnswerFactory(question=q)
+        eq_((2, 1), Question.recent_counts(['en-US']))
+
+    @mock.patch.object(cron, 'reconcile_recent_question_counts')
+    def test_reconcile_redis_error(self, reconcile):
+        reconcile.side_effect = RedisError
+        QuestionFactory()
+        # The error gets logged rather than failing the cron.
+        reconcile_recent_counts()
+        assert reconcile.called
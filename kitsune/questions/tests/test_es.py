@@ -8,6 +8,7 @@ from kitsune.questions.models import (
     QuestionMappingType, AnswerMetricsMappingType)
 from kitsune.questions.tests import (
     QuestionFactory, AnswerFactory, AnswerVoteFactory, QuestionVoteFactory)
+from kitsune.search.tests import ExtractDocumentsTestCase
 from kitsune.search.tests.test_es import ElasticTestCase
 from kitsune.sumo.tests import LocalizingClient
 from kitsune.sumo.urlresolvers import reverse
@@ -210,6 +211,14 @@ class AnswerMetricsTests(ElasticTestCase):
         data = AnswerMetricsMappingType.search()[0]
         eq_(data['is_solution'], True)
 
+        # Unmark as solution and verify
+        q.solution = None
+        q.save()
+
+        self.refresh()
+        data = AnswerMetricsMappingType.search()[0]
+        eq_(data['is_solution'], False)
+
         # Make the answer creator to be the question creator and verify.
         a.creator = q.creator
         a.save()
@@ -219,6 +228,33 @@ class AnswerMetricsTests(ElasticTestCase):
         eq_(data['by_asker'], True)
 
 
+class ExtractDocumentsTests(ExtractDocumentsTestCase):
+    def test_questions_match_extract_document(self):
+        p = ProductFactory()
+        q1 = QuestionFactory(product=p, tags=[u'foo', u'bar'])
+        a = AnswerFactory(question=q1)
+        AnswerVoteFactory(answer=a, helpful=True)
+        QuestionVoteFactory(question=q1)
+        q2 = QuestionFactory()
+        spam = QuestionFactory(is_spam=True)
+
+        extracted = self.assert_extract_documents(
+            QuestionMappingType, [q1.id, q2.id], 7, skipped=[spam.id])
+        eq_(extracted[q1.id]['question_has_helpful'], True)
+        eq_(extracted[q1.id]['question_num_votes'], 1)
+
+    def test_answers_match_extract_document(self):
+        a1 = AnswerFactory()
+        AnswerVoteFactory(answer=a1, helpful=True)
+        AnswerVoteFactory(answer=a1, helpful=False)
+        a2 = AnswerFactory()
+
+        extracted = self.assert_extract_documents(
+            AnswerMetricsMappingType, [a1.id, a2.id], 3)
+        eq_(extracted[a1.id]['helpful_count'], 1)
+        eq_(extracted[a1.id]['unhelpful_count'], 1)
+
+
 class SupportForumTopContributorsTests(ElasticTestCase):
     client_class = LocalizingClient
 
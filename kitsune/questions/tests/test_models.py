@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
+import time
 from datetime import datetime, timedelta
 
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.db.models import Q
 
 import mock
@@ -10,12 +13,13 @@ from taggit.models import Tag
 
 import kitsune.sumo.models
 from kitsune.flagit.models import FlaggedObject
+from kitsune.products.tests import ProductFactory
 from kitsune.search.tests.test_es import ElasticTestCase
 from kitsune.questions.cron import auto_archive_old_questions
 from kitsune.questions.events import QuestionReplyEvent
 from kitsune.questions import models
 from kitsune.questions.models import (
-    Answer, Question, QuestionMetaData, QuestionVisits,
+    Answer, Question, QuestionListEntry, QuestionMetaData, QuestionVisits,
     _tenths_version, _has_beta, VoteMetadata, InvalidUserException,
     AlreadyTakenException)
 from kitsune.questions.tasks import update_answer_pages
@@ -26,6 +30,7 @@ from kitsune.sumo import googleanalytics
 from kitsune.sumo.tests import TestCase
 from kitsune.tags.tests import TagFactory
 from kitsune.tags.utils import add_existing_tag
+from kitsune.users.monkeypatch import _activate_users, _deactivate_users
 from kitsune.users.tests import UserFactory
 from kitsune.wiki.tests import TranslatedRevisionFactory
 
@@ -514,6 +519,116 @@ class AddExistingTagTests(TestCaseBase):
         add_existing_tag('nonexistent tag', self.untagged_question.tags)
 
 
+class RelatedContentTests(TestCaseBase):
+    """Tests for serving and refreshing the related content."""
+
+    def setUp(self):
+        super(RelatedContentTests, self).setUp()
+        self.question = QuestionFactory(product=ProductFactory())
+        self.key = self.question.related_cache_key % self.question.id
+        self.related = {'documents': [{'url': ['/kb/1']}], 'questions': []}
+
+    @mock.patch.object(Question, 'fetch_related_content')
+    def test_miss(self, fetch_related_content):
+        fetch_related_content.return_value = self.related
+        eq_(self.related['documents'], self.question.related_documents)
+        eq_([], self.question.related_questions)
+        eq_(1, fetch_related_content.call_count)
+
+    @mock.patch.object(models, 'update_related_content')
+    @mock.patch.object(Question, 'fetch_related_content')
+    def test_fresh(self, fetch_related_content, update_related_content):
+        self.related['fresh_until'] = time.time() + 60
+        cache.set(self.key, self.related)
+        eq_(self.related['documents'], self.question.related_documents)
+        eq_(0, fetch_related_content.call_count)
+        eq_(0, update_related_content.delay.call_count)
+
+    @mock.patch.object(models, 'update_related_content')
+    @mock.patch.object(Question, 'fetch_related_content')
+    def test_stale(self, fetch_related_content, update_related_content):
+        """Stale content is served while one task refreshes it."""
+        self.related['fresh_until'] = time.time() - 60
+        cache.set(self.key, self.related)
+        eq_(self.related['documents'], self.question.related_documents)
+        eq_(self.related['documents'],
+            Question.objects.get(id=self.question.id).related_documents)
+        eq_(0, fetch_related_content.call_count)
+        update_related_content.delay.assert_called_once_with(self.question.id)
+
+    def test_no_product(self):
+        q = QuestionFactory()
+        eq_([], q.related_documents)
+        eq_([], q.related_questions)
+
+
+class QuestionListEntryTests(TestCaseBase):
+    """Tests for keeping the question list entries up to date."""
+
+    def test_created_with_question(self):
+        q = QuestionFactory()
+        entry = QuestionListEntry.objects.get(question=q)
+        eq_(q.locale, entry.locale)
+        eq_(q.creator_id, entry.creator_id)
+        eq_('needs-attention', entry.status)
+        eq_(False, entry.has_answers)
+
+    def test_status(self):
+        q = QuestionFactory()
+        AnswerFactory(question=q, creator=q.creator)
+        eq_('needs-attention', QuestionListEntry.objects.get(question=q).status)
+
+        a = AnswerFactory(question=q)
+        eq_('responded', QuestionListEntry.objects.get(question=q).status)
+
+        q.solution = a
+        q.save()
+        entry = QuestionListEntry.objects.get(question=q)
+        eq_('done', entry.status)
+        eq_(True, entry.is_solved)
+
+    def test_tags(self):
+        q = QuestionFactory()
+        q.tags.add(TagFactory(name='tag one'), TagFactory(name='two'))
+        entry = QuestionListEntry.objects.get(question=q)
+        eq_(u'|tag one|two|', entry.tags)
+        eq_(1, QuestionListEntry.objects.tagged('two').count())
+
+        q.tags.remove(entry.question.tags.get(name='two'))
+        eq_(u'|tag one|', QuestionListEntry.objects.get(question=q).tags)
+
+    def test_escalated(self):
+        q = QuestionFactory()
+        q.tags.add(TagFactory(name=config.ESCALATE_TAG_NAME))
+        eq_([q.id], list(QuestionListEntry.objects.escalated()
+                                                  .values_list('question',
+                                                               flat=True)))
+
+    def test_inactive_creator(self):
+        q = QuestionFactory()
+        q.creator.is_active = False
+        q.creator.save()
+        eq_(False, QuestionListEntry.objects.get(question=q).creator_is_active)
+
+    def test_admin_actions(self):
+        q = QuestionFactory()
+        admin = mock.Mock()
+        users = User.objects.filter(id=q.creator.id, is_active=True)
+        _deactivate_users(admin, None, users)
+        eq_(False, QuestionListEntry.objects.get(question=q).creator_is_active)
+
+        users = User.objects.filter(id=q.creator.id, is_active=False)
+        _activate_users(admin, None, users)
+        eq_(True, QuestionListEntry.objects.get(question=q).creator_is_active)
+
+    def test_refresh(self):
+        q_ids = [QuestionFactory(tags=['foo']).id for i in range(3)]
+        QuestionListEntry.objects.all().delete()
+
+        QuestionListEntry.refresh(q_ids)
+        eq_(3, QuestionListEntry.objects.tagged('foo').count())
+
+
 class OldQuestionsArchiveTest(ElasticTestCase):
     def test_archive_old_questions(self):
         last_updated = datetime.now() - timedelta(days=100)
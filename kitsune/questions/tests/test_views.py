@@ -623,6 +623,42 @@ class TestQuestionDetails(TestCaseBase):
         res = get(self.client, 'questions.details', args=[self.question.id])
         eq_(200, res.status_code)
 
+    def test_not_modified(self):
+        url = reverse('questions.details', args=[self.question.id],
+                      locale='en-US')
+        res = self.client.get(url)
+        eq_(200, res.status_code)
+        etag = res['ETag']
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        eq_(304, res.status_code)
+
+    def test_modified_by_answer(self):
+        url = reverse('questions.details', args=[self.question.id],
+                      locale='en-US')
+        etag = self.client.get(url)['ETag']
+
+        AnswerFactory(question=self.question)
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        eq_(200, res.status_code)
+
+    def test_modified_by_vote(self):
+        answer = AnswerFactory(question=self.question)
+        url = reverse('questions.details', args=[self.question.id],
+                      locale='en-US')
+        etag = self.client.get(url)['ETag']
+
+        AnswerVote.objects.create(answer=answer, helpful=True,
+                                  anonymous_id='someone')
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        eq_(200, res.status_code)
+
+    def test_authenticated_not_validated(self):
+        u = UserFactory()
+        self.client.login(username=u.username, password='testpass')
+        res = get(self.client, 'questions.details', args=[self.question.id])
+        assert 'ETag' not in res
+
 
 class TestRateLimiting(TestCaseBase):
     client_class = LocalizingClient
@@ -19,12 +19,13 @@ from django.shortcuts import get_object_or_404, render, redirect
 from django.template.loader import render_to_string
 from django.utils.translation import ugettext as _, ugettext_lazy as _lazy
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST, require_GET, require_http_methods
+from django.views.decorators.http import (
+    condition, require_POST, require_GET, require_http_methods)
 
 import waffle
 from ordereddict import OrderedDict
 from mobility.decorators import mobile_template
-from session_csrf import anonymous_csrf
+from session_csrf import anonymous_csrf, ANON_COOKIE
 from statsd import statsd
 from taggit.models import Tag
 from tidings.events import ActivationRequestFailed
@@ -46,7 +47,7 @@ from kitsune.questions.marketplace import (
     MARKETPLACE_CATEGORIES, ZendeskError)
 from kitsune.questions.models import (
     Question, Answer, QuestionVote, AnswerVote, QuestionMappingType,
-    QuestionLocale)
+    QuestionLocale, QuestionListEntry)
 from kitsune.questions.signals import tag_added
 from kitsune.search.es_utils import (ES_EXCEPTIONS, Sphilastic, F,
                                      es_query_with_analyzer)
@@ -55,7 +56,9 @@ from kitsune.sumo.api_utils import JSONRenderer
 from kitsune.sumo.decorators import ssl_required, ratelimit
 from kitsune.sumo.templatetags.jinja_helpers import urlparams
 from kitsune.sumo.urlresolvers import reverse, split_path
-from kitsune.sumo.utils import paginate, simple_paginate, build_paged_url, is_ratelimited
+from kitsune.sumo.utils import (
+    paginate, simple_paginate, build_paged_url, is_ratelimited, modified_time,
+    page_etag)
 from kitsune.tags.utils import add_existing_tag
 from kitsune.upload.api import ImageAttachmentSerializer
 from kitsune.upload.models import ImageAttachment
@@ -94,7 +97,7 @@ FILTER_GROUPS = {
 
 ORDER_BY = OrderedDict([
     ('updated', ('updated', _lazy('Updated'))),
-    ('views', ('questionvisits__visits', _lazy('Views'))),
+    ('views', ('num_visits', _lazy('Views'))),
     ('votes', ('num_votes_past_week', _lazy('Votes'))),
     ('replies', ('num_answers', _lazy('Replies'))),
 ])
@@ -151,7 +154,9 @@ def question_list(request, template, product_slug):
     else:
         topic = None
 
-    question_qs = Question.objects
+    # The list comes from the denormalized QuestionListEntry table. Its
+    # manager has the same filters as Question's.
+    question_qs = QuestionListEntry.objects
 
     if filter_ not in FILTER_GROUPS[show]:
         filter_ = None
@@ -182,20 +187,16 @@ def question_list(request, template, product_slug):
             question_qs = question_qs.done()
 
     if escalated:
-        question_qs = question_qs.filter(
-            tags__name__in=[config.ESCALATE_TAG_NAME])
+        question_qs = question_qs.filter(is_escalated=True)
 
-    question_qs = question_qs.select_related(
-        'creator', 'last_answer', 'last_answer__creator')
-    question_qs = question_qs.prefetch_related('topic', 'topic__product')
-
-    question_qs = question_qs.filter(creator__is_active=1)
+    question_qs = question_qs.filter(creator_is_active=True)
 
     if not request.user.has_perm('flagit.can_moderate'):
         question_qs = question_qs.filter(is_spam=False)
 
     if owner == 'mine' and request.user.is_authenticated():
-        criteria = Q(answers__creator=request.user) | Q(creator=request.user)
+        criteria = (Q(question__answers__creator=request.user) |
+                    Q(creator=request.user))
         question_qs = question_qs.filter(criteria).distinct()
     else:
         owner = None
@@ -209,13 +210,14 @@ def question_list(request, template, product_slug):
         tags = Tag.objects.filter(slug__in=tag_slugs)
         if tags:
             for t in tags:
-                question_qs = question_qs.filter(tags__name__in=[t.name])
+                question_qs = question_qs.filter(
+                    tags__contains=u'|%s|' % t.name)
             if len(tags) == 1:
                 feed_urls += ((reverse('questions.tagged_feed',
                                        args=[tags[0].slug]),
                                TaggedQuestionsFeed().title(tags[0])),)
         else:
-            question_qs = Question.objects.none()
+            question_qs = QuestionListEntry.objects.none()
 
     # Exclude questions over 90 days old without an answer.
     oldest_date = date.today() - timedelta(days=90)
@@ -223,26 +225,22 @@ def question_list(request, template, product_slug):
 
     # Filter by products.
     if products:
-        # This filter will match if any of the products on a question have the
-        # correct id.
-        question_qs = question_qs.filter(product__in=products).distinct()
+        question_qs = question_qs.filter(product__in=products)
 
     # Filter by topic.
     if topic:
-        # This filter will match if any of the topics on a question have the
-        # correct id.
-        question_qs = question_qs.filter(topic__id=topic.id)
+        question_qs = question_qs.filter(topic=topic)
 
     # Filter by locale for AAQ locales, and by locale + default for others.
     if request.LANGUAGE_CODE in QuestionLocale.objects.locales_list():
         forum_locale = request.LANGUAGE_CODE
-        locale_query = Q(locale=request.LANGUAGE_CODE)
+        forum_locales = [request.LANGUAGE_CODE]
     else:
         forum_locale = settings.WIKI_DEFAULT_LANGUAGE
-        locale_query = Q(locale=request.LANGUAGE_CODE)
-        locale_query |= Q(locale=settings.WIKI_DEFAULT_LANGUAGE)
+        forum_locales = [request.LANGUAGE_CODE,
+                         settings.WIKI_DEFAULT_LANGUAGE]
 
-    question_qs = question_qs.filter(locale_query)
+    question_qs = question_qs.filter(locale__in=forum_locales)
 
     # Set the order.
     order_by = ORDER_BY[order][0]
@@ -252,7 +250,8 @@ def question_list(request, template, product_slug):
     try:
         with statsd.timer('questions.view.paginate.%s' % filter_):
             questions_page = simple_paginate(
-                request, question_qs, per_page=config.QUESTIONS_PER_PAGE)
+                request, question_qs.values_list('question', flat=True),
+                per_page=config.QUESTIONS_PER_PAGE)
     except (PageNotAnInteger, EmptyPage):
         # If we aren't on page 1, redirect there.
         # TODO: Is 404 more appropriate?
@@ -260,14 +259,19 @@ def question_list(request, template, product_slug):
             url = build_paged_url(request)
             return HttpResponseRedirect(urlparams(url, page=1))
 
-    # Recent answered stats
-    extra_filters = locale_query
-
-    if products:
-        extra_filters &= Q(product__in=products)
+    # Swap the ids on the page for the questions, in the same order.
+    question_ids = list(questions_page.object_list)
+    questions = (Question.objects.filter(pk__in=question_ids)
+                 .select_related('creator', 'last_answer',
+                                 'last_answer__creator')
+                 .prefetch_related('topic', 'topic__product'))
+    questions = dict((q.id, q) for q in questions)
+    questions_page.object_list = [questions[id_] for id_ in question_ids
+                                  if id_ in questions]
 
-    recent_asked_count = Question.recent_asked_count(extra_filters)
-    recent_unanswered_count = Question.recent_unanswered_count(extra_filters)
+    # Recent answered stats
+    recent_asked_count, recent_unanswered_count = Question.recent_counts(
+        forum_locales, products)
     if recent_asked_count:
         recent_answered_percent = int(
             (float(recent_asked_count - recent_unanswered_count) /
@@ -395,6 +399,49 @@ def parse_troubleshooting(troubleshooting_json):
     return parsed
 
 
+def _question_validators(request, question_id):
+    """Returns the ETag and modified time of the question page.
+
+    They come from one lookup of the question, and when its answers,
+    votes or tags last changed. Returns None for pages we can't validate
+    that cheaply: pages for authed users, with messages, or with forms.
+
+    """
+    if not hasattr(request, '_question_validators'):
+        request._question_validators = None
+        if (request.method in ('GET', 'HEAD') and
+                not request.user.is_authenticated() and
+                not request.COOKIES.get('messages')):
+            question = (Question.objects
+                        .filter(pk=question_id, is_spam=False)
+                        .values_list('updated', 'last_answer_id')[:1])
+            if question:
+                updated, last_answer_id = question[0]
+                modified = max(
+                    time.mktime(updated.timetuple()),
+                    modified_time(Question.page_modified_key % question_id))
+                # The page has the visitor's votes and csrf token.
+                etag = page_etag(
+                    request, question_id, last_answer_id, modified,
+                    request.COOKIES.get(settings.ANONYMOUS_COOKIE_NAME),
+                    request.COOKIES.get(ANON_COOKIE))
+                request._question_validators = (
+                    etag, datetime.utcfromtimestamp(modified))
+    return request._question_validators
+
+
+def _question_etag(request, question_id, **kwargs):
+    validators = _question_validators(request, question_id)
+    return validators and validators[0]
+
+
+def _question_last_modified(request, question_id, **kwargs):
+    validators = _question_validators(request, question_id)
+    return validators and validators[1]
+
+
+@condition(etag_func=_question_etag,
+           last_modified_func=_question_last_modified)
 @mobile_template('questions/{mobile/}question_details.html')
 @anonymous_csrf  # Need this so the anon csrf gets set for watch forms.
 def question_details(request, template, question_id, form=None,
@@ -1,5 +1,4 @@
 import logging
-import time
 from datetime import datetime
 
 import requests
@@ -14,7 +13,7 @@ from kitsune.search import synonym_utils
 from kitsune.search.es_utils import (
     get_doctype_stats, get_indexes, delete_index, ES_EXCEPTIONS,
     get_indexable, CHUNK_SIZE, recreate_indexes, write_index, read_index,
-    all_read_indexes, all_write_indexes)
+    all_read_indexes, all_write_indexes, create_batch_id, chunk_record_name)
 from kitsune.search.models import Record, get_mapping_types, Synonym
 from kitsune.search.tasks import index_chunk_task, update_synonyms_task
 from kitsune.search.utils import chunked, to_class_path
@@ -35,14 +34,6 @@ class DeleteError(Exception):
     pass
 
 
-def create_batch_id():
-    """Returns a batch_id"""
-    # TODO: This is silly, but it's a good enough way to distinguish
-    # between batches by looking at a Record. This is just over the
-    # number of seconds in a day.
-    return str(int(time.time()))[-6:]
-
-
 def handle_delete(request):
     """Deletes an index"""
     index_to_delete = request.POST.get('delete_index')
@@ -93,9 +84,8 @@ def reindex(mapping_type_names):
 
     for cls, id_list in chunks:
         index = cls.get_index()
-        chunk_name = 'Indexing: %s %d -> %d' % (
-            cls.get_mapping_type_name(), id_list[0], id_list[-1])
-        rec = Record.objects.create(batch_id=batch_id, name=chunk_name)
+        rec = Record.objects.create(batch_id=batch_id,
+                                    name=chunk_record_name(cls, id_list))
         index_chunk_task.delay(index, batch_id, rec.id, (to_class_path(cls), id_list))
 
 
@@ -1,21 +1,26 @@
 import json
 import logging
+import multiprocessing
 import pprint
+import re
 import time
 from functools import wraps
+from itertools import islice
 
 from django.conf import settings
-from django.db import reset_queries
+from django.db import connections, reset_queries
 from django.http import HttpResponse
 from django.shortcuts import render
 from django.utils.translation import ugettext as _
 
+import elasticutils
 import requests
+from statsd import statsd
 from elasticutils import S as UntypedS
 from elasticutils.contrib.django import S, F, get_es, ES_EXCEPTIONS  # noqa
 
 from kitsune.search import config
-from kitsune.search.utils import chunked
+from kitsune.search.utils import chunked, from_class_path, to_class_path
 
 
 # These used to be constants, but that was problematic. Things like
@@ -46,6 +51,19 @@ def all_write_indexes():
 # the admin.
 CHUNK_SIZE = 20000
 
+# The number of things in a chunk when reindexing with the esreindex
+# command.
+REINDEX_CHUNK_SIZE = 1000
+
+# Records for indexing chunks are named after the mapping type and the
+# id range of the chunk. That's enough to rebuild the chunk later on
+# when resuming a reindex.
+CHUNK_RECORD_NAME = u'Indexing: {0} {1} -> {2}'
+# Chunks that go into a new index, rather than the write index, name it.
+CHUNK_RECORD_INTO = u' into {0}'
+CHUNK_RECORD_NAME_RE = re.compile(
+    r'^Indexing: (\S+) (\d+) -> (\d+)(?: into (\S+))?$')
+
 
 log = logging.getLogger('k.search.es')
 
@@ -147,6 +165,8 @@ class Sphilastic(S, AnalyzerMixin):
     def get_indexes(self):
         # SphilasticUnified is a searcher and so it's _always_ used in
         # a read context. Therefore, we always return the read index.
+        # After ``esreindex --into-new``, that's an alias, so this
+        # follows whatever index the alias points to.
         return [read_index(self.type.get_index_group())]
 
     def process_query_mlt(self, key, val, action):
@@ -251,6 +271,15 @@ def format_time(time_to_go):
     return "%dm %ds" % (time_to_go / 60, time_to_go % 60)
 
 
+def format_size(nbytes):
+    """Returns a human readable string for a number of bytes"""
+    if nbytes < 1024:
+        return "%dB" % nbytes
+    if nbytes < 1024 * 1024:
+        return "%.1fKB" % (nbytes / 1024.0)
+    return "%.1fMB" % (nbytes / (1024.0 * 1024.0))
+
+
 def get_documents(cls, ids):
     """Returns a list of ES documents with specified ids and doctype
 
@@ -390,14 +419,197 @@ def recreate_indexes(es=None, indexes=None):
 
 
 def get_index_settings(index):
-    """Returns ES settings for this index"""
-    return (get_es().indices.get_settings(index=index)
-            .get(index, {}).get('settings', {}))
+    """Returns ES settings for this index
+
+    If index is an alias, this returns the settings of the index it
+    points to.
+
+    """
+    index_settings = get_es().indices.get_settings(index=index)
+    if index not in index_settings and len(index_settings) == 1:
+        index = index_settings.keys()[0]
+    return index_settings.get(index, {}).get('settings', {})
+
+
+def get_alias_indexes(es, alias):
+    """Returns the list of indexes an alias points to
+
+    :returns: list of index names. This is empty if the alias doesn't
+        exist, and that includes when there's an index with that name.
+
+    """
+    if not es.indices.exists_alias(name=alias):
+        return []
+    return es.indices.get_alias(name=alias).keys()
+
+
+def with_alias_indexes(names):
+    """Returns the names plus the indexes any aliases among them point to"""
+    es = get_es()
+    indexes = set(names)
+    for name in names:
+        indexes.update(get_alias_indexes(es, name))
+    return indexes
+
+
+def create_new_index(es, group):
+    """Creates a fresh timestamped index for a group to bulk load
+
+    The index starts out with refreshing and replicas turned off,
+    which makes bulk loading a lot faster. ``swap_index_alias`` turns
+    them back on when it's done.
+
+    :arg es: the ES object to use
+    :arg group: the index group this is the new index for
+
+    :returns: the name of the new index
+
+    """
+    # Import locally to avoid circular import
+    from kitsune.search.models import get_mapping_types
+
+    index = u'%s-%s' % (read_index(group), time.strftime('%Y%m%d%H%M%S'))
+    mappings = dict((cls.get_mapping_type_name(), cls.get_mapping())
+                    for cls in get_mapping_types()
+                    if cls.get_index_group() == group)
+
+    es.indices.create(index=index, body={
+        'mappings': mappings,
+        'settings': {
+            'analysis': get_analysis(),
+            'index': {
+                'refresh_interval': '-1',
+                'number_of_replicas': 0,
+            },
+        }
+    })
+    es.cluster.health(index=index, wait_for_status='yellow')
+    return index
+
+
+def swap_index_alias(es, group, index, log=log):
+    """Points the read alias for a group at a new index
+
+    This restores the refresh interval and the replicas the live index
+    had, waits for the replicas, then moves the alias over in one
+    atomic step.
+
+    :arg es: the ES object to use
+    :arg group: the index group
+    :arg index: the new index for the group
+
+    :returns: list of indexes the alias pointed to before
+
+    """
+    alias = read_index(group)
+    old_indexes = get_alias_indexes(es, alias)
+
+    old_settings = {}
+    if old_indexes or es.indices.exists(index=alias):
+        old_settings = get_index_settings(alias)
+    replicas = int(old_settings.get('index.number_of_replicas', 1))
+
+    es.indices.put_settings(index=index, body={'index': {
+        'refresh_interval': old_settings.get('index.refresh_interval',
+                                             '1s'),
+        'number_of_replicas': replicas,
+    }})
+    es.indices.refresh(index=index)
+
+    health = es.cluster.health(
+        index=index, wait_for_status='green' if replicas else 'yellow',
+        timeout='30m')
+    if health.get('timed_out'):
+        log.warning('   %s is still %s. Going live anyway.',
+                    index, health.get('status'))
+
+    if not old_indexes and es.indices.exists(index=alias):
+        # The live index isn't behind an alias yet. ES can't replace
+        # an index with an alias atomically, so this is the one time
+        # there's a moment where the index isn't there.
+        log.warning('   %s is an index, not an alias. Deleting it so '
+                    'the alias can take its place.', alias)
+        delete_index(alias)
+
+    actions = [{'remove': {'index': old_index, 'alias': alias}}
+               for old_index in old_indexes]
+    actions.append({'add': {'index': index, 'alias': alias}})
+    es.indices.update_aliases(body={'actions': actions})
+
+    return old_indexes
+
+
+# The number of ids fetched per query when streaming the indexable.
+INDEXABLE_BATCH_SIZE = 10000
+
+
+class IndexableIds(object):
+    """Streams the ids of an indexable in constant memory
+
+    Rather than pulling all the ids at once, this fetches them in
+    batches with keyset pagination (``pk > last_pk ORDER BY pk LIMIT
+    n``). Each of those queries is cheap regardless of how far into
+    the table it is.
+
+    :arg queryset: a ``values_list('pk', flat=True)`` queryset like
+        the ones ``get_indexable`` returns
+    :arg limit: the maximum number of ids to return or None for all of
+        them
+    :arg newest: if True, returns ids from the highest down
+    :arg batch_size: the number of ids to fetch per query
+
+    """
+    def __init__(self, queryset, limit=None, newest=False,
+                 batch_size=INDEXABLE_BATCH_SIZE):
+        self.queryset = queryset
+        self.limit = limit
+        self.newest = newest
+        self.batch_size = batch_size
+        self._count = None
+
+    def __iter__(self):
+        if self.newest:
+            qs = self.queryset.order_by('-pk')
+        else:
+            qs = self.queryset.order_by('pk')
+
+        remaining = self.limit
+        last_pk = None
+        while remaining is None or remaining > 0:
+            batch_qs = qs
+            if last_pk is not None:
+                if self.newest:
+                    batch_qs = qs.filter(pk__lt=last_pk)
+                else:
+                    batch_qs = qs.filter(pk__gt=last_pk)
+
+            size = self.batch_size
+            if remaining is not None:
+                size = min(size, remaining)
+                remaining -= size
+
+            batch = list(batch_qs[:size])
+            for id_ in batch:
+                yield id_
+
+            if len(batch) < size:
+                return
+            last_pk = batch[-1]
+
+    def __len__(self):
+        if self._count is None:
+            self._count = self.queryset.count()
+            if self.limit is not None:
+                self._count = min(self._count, self.limit)
+        return self._count
 
 
 def get_indexable(percent=100, mapping_types=None):
     """Returns a list of (class, iterable) for all the things to index
 
+    The iterables are ``IndexableIds``, so they don't pull everything
+    into memory.
+
     :arg percent: Defaults to 100.  Allows you to specify how much of
         each doctype you want to index.  This is useful for
         development where doing a full reindex takes an hour.
@@ -413,57 +625,385 @@ def get_indexable(percent=100, mapping_types=None):
     percent = float(percent) / 100
     for cls in mapping_types:
         indexable = cls.get_indexable()
+        limit = None
         if percent < 1:
-            indexable = indexable[:int(indexable.count() * percent)]
-        to_index.append((cls, indexable))
+            limit = int(indexable.count() * percent)
+        to_index.append((cls, IndexableIds(indexable, limit=limit)))
 
     return to_index
 
 
-def index_chunk(cls, id_list, reraise=False):
+def create_batch_id():
+    """Returns a batch_id"""
+    # TODO: This is silly, but it's a good enough way to distinguish
+    # between batches by looking at a Record. This is just over the
+    # number of seconds in a day.
+    return str(int(time.time()))[-6:]
+
+
+def chunk_record_name(cls, id_list, index=None):
+    """Returns the Record name for indexing a chunk of ids of cls.
+
+    :arg index: the new index the chunk goes into, if it doesn't go
+        into the write index
+
+    """
+    name = CHUNK_RECORD_NAME.format(
+        cls.get_mapping_type_name(), id_list[0], id_list[-1])
+    if index is not None:
+        name += CHUNK_RECORD_INTO.format(index)
+    return name
+
+
+def parse_chunk_record_name(name):
+    """Returns (mapping type name, first id, last id) for a Record name.
+
+    Returns None if the name isn't one created by chunk_record_name.
+
+    """
+    match = CHUNK_RECORD_NAME_RE.match(name)
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2)), int(match.group(3))
+
+
+def chunk_record_index(name):
+    """Returns the new index a chunk Record went into, or None."""
+    match = CHUNK_RECORD_NAME_RE.match(name)
+    if match is None:
+        return None
+    return match.group(4)
+
+
+class AdaptiveBatchSize(object):
+    """Works out how many documents to bulk index at a time
+
+    Documents vary a lot in size. A question carries all its answers,
+    so some are tiny and some are huge. Rather than a fixed number of
+    documents per bulk request, this adjusts the number after every
+    request so requests take about ``settings.ES_BULK_TARGET_SECONDS``
+    and stay under ``settings.ES_BULK_MAX_BYTES``.
+
+    """
+    initial_size = 80
+    min_size = 10
+    # elasticsearch.helpers.bulk splits things into requests of 500
+    # documents anyway.
+    max_size = 500
+
+    def __init__(self):
+        self.size = self.initial_size
+
+    def record(self, count, nbytes, seconds):
+        """Adjusts the size given how a bulk request went
+
+        :arg count: number of documents in the request
+        :arg nbytes: size of the documents in bytes
+        :arg seconds: how long the request took
+
+        """
+        if not count:
+            return
+
+        if seconds > 0:
+            size = count * settings.ES_BULK_TARGET_SECONDS / seconds
+        else:
+            size = self.max_size
+
+        bytes_per_doc = max(float(nbytes) / count, 1)
+        size = min(size, settings.ES_BULK_MAX_BYTES / bytes_per_doc)
+
+        # Don't jump around too much on one slow or fast request.
+        size = min(size, self.size * 2)
+
+        self.size = int(max(self.min_size, min(self.max_size, size)))
+
+
+# Mapping type name -> AdaptiveBatchSize. This carries what we learned
+# about a mapping type from one chunk to the next.
+_batch_sizes = {}
+
+
+def get_batch_size(cls):
+    """Returns the AdaptiveBatchSize for a mapping type"""
+    name = cls.get_mapping_type_name()
+    if name not in _batch_sizes:
+        _batch_sizes[name] = AdaptiveBatchSize()
+    return _batch_sizes[name]
+
+
+def split_by_bytes(sized_documents, max_bytes):
+    """Splits documents into groups of at most max_bytes
+
+    A document that's bigger than max_bytes gets a group all to
+    itself.
+
+    :arg sized_documents: list of (document, size in bytes) tuples
+
+    :returns: generator of lists of (document, size in bytes) tuples
+
+    """
+    group = []
+    group_bytes = 0
+    for document, size in sized_documents:
+        if group and group_bytes + size > max_bytes:
+            yield group
+            group = []
+            group_bytes = 0
+        group.append((document, size))
+        group_bytes += size
+    if group:
+        yield group
+
+
+def _bulk_index_documents(cls, documents, batch_size, index=None):
+    """Bulk indexes documents and records how it went
+
+    :returns: (number of documents indexed, number of bytes sent)
+
+    """
+    name = cls.get_mapping_type_name()
+    serializer = cls.get_es().transport.serializer
+    sized = [(doc, len(serializer.dumps(doc))) for doc in documents]
+
+    total_bytes = 0
+    for group in split_by_bytes(sized, settings.ES_BULK_MAX_BYTES):
+        nbytes = sum(size for doc, size in group)
+        start_time = time.time()
+        cls.bulk_index([doc for doc, size in group], id_field='id',
+                       index=index)
+        seconds = time.time() - start_time
+
+        batch_size.record(len(group), nbytes, seconds)
+        total_bytes += nbytes
+
+        # statsd turns these counters into docs/sec and bytes/sec.
+        statsd.incr('search.index.%s.docs' % name, len(group))
+        statsd.incr('search.index.%s.bytes' % name, nbytes)
+        statsd.timing('search.index.%s.bulk' % name, int(seconds * 1000))
+
+    statsd.gauge('search.index.%s.batch_size' % name, batch_size.size)
+    return len(documents), total_bytes
+
+
+def _extract_one_by_one(cls, ids):
+    """Extract documents one id at a time, logging the ones that fail.
+
+    :returns: list of (id, document) tuples like
+        ``SearchMappingType.extract_documents``
+
+    """
+    extracted = []
+    for id_ in ids:
+        try:
+            extracted.append((id_, cls.extract_document(id_)))
+
+        except UnindexMeBro:
+            # extract_document throws this in cases where we need
+            # to remove the item from the index.
+            extracted.append((id_, None))
+
+        except Exception:
+            log.exception('Unable to extract/index document (id: %d)', id_)
+
+    return extracted
+
+
+def index_chunk(cls, id_list, reraise=False, index=None):
     """Index a chunk of documents.
 
     :arg cls: The MappingType class.
     :arg id_list: Iterable of ids of that MappingType to index.
     :arg reraise: False if you want errors to be swallowed and True
         if you want errors to be thrown.
+    :arg index: The index to index into. Defaults to the write index
+        for the MappingType.
+
+    :returns: (number of documents indexed, number of bytes sent)
 
     """
-    # Note: This bulk indexes in batches of 80. I didn't arrive at
-    # this number through a proper scientific method. It's possible
-    # there's a better number. It takes a while to fiddle with,
-    # though. Probably best to expose the number as an environment
-    # variable, then run a script that takes timings for
-    # --criticalmass, runs overnight and returns a more "optimal"
-    # number.
-    for ids in chunked(id_list, 80):
-        documents = []
-        for id_ in ids:
-            try:
-                documents.append(cls.extract_document(id_))
+    # The number of documents per batch adapts to how long the bulk
+    # requests take and how big the documents are. See
+    # AdaptiveBatchSize.
+    batch_size = get_batch_size(cls)
+    indexed = 0
+    total_bytes = 0
+
+    id_list = iter(id_list)
+    while True:
+        ids = tuple(islice(id_list, batch_size.size))
+        if not ids:
+            break
 
-            except UnindexMeBro:
-                # extract_document throws this in cases where we need
-                # to remove the item from the index.
-                cls.unindex(id_)
+        try:
+            # Extract the whole batch at once. Mapping types that
+            # implement extract_documents do this with a fixed number
+            # of queries rather than several queries per id.
+            extracted = cls.extract_documents(ids)
+
+        except Exception:
+            log.exception('Unable to extract batch of documents (ids: %s)',
+                          ids)
+            if reraise:
+                raise
+
+            # Something in this batch is busted. Fall back to doing
+            # it one id at a time so the rest of the batch still gets
+            # indexed.
+            extracted = _extract_one_by_one(cls, ids)
 
-            except Exception:
-                log.exception('Unable to extract/index document (id: %d)',
-                              id_)
-                if reraise:
-                    raise
+        documents = []
+        for id_, document in extracted:
+            if document is None:
+                # extract_documents returns None in cases where we
+                # need to remove the item from the index.
+                cls.unindex(id_, index=index)
+            else:
+                documents.append(document)
 
         if documents:
-            cls.bulk_index(documents, id_field='id')
+            count, nbytes = _bulk_index_documents(
+                cls, documents, batch_size, index=index)
+            indexed += count
+            total_bytes += nbytes
 
         if settings.DEBUG:
             # Nix queries so that this doesn't become a complete
             # memory hog and make Will's computer sad when DEBUG=True.
             reset_queries()
 
+    return indexed, total_bytes
+
+
+def _init_reindex_worker():
+    """Sets up a freshly forked reindex worker process."""
+    # The worker inherited the parent's cached Elasticsearch
+    # connections. Sharing those sockets between processes mixes up
+    # requests and responses, so each worker builds its own.
+    elasticutils._cached_elasticsearch.clear()
+
+
+def _index_chunk_in_worker(job):
+    """Indexes one chunk of a reindex in a worker process.
+
+    :arg job: a (batch_id, rec_id, cls_path, first_id, last_id, index)
+        tuple. If index is None, this indexes into the write index.
+
+    :returns: (rec_id, number of ids indexed, number of bytes sent,
+        error message or None)
+
+    """
+    # Import locally to avoid circular import
+    from kitsune.search.tasks import index_chunk_task
+
+    batch_id, rec_id, cls_path, first_id, last_id, index = job
+    cls = from_class_path(cls_path)
+
+    # The chunk is the indexable ids in the range. Chunks are
+    # contiguous runs of the indexable ordered by id, so this gets us
+    # the same ids whether we're indexing everything, a percentage or
+    # the critical mass.
+    id_list = list(cls.get_indexable().filter(
+        pk__gte=min(first_id, last_id), pk__lte=max(first_id, last_id)))
+
+    try:
+        indexed, nbytes = index_chunk_task(
+            index or cls.get_index(), batch_id, rec_id, (cls_path, id_list))
+    except Exception as exc:
+        return rec_id, len(id_list), 0, unicode(exc)
+
+    return rec_id, len(id_list), nbytes, None
+
+
+def _reindex_with_workers(jobs, workers, log=log):
+    """Runs reindex jobs on a pool of worker processes.
+
+    :arg jobs: list of jobs for ``_index_chunk_in_worker``
+    :arg workers: number of worker processes
+    :arg log: the logger to use
+
+    :returns: the number of chunks that failed
+
+    """
+    # Worker processes can't share the parent's database connections,
+    # so close them before forking. Everyone opens new ones as needed.
+    connections.close_all()
+
+    pool = multiprocessing.Pool(workers, initializer=_init_reindex_worker)
+    try:
+        start_time = time.time()
+        total = len(jobs)
+        done = 0
+        failed = 0
+        indexed = 0
+        total_bytes = 0
+
+        for rec_id, count, nbytes, error in pool.imap_unordered(
+                _index_chunk_in_worker, jobs):
+            done += 1
+            indexed += count
+            total_bytes += nbytes
+            if error is not None:
+                failed += 1
+                log.error('   chunk %s failed: %s', rec_id, error)
+
+            elapsed = time.time() - start_time
+            time_to_go = (total - done) * (elapsed / done)
+            log.info('   %s/%s chunks, %s docs... (%d docs/s, %s/s, %s ETA)',
+                     done,
+                     total,
+                     indexed,
+                     indexed / elapsed if elapsed else 0,
+                     format_size(total_bytes / elapsed if elapsed else 0),
+                     format_time(time_to_go))
+
+        pool.close()
+
+    finally:
+        # If things went south (^C, for example), this nixes the
+        # workers. Their chunks stay outstanding and can be resumed.
+        pool.terminate()
+        pool.join()
+
+    return failed
+
+
+# Passes over the rebuild journal before swapping in new indexes. Each
+# pass catches up with what changed during the previous one.
+MAX_REPLAY_PASSES = 5
+
+# Once a replay pass is down to this many updates, we're caught up
+# enough to swap in the new indexes.
+REPLAY_SETTLED = 100
+
+
+def _replay_rebuild_journal(new_indexes):
+    """Applies journaled live indexing updates to new indexes.
+
+    :arg new_indexes: dict of index group -> new index
+
+    :returns: the number of updates in the journal
+
+    """
+    # Import locally to avoid circular import
+    from kitsune.search.tasks import INDEX, group_updates, take_rebuild_journal
+
+    updates = take_rebuild_journal()
+    for (cls, action), ids in group_updates(updates).items():
+        index = new_indexes.get(cls.get_index_group())
+        if index is None:
+            continue
+        if action == INDEX:
+            index_chunk(cls, ids, reraise=True, index=index)
+        else:
+            cls.bulk_unindex(ids, index=index)
+
+    return len(updates)
+
 
 def es_reindex_cmd(percent=100, delete=False, mapping_types=None,
-                   criticalmass=False, log=log):
+                   criticalmass=False, workers=1, resume=None,
+                   into_new=False, log=log):
     """Rebuild ElasticSearch indexes
 
     :arg percent: 1 to 100--the percentage of the db to index
@@ -471,12 +1011,66 @@ def es_reindex_cmd(percent=100, delete=False, mapping_types=None,
     :arg mapping_types: list of mapping types to index
     :arg criticalmass: whether or not to index just a critical mass of
         things
+    :arg workers: the number of worker processes to index with. If
+        this is more than 1, chunks are tracked with Records and can
+        be resumed if the reindex fails.
+    :arg resume: batch_id of a previous reindex to resume. This
+        reindexes the chunks of that batch that didn't succeed.
+    :arg into_new: whether to build new indexes and swap them in
+        when they're done rather than reindexing the live ones. This
+        rebuilds every mapping type in the index groups of
+        mapping_types.
     :arg log: the logger to use
 
     """
+    # Import locally to avoid circular import
+    from kitsune.search.models import Record, get_mapping_types
+    from kitsune.search.tasks import (
+        start_rebuild_journal, stop_rebuild_journal)
+    from kitsune.sumo.redis_utils import RedisError
+
     es = get_es()
 
-    if mapping_types is None:
+    if resume is not None:
+        records = (Record.objects.filter(batch_id=resume)
+                                 .exclude(status=Record.STATUS_SUCCESS))
+        resume_chunks = []
+        for rec in records:
+            parsed = parse_chunk_record_name(rec.name)
+            if parsed is None:
+                log.error('Record "%s" is not a reindex chunk.', rec.name)
+                return
+            if chunk_record_index(rec.name) is not None:
+                # The journal of what changed while the new indexes were
+                # built is gone, so they can't be finished and swapped in.
+                log.error('Batch %s built new indexes and can\'t be '
+                          'resumed. Run esreindex --into-new again.', resume)
+                return
+            resume_chunks.append((rec.id, ) + parsed)
+
+        if not resume_chunks:
+            log.info('Nothing to resume for batch %s.', resume)
+            return
+
+        mapping_types = list(set(chunk[1] for chunk in resume_chunks))
+
+    if into_new:
+        groups = sorted(set(cls.get_index_group()
+                            for cls in get_mapping_types(mapping_types)))
+        for group in groups:
+            if read_index(group) != write_index(group):
+                log.error('The read and write indexes for "%s" differ. '
+                          '--into-new needs them to be the same.', group)
+                return
+
+        # The new indexes get all the mapping types in their groups.
+        mapping_types = [cls.get_mapping_type_name()
+                         for cls in get_mapping_types()
+                         if cls.get_index_group() in groups]
+        # The live indexes stay untouched.
+        indexes = []
+
+    elif mapping_types is None:
         indexes = all_write_indexes()
     else:
         indexes = indexes_for_doctypes(mapping_types)
@@ -494,11 +1088,24 @@ def es_reindex_cmd(percent=100, delete=False, mapping_types=None,
     if need_delete:
         return
 
+    if resume is None and workers > 1:
+        outstanding = Record.objects.outstanding().count()
+        if outstanding > 0:
+            log.error('There are %s outstanding chunks. Resume them with '
+                      '--resume or reset them in the admin.', outstanding)
+            return
+
     if delete:
         log.info('wiping and recreating %s...', ', '.join(indexes))
         recreate_indexes(es, indexes)
 
-    if criticalmass:
+    if resume is not None:
+        all_indexable = []
+
+    elif into_new:
+        all_indexable = get_indexable(mapping_types=mapping_types)
+
+    elif criticalmass:
         # The critical mass is defined as the entire KB plus the most
         # recent 15k questions (which is about how many questions
         # there were created in the last 180 days). We build that
@@ -509,11 +1116,11 @@ def es_reindex_cmd(percent=100, delete=False, mapping_types=None,
             mapping_types=['questions_question', 'wiki_document'])
 
         # The first item is questions because we specified that
-        # order. Old questions don't show up in searches, so we nix
-        # them by reversing the list (ordered by id ascending) and
-        # slicing it.
-        all_indexable[0] = (all_indexable[0][0],
-                            list(reversed(all_indexable[0][1]))[:15000])
+        # order. Old questions don't show up in searches, so we only
+        # take the newest ones. The db does that for us.
+        cls = all_indexable[0][0]
+        all_indexable[0] = (cls, IndexableIds(
+            cls.get_indexable(), limit=15000, newest=True))
 
     elif mapping_types:
         all_indexable = get_indexable(percent, mapping_types)
@@ -521,8 +1128,25 @@ def es_reindex_cmd(percent=100, delete=False, mapping_types=None,
     else:
         all_indexable = get_indexable(percent)
 
+    new_indexes = {}
+    if into_new:
+        # Live indexing updates from here on get journaled so we can
+        # replay them into the new indexes.
+        try:
+            start_rebuild_journal()
+        except RedisError as exc:
+            log.error('Unable to journal live indexing updates while '
+                      'building new indexes: %s', exc)
+            return
+
+    old_refreshes = {}
+    batch_id = None
     try:
-        old_refreshes = {}
+        if into_new:
+            for group in groups:
+                new_indexes[group] = create_new_index(es, group)
+                log.info('created %s for %s', new_indexes[group], group)
+
         # We're doing a lot of indexing, so we get the refresh_interval of
         # the index currently, then nix refreshing. Later we'll restore it.
         for index in indexes:
@@ -533,38 +1157,115 @@ def es_reindex_cmd(percent=100, delete=False, mapping_types=None,
                                     body={'index': {'refresh_interval': '-1'}})
 
         start_time = time.time()
-        for cls, indexable in all_indexable:
-            cls_start_time = time.time()
-            total = len(indexable)
+        failed = 0
+
+        if resume is not None or workers > 1:
+            if resume is not None:
+                batch_id = resume
+                mapping_types_by_name = dict(
+                    (cls.get_mapping_type_name(), cls)
+                    for cls in get_mapping_types(mapping_types))
+                jobs = [
+                    (batch_id, rec_id,
+                     to_class_path(mapping_types_by_name[name]),
+                     first_id, last_id, None)
+                    for rec_id, name, first_id, last_id in resume_chunks]
+                log.info('resuming batch %s: %s chunks to index....',
+                         batch_id, len(jobs))
 
-            if total == 0:
-                continue
-
-            chunk_start_time = time.time()
-            log.info('reindexing %s. %s to index....',
-                     cls.get_mapping_type_name(), total)
-
-            i = 0
-            for chunk in chunked(indexable, 1000):
-                chunk_start_time = time.time()
-                index_chunk(cls, chunk)
+            else:
+                batch_id = create_batch_id()
+                jobs = []
+                for cls, indexable in all_indexable:
+                    new_index = new_indexes.get(cls.get_index_group())
+                    for chunk in chunked(indexable, REINDEX_CHUNK_SIZE):
+                        rec = Record.objects.create(
+                            batch_id=batch_id,
+                            name=chunk_record_name(cls, chunk, new_index))
+                        jobs.append((batch_id, rec.id, to_class_path(cls),
+                                     chunk[0], chunk[-1], new_index))
+                log.info('reindexing batch %s: %s chunks to index with %s '
+                         'workers....', batch_id, len(jobs), workers)
+
+            failed = _reindex_with_workers(jobs, max(workers, 1), log=log)
+            if failed and not into_new:
+                log.error('%s chunks failed. Resume them with --resume=%s',
+                          failed, batch_id)
+            elif failed:
+                log.error('%s chunks failed.', failed)
 
-                i += len(chunk)
-                time_to_go = (total - i) * ((time.time() - cls_start_time) / i)
-                per_1000 = (time.time() - cls_start_time) / (i / 1000.0)
-                this_1000 = time.time() - chunk_start_time
+        else:
+            for cls, indexable in all_indexable:
+                cls_start_time = time.time()
+                total = len(indexable)
 
-                log.info('   %s/%s %s... (%s/1000 avg, %s ETA)',
-                         i,
-                         total,
-                         format_time(this_1000),
-                         format_time(per_1000),
-                         format_time(time_to_go))
+                if total == 0:
+                    continue
 
-            delta_time = time.time() - cls_start_time
-            log.info('   done! (%s total, %s/1000 avg)',
-                     format_time(delta_time),
-                     format_time(delta_time / (total / 1000.0)))
+                chunk_start_time = time.time()
+                log.info('reindexing %s. %s to index....',
+                         cls.get_mapping_type_name(), total)
+
+                i = 0
+                indexed = 0
+                total_bytes = 0
+                for chunk in chunked(indexable, REINDEX_CHUNK_SIZE):
+                    chunk_start_time = time.time()
+                    count, nbytes = index_chunk(
+                        cls, chunk,
+                        index=new_indexes.get(cls.get_index_group()))
+
+                    i += len(chunk)
+                    indexed += count
+                    total_bytes += nbytes
+                    elapsed = time.time() - cls_start_time
+                    time_to_go = (total - i) * (elapsed / i)
+                    per_1000 = elapsed / (i / 1000.0)
+                    this_1000 = time.time() - chunk_start_time
+
+                    log.info('   %s/%s %s... (%s/1000 avg, %d docs/s, '
+                             '%s/s, batches of %s, %s ETA)',
+                             i,
+                             total,
+                             format_time(this_1000),
+                             format_time(per_1000),
+                             indexed / elapsed if elapsed else 0,
+                             format_size(
+                                 total_bytes / elapsed if elapsed else 0),
+                             get_batch_size(cls).size,
+                             format_time(time_to_go))
+
+                delta_time = time.time() - cls_start_time
+                log.info('   done! (%s total, %s/1000 avg, %s sent)',
+                         format_time(delta_time),
+                         format_time(delta_time / (total / 1000.0)),
+                         format_size(total_bytes))
+
+        if new_indexes and failed:
+            log.error('Not swapping in the new indexes. They stay around '
+                      'as %s. Run esreindex --into-new again.',
+                      ', '.join(sorted(new_indexes.values())))
+
+        elif new_indexes:
+            # Catch the new indexes up with what changed while they
+            # were being built. Things keep changing while we do that,
+            # so go around until it settles down.
+            for i in range(MAX_REPLAY_PASSES):
+                replayed = _replay_rebuild_journal(new_indexes)
+                log.info('replayed %s live indexing updates', replayed)
+                if replayed <= REPLAY_SETTLED:
+                    break
+
+            for group, index in sorted(new_indexes.items()):
+                old_indexes = swap_index_alias(es, group, index, log=log)
+                log.info('%s now points to %s', read_index(group), index)
+                for old_index in old_indexes:
+                    log.info('   %s is no longer used. Delete it with '
+                             'esdelete when you\'re happy.', old_index)
+
+            # Get the updates that came in right before the swap. From
+            # here on, live indexing goes to the new indexes.
+            _replay_rebuild_journal(new_indexes)
 
         delta_time = time.time() - start_time
         log.info('done! (%s total)', format_time(delta_time))
@@ -576,6 +1277,20 @@ def es_reindex_cmd(percent=100, delete=False, mapping_types=None,
                 index=index,
                 body={'index': {'refresh_interval': old_refresh}})
 
+        if into_new:
+            try:
+                stop_rebuild_journal()
+            except RedisError as exc:
+                log.error('Unable to stop journaling live indexing '
+                          'updates: %s', exc)
+
+            # Chunks of the new indexes can't be resumed, so don't leave
+            # them outstanding to hold up the next reindex.
+            if batch_id is not None:
+                for rec in (Record.objects.outstanding()
+                                          .filter(batch_id=batch_id)):
+                    rec.mark_fail('Abandoned with the new indexes.')
+
 
 def es_delete_cmd(index, noinput=False, log=log):
     """Deletes an index"""
@@ -590,7 +1305,7 @@ def es_delete_cmd(index, noinput=False, log=log):
         log.error('Index "%s" is not a valid index.', index)
         return
 
-    if index in all_read_indexes() and not noinput:
+    if index in with_alias_indexes(all_read_indexes()) and not noinput:
         ret = raw_input('"%s" is a read index. Are you sure you want '
                         'to delete it? (yes/no) ' % index)
         if ret != 'yes':
@@ -649,12 +1364,14 @@ def es_status_cmd(checkindex=False, log=log):
     log.info('Index stats:')
 
     if indexes:
+        read_indexes = with_alias_indexes(all_read_indexes())
+        write_indexes = with_alias_indexes(all_write_indexes())
         log.info('  List of indexes:')
         for name, count in sorted(indexes):
             read_write = []
-            if name in all_read_indexes():
+            if name in read_indexes:
                 read_write.append('READ')
-            if name in all_write_indexes():
+            if name in write_indexes:
                 read_write.append('WRITE')
             log.info('    %-22s: %s %s', name, count,
                      '/'.join(read_write))
@@ -19,6 +19,12 @@ class Command(BaseCommand):
                     help='Comma-separated list of mapping types to index'),
         make_option('--criticalmass', action='store_true', dest='criticalmass',
                     help='Indexes a critical mass of things'),
+        make_option('--workers', type='int', dest='workers', default=1,
+                    help='Number of worker processes to index with'),
+        make_option('--resume', type='string', dest='resume', default=None,
+                    help='Batch id of a failed reindex to resume'),
+        make_option('--into-new', action='store_true', dest='into_new',
+                    help='Builds new indexes and swaps them in when done'),
         )
 
     # We (ab)use override_settings to force ES_LIVE_INDEXING for the
@@ -29,6 +35,9 @@ class Command(BaseCommand):
         delete = options['delete']
         mapping_types = options['mapping_types']
         criticalmass = options['criticalmass']
+        workers = options['workers']
+        resume = options['resume']
+        into_new = options['into_new']
         if mapping_types:
             mapping_types = mapping_types.split(',')
         if not 1 <= percent <= 100:
@@ -38,10 +47,24 @@ class Command(BaseCommand):
         if mapping_types and criticalmass:
             raise CommandError(
                 'you can\'t specify criticalmass and mapping_types')
+        if workers < 1:
+            raise CommandError('workers should be at least 1')
+        if resume and (delete or criticalmass or mapping_types or
+                       percent < 100):
+            raise CommandError(
+                'you can\'t specify resume with anything but workers')
+        if into_new and (delete or criticalmass or resume or
+                         percent < 100):
+            raise CommandError(
+                'you can\'t specify into-new with delete, criticalmass, '
+                'resume or percent')
 
         es_reindex_cmd(
             percent=percent,
             delete=delete,
             mapping_types=mapping_types,
             criticalmass=criticalmass,
+            workers=workers,
+            resume=resume,
+            into_new=into_new,
             log=FakeLogger(self.stdout))
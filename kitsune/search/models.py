@@ -1,5 +1,6 @@
 import datetime
 import logging
+from collections import OrderedDict
 from threading import local
 
 from django.conf import settings
@@ -10,9 +11,15 @@ from django.dispatch import receiver
 
 from elasticutils.contrib.django import MappingType, Indexable, MLT
 from elasticsearch.exceptions import NotFoundError
+from elasticsearch.helpers import BulkIndexError, bulk
+from statsd import statsd
 
 from kitsune.search import es_utils
-from kitsune.search.tasks import index_task, unindex_task
+from kitsune.search.es_utils import UnindexMeBro
+from kitsune.search.tasks import (
+    INDEX, UNINDEX, add_to_outbox, group_updates, index_task,
+    journal_for_rebuild, unindex_task)
+from kitsune.sumo.redis_utils import RedisError
 from kitsune.sumo.models import ModelBase
 
 log = logging.getLogger('k.search.es')
@@ -34,15 +41,21 @@ def get_mapping_types(mapping_types=None):
     return values
 
 
-# Holds a threadlocal set of indexing tasks to be filed after the request.
+# Holds the threadlocal pending indexing updates to be filed after the
+# request.
 _local = local()
 
 
-def _local_tasks():
-    """(Create and) return the threadlocal set of indexing tasks."""
-    if getattr(_local, 'tasks', None) is None:
-        _local.tasks = set()
-    return _local.tasks
+def _local_updates():
+    """(Create and) return the threadlocal pending indexing updates.
+
+    This maps (mapping type, id) to the action to take. Later actions
+    for the same object replace earlier ones.
+
+    """
+    if getattr(_local, 'updates', None) is None:
+        _local.updates = OrderedDict()
+    return _local.updates
 
 
 class SearchMixin(object):
@@ -67,13 +80,11 @@ class SearchMixin(object):
 
     def index_later(self):
         """Register myself to be indexed at the end of the request."""
-        _local_tasks().add((index_task.delay,
-                           (self.get_mapping_type(), (self.pk,))))
+        _local_updates()[(self.get_mapping_type(), self.pk)] = INDEX
 
     def unindex_later(self):
         """Register myself to be unindexed at the end of the request."""
-        _local_tasks().add((unindex_task.delay,
-                           (self.get_mapping_type(), (self.pk,))))
+        _local_updates()[(self.get_mapping_type(), self.pk)] = UNINDEX
 
 
 class SearchMappingType(MappingType, Indexable):
@@ -125,6 +136,32 @@ class SearchMappingType(MappingType, Indexable):
         return cls.get_model().objects.order_by('pk').values_list(
             'pk', flat=True)
 
+    @classmethod
+    def extract_documents(cls, ids):
+        """Extracts indexable attributes for a batch of ids.
+
+        Returns a list of ``(id, document)`` tuples. The document is
+        None for ids that should be removed from the index (that's the
+        batch version of extract_document raising UnindexMeBro). Ids
+        that aren't in the db anymore are left out.
+
+        By default, this calls extract_document once per id.
+        Subclasses whose extract_document costs several queries per
+        id should override this and load the whole batch with a fixed
+        number of queries.
+
+        """
+        model = cls.get_model()
+        ret = []
+        for id_ in ids:
+            try:
+                ret.append((id_, cls.extract_document(id_)))
+            except UnindexMeBro:
+                ret.append((id_, None))
+            except model.DoesNotExist:
+                pass
+        return ret
+
     @classmethod
     def reshape(cls, results):
         """Reshapes the results so lists are lists and everything is not"""
@@ -162,12 +199,89 @@ class SearchMappingType(MappingType, Indexable):
             # not there.
             pass
 
+    @classmethod
+    def bulk_unindex(cls, ids, es=None, index=None):
+        """Removes a batch of items from the index in one bulk request."""
+        if not settings.ES_LIVE_INDEXING:
+            return
+
+        if es is None:
+            es = cls.get_es()
+
+        if index is None:
+            index = cls.get_index()
+
+        actions = [{'_op_type': 'delete',
+                    '_index': index,
+                    '_type': cls.get_mapping_type_name(),
+                    '_id': id_}
+                   for id_ in ids]
+
+        # Ignore the case where we try to delete something that's not
+        # there. bulk raises on any error by default, so collect them.
+        success, errors = bulk(es, actions, raise_on_error=False)
+        _raise_for_bulk_errors(errors, 'delete')
+
+    @classmethod
+    def update_fields(cls, ids, fields, es=None, index=None):
+        """Partially updates documents in the index.
+
+        Sets the same fields on the documents for all the ids. Use this
+        instead of reindexing when only some derived fields changed.
+
+        :arg ids: ids of the documents to update
+        :arg fields: dict of field -> value to set
+
+        """
+        cls.bulk_update_fields(dict((id_, fields) for id_ in ids),
+                               es=es, index=index)
+
+    @classmethod
+    def bulk_update_fields(cls, updates, es=None, index=None):
+        """Partially updates documents in the index in one bulk request.
+
+        :arg updates: dict of id -> dict of field -> value to set on
+            the document with that id
+
+        """
+        if not settings.ES_LIVE_INDEXING or not updates:
+            return
+
+        if es is None:
+            es = cls.get_es()
+
+        if index is None:
+            index = cls.get_index()
+
+        journal_for_rebuild([(cls, id_, INDEX) for id_ in updates])
+
+        actions = [{'_op_type': 'update',
+                    '_index': index,
+                    '_type': cls.get_mapping_type_name(),
+                    '_id': id_,
+                    'doc': fields}
+                   for id_, fields in updates.items()]
+
+        # Documents that aren't in the index can't be updated. They'll
+        # get the new values whenever they do get indexed, so that's
+        # fine. bulk raises on any error by default, so collect them.
+        success, errors = bulk(es, actions, raise_on_error=False)
+        _raise_for_bulk_errors(errors, 'update')
+
     @classmethod
     def morelikethis(cls, id_, s, fields):
         """MoreLikeThis API"""
         return list(MLT(id_, s, fields, min_term_freq=1, min_doc_freq=1))
 
 
+def _raise_for_bulk_errors(errors, op_type):
+    """Raises BulkIndexError for errors other than missing documents."""
+    for error in errors:
+        if error[op_type].get('status') != 404:
+            raise BulkIndexError(
+                'Unable to %s documents.' % op_type, errors)
+
+
 def _identity(s):
     return s
 
@@ -270,20 +384,51 @@ def register_mapping_type(cls):
     return cls
 
 
+def file_updates(updates):
+    """Files index_task and unindex_task for a list of updates.
+
+    :arg updates: list of (mapping type, id, action) tuples
+
+    This files one task per mapping type and action.
+
+    """
+    for (cls, action), ids in group_updates(updates).items():
+        if action == INDEX:
+            index_task.delay(cls, ids)
+        else:
+            unindex_task.delay(cls, ids)
+
+
 def generate_tasks(**kwargs):
-    """Goes through thread local index update tasks set and generates
-    celery tasks for all tasks in the set.
+    """Files the thread local pending indexing updates.
 
-    Because this works off of a set, it naturally de-dupes the tasks,
-    so if four tasks get tossed into the set that are identical, we
-    execute it only once.
+    Because the updates are keyed by object, this naturally de-dupes
+    them, so if an object gets saved four times, we index it only
+    once. If it gets saved and then deleted, we only unindex it.
+
+    If ``settings.ES_LIVE_INDEXING_DELAY`` is set, the updates go into
+    the indexing outbox where they get merged with updates from other
+    requests and bulk indexed after the delay. Otherwise, or if redis
+    is unavailable, this files indexing tasks right away.
 
     """
-    tasks = _local_tasks()
-    for fun, args in tasks:
-        fun(*args)
+    updates = _local_updates()
+    if not updates:
+        return
+
+    updates_list = [(cls, id_, action)
+                    for (cls, id_), action in updates.items()]
+    updates.clear()
+
+    if settings.ES_LIVE_INDEXING and settings.ES_LIVE_INDEXING_DELAY:
+        try:
+            add_to_outbox(updates_list)
+            return
+        except RedisError as exc:
+            statsd.incr('redis.error')
+            log.error('Redis error: %s', exc)
 
-    tasks.clear()
+    file_updates(updates_list)
 
 
 signals.request_finished.connect(generate_tasks)
@@ -3,13 +3,17 @@ import logging
 import sys
 import traceback
 
+from django.conf import settings
+
 from celery import task
 from multidb.pinning import pin_this_thread, unpin_this_thread
+from redis import ConnectionError
 from statsd import statsd
 
 from kitsune.search.es_utils import index_chunk, UnindexMeBro, write_index, get_analysis
 from kitsune.search.utils import from_class_path
 from kitsune.sumo.decorators import timeit
+from kitsune.sumo.redis_utils import redis_client, RedisError
 
 from elasticutils.contrib.django import get_es
 
@@ -21,6 +25,31 @@ OUTSTANDING_INDEX_CHUNKS = 'search:outstanding_index_chunks'
 
 CHUNK_SIZE = 50000
 
+# Live indexing actions.
+INDEX = 'index'
+UNINDEX = 'unindex'
+
+# Redis hash of live indexing updates waiting to be bulk indexed. The
+# fields are "<mapping type name>:<id>" and the values are actions, so
+# the latest update to an object replaces earlier ones.
+OUTBOX_KEY = 'search:outbox'
+
+# Exists while a flush of the outbox is scheduled.
+OUTBOX_FLUSH_KEY = 'search:outbox:flush'
+
+# Exists while ``esreindex --into-new`` is building new indexes.
+REBUILD_KEY = 'search:rebuild'
+
+# Redis hash of live indexing updates that happened while building new
+# indexes. Same format as the outbox. They get replayed into the new
+# indexes before they go live.
+REBUILD_JOURNAL_KEY = 'search:rebuild:journal'
+
+# How long a rebuild can take before we stop journaling updates for
+# it. This is in case the rebuild dies without cleaning up after
+# itself.
+REBUILD_TIMEOUT = 24 * 60 * 60
+
 log = logging.getLogger('k.task')
 
 
@@ -58,6 +87,8 @@ def index_chunk_task(write_index, batch_id, rec_id, chunk):
     :arg batch_id: the name for the batch this chunk belongs to
     :arg rec_id: the id for the record for this task
     :arg chunk: a (class, id_list) of things to index
+
+    :returns: (number of documents indexed, number of bytes sent)
     """
     cls_path, id_list = chunk
     cls = from_class_path(cls_path)
@@ -77,7 +108,7 @@ def index_chunk_task(write_index, batch_id, rec_id, chunk):
         rec.status = Record.STATUS_IN_PROGRESS
         rec.save()
 
-        index_chunk(cls, id_list, reraise=True)
+        stats = index_chunk(cls, id_list, reraise=True, index=write_index)
         rec.mark_success()
 
     except Exception:
@@ -92,6 +123,8 @@ def index_chunk_task(write_index, batch_id, rec_id, chunk):
     finally:
         unpin_this_thread()
 
+    return stats
+
 
 # Note: If you reduce the length of RETRY_TIMES, it affects all tasks
 # currently in the celery queue---they'll throw an IndexError.
@@ -110,6 +143,7 @@ MAX_RETRIES = len(RETRY_TIMES)
 def index_task(cls, id_list, **kw):
     """Index documents specified by cls and ids"""
     statsd.incr('search.tasks.index_task.%s' % cls.get_mapping_type_name())
+    journal_for_rebuild([(cls, id_, INDEX) for id_ in id_list])
     try:
         # Pin to master db to avoid replication lag issues and stale
         # data.
@@ -147,6 +181,7 @@ def index_task(cls, id_list, **kw):
 def unindex_task(cls, id_list, **kw):
     """Unindex documents specified by cls and ids"""
     statsd.incr('search.tasks.unindex_task.%s' % cls.get_mapping_type_name())
+    journal_for_rebuild([(cls, id_, UNINDEX) for id_ in id_list])
     try:
         # Pin to master db to avoid replication lag issues and stale
         # data.
@@ -170,6 +205,228 @@ def unindex_task(cls, id_list, **kw):
         unpin_this_thread()
 
 
+@task()
+@timeit
+def update_fields_task(cls, updates, **kw):
+    """Partially update documents specified by cls and ids
+
+    :arg updates: dict of id -> dict of field -> value
+
+    """
+    statsd.incr('search.tasks.update_fields_task.%s' %
+                cls.get_mapping_type_name())
+    try:
+        cls.bulk_update_fields(updates)
+    except Exception as exc:
+        retries = update_fields_task.request.retries
+        if retries >= MAX_RETRIES:
+            # Some exceptions aren't pickleable and we need this to
+            # throw things that are pickleable.
+            raise IndexingTaskError()
+
+        statsd.incr('search.tasks.update_fields_task.retry', 1)
+        statsd.incr('search.tasks.update_fields_task.retry%d' %
+                    RETRY_TIMES[retries], 1)
+
+        update_fields_task.retry(exc=exc, max_retries=MAX_RETRIES,
+                                 countdown=RETRY_TIMES[retries])
+
+
+def group_updates(updates):
+    """Groups live indexing updates by mapping type and action.
+
+    :arg updates: list of (mapping type, id, action) tuples
+
+    :returns: dict of (mapping type, action) -> list of ids
+
+    """
+    grouped = {}
+    for cls, id_, action in updates:
+        grouped.setdefault((cls, action), []).append(id_)
+    return grouped
+
+
+def add_to_outbox(updates):
+    """Adds live indexing updates to the indexing outbox.
+
+    Updates sit in the outbox for ``settings.ES_LIVE_INDEXING_DELAY``
+    seconds. Then flush_outbox_task bulk indexes everything that's
+    collected by then.
+
+    :arg updates: list of (mapping type, id, action) tuples
+
+    :throws RedisError: if redis is unavailable
+
+    """
+    delay = settings.ES_LIVE_INDEXING_DELAY
+    redis = redis_client('default')
+    try:
+        redis.hmset(OUTBOX_KEY, _updates_hash(updates))
+
+        # The first update since the last flush schedules the next
+        # one. The key expires on its own in case the task gets lost.
+        if redis.setnx(OUTBOX_FLUSH_KEY, 1):
+            redis.expire(OUTBOX_FLUSH_KEY, delay * 10)
+            flush_outbox_task.apply_async(countdown=delay)
+    except ConnectionError:
+        raise RedisError('Unable to add to the indexing outbox.')
+
+
+def _updates_hash(updates):
+    """Converts updates to a redis hash of "<name>:<id>" -> action."""
+    return dict(
+        ('%s:%s' % (cls.get_mapping_type_name(), id_), action)
+        for cls, id_, action in updates)
+
+
+def _updates_from_hash(hash_):
+    """Converts a redis hash from ``_updates_hash`` back to updates."""
+    # Need to import this here to prevent circular import
+    from kitsune.search.models import get_mapping_types
+
+    updates = []
+    for key, action in hash_.items():
+        name, id_ = key.rsplit(':', 1)
+        try:
+            cls = get_mapping_types([name])[0]
+        except KeyError:
+            log.error('Unknown mapping type in indexing updates: %s', name)
+            continue
+        updates.append((cls, int(id_), action))
+    return updates
+
+
+def start_rebuild_journal():
+    """Starts journaling live indexing updates for a rebuild.
+
+    :throws RedisError: if redis is unavailable
+
+    """
+    redis = redis_client('default')
+    try:
+        pipe = redis.pipeline()
+        pipe.delete(REBUILD_JOURNAL_KEY)
+        pipe.set(REBUILD_KEY, 1)
+        pipe.expire(REBUILD_KEY, REBUILD_TIMEOUT)
+        pipe.execute()
+    except ConnectionError:
+        raise RedisError('Unable to start the rebuild journal.')
+
+
+def stop_rebuild_journal():
+    """Stops journaling live indexing updates and drops the journal.
+
+    :throws RedisError: if redis is unavailable
+
+    """
+    redis = redis_client('default')
+    try:
+        redis.delete(REBUILD_KEY, REBUILD_JOURNAL_KEY)
+    except ConnectionError:
+        raise RedisError('Unable to stop the rebuild journal.')
+
+
+def add_to_rebuild_journal(updates):
+    """Journals live indexing updates if a rebuild is in progress.
+
+    :arg updates: list of (mapping type, id, action) tuples
+
+    :throws RedisError: if redis is unavailable
+
+    """
+    redis = redis_client('default')
+    try:
+        if redis.exists(REBUILD_KEY):
+            redis.hmset(REBUILD_JOURNAL_KEY, _updates_hash(updates))
+    except ConnectionError:
+        raise RedisError('Unable to add to the rebuild journal.')
+
+
+def journal_for_rebuild(updates):
+    """Journals live indexing updates for a rebuild in progress.
+
+    ``esreindex --into-new`` replays these into the new indexes before
+    swapping them in, so they don't miss anything that changed while
+    they were being built. Everything that writes to the live indexes
+    calls this: the indexing tasks, the outbox flush and
+    ``SearchMappingType.bulk_update_fields``.
+
+    :arg updates: list of (mapping type, id, action) tuples
+
+    """
+    try:
+        add_to_rebuild_journal(updates)
+    except RedisError as exc:
+        statsd.incr('redis.error')
+        log.error('Redis error: %s', exc)
+
+
+def take_rebuild_journal():
+    """Empties the rebuild journal.
+
+    :returns: list of (mapping type, id, action) tuples that were in
+        the journal
+
+    :throws RedisError: if redis is unavailable
+
+    """
+    redis = redis_client('default')
+    try:
+        pipe = redis.pipeline()
+        pipe.hgetall(REBUILD_JOURNAL_KEY)
+        pipe.delete(REBUILD_JOURNAL_KEY)
+        journal = pipe.execute()[0]
+    except ConnectionError:
+        raise RedisError('Unable to read the rebuild journal.')
+
+    return _updates_from_hash(journal)
+
+
+@task()
+@timeit
+def flush_outbox_task():
+    """Bulk indexes everything in the indexing outbox"""
+    # Need to import this here to prevent circular import
+    from kitsune.search.models import file_updates
+
+    redis = redis_client('default')
+
+    # Take everything out of the outbox in one go. Updates that come
+    # in after this go into a fresh outbox and schedule another flush.
+    pipe = redis.pipeline()
+    pipe.hgetall(OUTBOX_KEY)
+    pipe.delete(OUTBOX_KEY)
+    pipe.delete(OUTBOX_FLUSH_KEY)
+    outbox = pipe.execute()[0]
+
+    updates = _updates_from_hash(outbox)
+    if not updates or not settings.ES_LIVE_INDEXING:
+        return
+
+    journal_for_rebuild(updates)
+
+    statsd.incr('search.tasks.flush_outbox_task.updates', len(updates))
+    try:
+        # Pin to master db to avoid replication lag issues and stale
+        # data.
+        pin_this_thread()
+
+        for (cls, action), ids in group_updates(updates).items():
+            if action == INDEX:
+                index_chunk(cls, ids, reraise=True)
+            else:
+                cls.bulk_unindex(ids)
+
+    except Exception:
+        log.exception('Error while flushing the indexing outbox')
+        # Hand everything over to the indexing tasks. They know how
+        # to retry when ES is having a bad day.
+        file_updates(updates)
+
+    finally:
+        unpin_this_thread()
+
+
 @task()
 @timeit
 def update_synonyms_task():
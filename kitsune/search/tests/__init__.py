@@ -4,6 +4,7 @@ from django.test.utils import override_settings
 
 import factory
 from elasticutils.contrib.django import get_es
+from nose.tools import eq_
 
 from kitsune.search import es_utils
 from kitsune.search.models import generate_tasks, Synonym
@@ -76,6 +77,37 @@ class ElasticTestCase(TestCase):
             es_utils.delete_index(index)
 
 
+class ExtractDocumentsTestCase(TestCase):
+    """Base class for testing the bulk extract_documents of mapping types"""
+
+    def assert_extract_documents(self, mapping_type, ids, num_queries,
+                                 skipped=()):
+        """Checks extract_documents matches extract_document for ids.
+
+        The documents get extracted in num_queries queries. The ones in
+        skipped shouldn't get indexed, so they're extracted as None.
+        Everything else matches extract_document, apart from when it was
+        indexed.
+
+        Returns a dict of id -> extracted document.
+
+        """
+        ids = list(ids) + list(skipped)
+        with self.assertNumQueries(num_queries):
+            extracted = dict(mapping_type.extract_documents(ids))
+
+        for id_ in ids:
+            if id_ in skipped:
+                eq_(None, extracted[id_])
+                continue
+            doc = dict(mapping_type.extract_document(id_))
+            bulk_doc = dict(extracted[id_])
+            del doc['indexed_on']
+            del bulk_doc['indexed_on']
+            eq_(doc, bulk_doc)
+        return extracted
+
+
 class SynonymFactory(factory.DjangoModelFactory):
     class Meta:
         model = Synonym
@@ -1,11 +1,16 @@
 from django.core.management import call_command
 
 import mock
+from elasticutils.contrib.django import get_es
+from nose.tools import eq_
 
 from kitsune.products.tests import ProductFactory
 from kitsune.search import es_utils
+from kitsune.search.models import Record
 from kitsune.search.tests import ElasticTestCase
 from kitsune.search.utils import FakeLogger
+from kitsune.sumo.tests import TestCase
+from kitsune.wiki.models import DocumentMappingType
 from kitsune.wiki.tests import DocumentFactory, RevisionFactory
 
 
@@ -37,6 +42,102 @@ class ESCommandTests(ElasticTestCase):
         call_command('esreindex', '--mapping_types=wiki_documents')
         call_command('esreindex', '--delete')
 
+    @mock.patch.object(es_utils, '_reindex_with_workers')
+    @mock.patch.object(FakeLogger, '_out')
+    def test_reindex_workers(self, _out, reindex_with_workers):
+        reindex_with_workers.return_value = 0
+        doc = DocumentFactory()
+        RevisionFactory(document=doc, is_approved=True)
+
+        call_command('esreindex', '--mapping_types=wiki_document', '--workers=4')
+
+        jobs, workers = reindex_with_workers.call_args[0]
+        eq_(workers, 4)
+        eq_(len(jobs), 1)
+        rec = Record.objects.get(pk=jobs[0][1])
+        eq_(rec.name, es_utils.chunk_record_name(DocumentMappingType, [doc.id]))
+
+    @mock.patch.object(es_utils, '_reindex_with_workers')
+    @mock.patch.object(FakeLogger, '_out')
+    def test_reindex_resume(self, _out, reindex_with_workers):
+        reindex_with_workers.return_value = 0
+        done = Record.objects.create(
+            batch_id='123456', name=u'Indexing: wiki_document 1 -> 10',
+            status=Record.STATUS_SUCCESS)
+        failed = Record.objects.create(
+            batch_id='123456', name=u'Indexing: wiki_document 11 -> 20',
+            status=Record.STATUS_FAIL)
+
+        call_command('esreindex', '--resume=123456')
+
+        jobs = reindex_with_workers.call_args[0][0]
+        eq_([job[1] for job in jobs], [failed.id])
+        assert done.id not in [job[1] for job in jobs]
+
+    @mock.patch.object(es_utils, '_reindex_with_workers')
+    @mock.patch.object(FakeLogger, '_out')
+    def test_reindex_resume_into_new(self, _out, reindex_with_workers):
+        """Batches that built new indexes can't be resumed."""
+        Record.objects.create(
+            batch_id='123456',
+            name=u'Indexing: wiki_document 11 -> 20 into sumo-20160101',
+            status=Record.STATUS_FAIL)
+
+        call_command('esreindex', '--resume=123456')
+
+        eq_(reindex_with_workers.call_count, 0)
+
+    @mock.patch('kitsune.search.tasks.stop_rebuild_journal')
+    @mock.patch('kitsune.search.tasks.take_rebuild_journal')
+    @mock.patch('kitsune.search.tasks.start_rebuild_journal')
+    @mock.patch.object(es_utils, '_reindex_with_workers')
+    @mock.patch.object(FakeLogger, '_out')
+    def test_reindex_into_new_failed(self, _out, reindex_with_workers,
+                                     start_journal, take_journal,
+                                     stop_journal):
+        """A failed into-new run leaves nothing outstanding."""
+        reindex_with_workers.return_value = 1
+        doc = DocumentFactory()
+        RevisionFactory(document=doc, is_approved=True)
+        alias = es_utils.read_index('default')
+        old_indexes = es_utils.get_alias_indexes(get_es(), alias)
+
+        call_command('esreindex', '--into-new',
+                     '--mapping_types=wiki_document', '--workers=4')
+
+        jobs = reindex_with_workers.call_args[0][0]
+        new_index = jobs[0][5]
+        rec = Record.objects.get(pk=jobs[0][1])
+        eq_(es_utils.chunk_record_index(rec.name), new_index)
+        eq_(Record.STATUS_FAIL, rec.status)
+        eq_(0, Record.objects.outstanding().count())
+        # The new index wasn't swapped in.
+        eq_(old_indexes, es_utils.get_alias_indexes(get_es(), alias))
+        get_es().indices.delete(index=new_index, ignore=[404])
+
+    @mock.patch('kitsune.search.tasks.stop_rebuild_journal')
+    @mock.patch('kitsune.search.tasks.take_rebuild_journal')
+    @mock.patch('kitsune.search.tasks.start_rebuild_journal')
+    @mock.patch.object(FakeLogger, '_out')
+    def test_reindex_into_new(self, _out, start_journal, take_journal,
+                              stop_journal):
+        take_journal.return_value = []
+        doc = DocumentFactory()
+        RevisionFactory(document=doc, is_approved=True)
+
+        call_command('esreindex', '--into-new',
+                     '--mapping_types=wiki_document')
+
+        alias = es_utils.read_index('default')
+        new_indexes = es_utils.get_alias_indexes(get_es(), alias)
+        eq_(len(new_indexes), 1)
+        assert new_indexes[0].startswith(alias + '-')
+
+        self.refresh(run_tasks=False)
+        eq_(DocumentMappingType.search().count(), 1)
+        assert start_journal.called
+        assert stop_journal.called
+
     @mock.patch.object(FakeLogger, '_out')
     def test_status(self, _out):
         p = ProductFactory(title=u'firefox', slug=u'desktop')
@@ -55,3 +156,22 @@ class ESCommandTests(ElasticTestCase):
         indexes.append('cupcakerainbow_index')
         for index in indexes:
             call_command('esdelete', index, noinput=True)
+
+
+class ChunkRecordNameTests(TestCase):
+    def test_round_trip(self):
+        name = es_utils.chunk_record_name(DocumentMappingType, [5, 6, 7])
+        eq_(name, u'Indexing: wiki_document 5 -> 7')
+        eq_(es_utils.parse_chunk_record_name(name), ('wiki_document', 5, 7))
+
+    def test_into_new_index(self):
+        name = es_utils.chunk_record_name(
+            DocumentMappingType, [5, 6, 7], 'sumo-20160101')
+        eq_(name, u'Indexing: wiki_document 5 -> 7 into sumo-20160101')
+        eq_(es_utils.parse_chunk_record_name(name), ('wiki_document', 5, 7))
+        eq_(es_utils.chunk_record_index(name), 'sumo-20160101')
+        eq_(es_utils.chunk_record_index(
+            es_utils.chunk_record_name(DocumentMappingType, [5])), None)
+
+    def test_not_a_chunk(self):
+        eq_(es_utils.parse_chunk_record_name(u'something else'), None)
@@ -3,15 +3,23 @@ import json
 import unittest
 
 from django.contrib.sites.models import Site
+from django.test.utils import override_settings
 
 import mock
+from elasticsearch.helpers import BulkIndexError
+from nose import SkipTest
 from nose.tools import eq_
 
 from kitsune.questions.models import QuestionMappingType
 from kitsune.questions.tests import QuestionFactory, AnswerFactory, AnswerVoteFactory
-from kitsune.search import es_utils
+from kitsune.search import es_utils, models as search_models
+from kitsune.search import tasks as search_tasks
 from kitsune.search.models import generate_tasks
+from kitsune.search.tasks import (
+    INDEX, UNINDEX, flush_outbox_task, group_updates)
 from kitsune.search.tests import ElasticTestCase
+from kitsune.sumo.redis_utils import redis_client, RedisError
+from kitsune.sumo.tests import TestCase
 from kitsune.sumo.urlresolvers import reverse
 from kitsune.wiki.models import DocumentMappingType
 from kitsune.wiki.tests import DocumentFactory, ApprovedRevisionFactory
@@ -63,6 +71,57 @@ class TestUtils(ElasticTestCase):
         docs = es_utils.get_documents(QuestionMappingType, [q.id])
         eq_(docs[0]['id'], q.id)
 
+    def test_indexable_ids(self):
+        ids = sorted(QuestionFactory().id for i in range(5))
+        indexable = QuestionMappingType.get_indexable()
+
+        eq_(list(es_utils.IndexableIds(indexable, batch_size=2)), ids)
+        eq_(len(es_utils.IndexableIds(indexable, batch_size=2)), 5)
+        eq_(list(es_utils.IndexableIds(indexable, limit=3, batch_size=2)),
+            ids[:3])
+
+    def test_indexable_ids_newest(self):
+        ids = sorted(QuestionFactory().id for i in range(5))
+        indexable = QuestionMappingType.get_indexable()
+
+        newest = es_utils.IndexableIds(
+            indexable, limit=3, newest=True, batch_size=2)
+        eq_(list(newest), list(reversed(ids))[:3])
+        eq_(len(newest), 3)
+
+    def test_update_fields(self):
+        q1 = QuestionFactory(title=u'foo')
+        q2 = QuestionFactory()
+        self.refresh()
+
+        QuestionMappingType.update_fields(
+            [q1.id, q2.id], {'question_num_votes_past_week': 42})
+        # Missing documents are skipped.
+        QuestionMappingType.update_fields(
+            [q2.id + 1000], {'question_num_votes_past_week': 1})
+        self.refresh()
+
+        docs = es_utils.get_documents(QuestionMappingType, [q1.id, q2.id])
+        eq_([d['question_num_votes_past_week'] for d in docs], [42, 42])
+        # Other fields are left alone.
+        eq_(es_utils.get_documents(
+            QuestionMappingType, [q1.id])[0]['question_title'], u'foo')
+
+    def test_bulk_update_fields(self):
+        q1 = QuestionFactory()
+        q2 = QuestionFactory()
+        self.refresh()
+
+        QuestionMappingType.bulk_update_fields({
+            q1.id: {'question_num_votes_past_week': 1},
+            q2.id: {'question_num_votes_past_week': 2}})
+        self.refresh()
+
+        docs = es_utils.get_documents(QuestionMappingType, [q1.id, q2.id])
+        eq_(sorted((d['id'], d['question_num_votes_past_week'])
+                   for d in docs),
+            [(q1.id, 1), (q2.id, 2)])
+
 
 class TestTasks(ElasticTestCase):
     @mock.patch.object(QuestionMappingType, 'index')
@@ -97,6 +156,173 @@ class TestTasks(ElasticTestCase):
 
         eq_(index_fun.call_count, 1)
 
+    @mock.patch.object(QuestionMappingType, 'unindex')
+    @mock.patch.object(QuestionMappingType, 'index')
+    def test_tasks_latest_wins(self, index_fun, unindex_fun):
+        """Tests that the latest update to an object wins"""
+        q = QuestionFactory()
+
+        q.index_later()
+        q.unindex_later()
+        generate_tasks()
+
+        eq_(index_fun.call_count, 0)
+        eq_(unindex_fun.call_count, 1)
+
+    @override_settings(ES_LIVE_INDEXING_DELAY=5)
+    @mock.patch.object(search_models, 'add_to_outbox')
+    def test_tasks_outbox(self, add_to_outbox):
+        """Tests that updates go into the outbox when there's a delay"""
+        q1 = QuestionFactory()
+        q2 = QuestionFactory()
+        generate_tasks()
+        add_to_outbox.reset_mock()
+
+        q1.index_later()
+        q2.index_later()
+        q1.unindex_later()
+        generate_tasks()
+
+        eq_(add_to_outbox.call_count, 1)
+        eq_(sorted(add_to_outbox.call_args[0][0]),
+            sorted([(QuestionMappingType, q1.id, UNINDEX),
+                    (QuestionMappingType, q2.id, INDEX)]))
+
+    def test_group_updates(self):
+        updates = [(QuestionMappingType, 1, INDEX),
+                   (QuestionMappingType, 2, UNINDEX),
+                   (QuestionMappingType, 3, INDEX),
+                   (DocumentMappingType, 1, INDEX)]
+        eq_(group_updates(updates), {
+            (QuestionMappingType, INDEX): [1, 3],
+            (QuestionMappingType, UNINDEX): [2],
+            (DocumentMappingType, INDEX): [1],
+        })
+
+
+class TestRebuildJournal(TestCase):
+    """Every write to the live indexes is journaled for rebuilds."""
+
+    @mock.patch.object(QuestionMappingType, 'index')
+    @mock.patch.object(search_tasks, 'add_to_rebuild_journal')
+    def test_index_task(self, add_to_rebuild_journal, index):
+        q = QuestionFactory()
+        add_to_rebuild_journal.reset_mock()
+
+        search_tasks.index_task(QuestionMappingType, [q.id])
+
+        add_to_rebuild_journal.assert_called_once_with(
+            [(QuestionMappingType, q.id, INDEX)])
+
+    @mock.patch.object(QuestionMappingType, 'unindex')
+    @mock.patch.object(search_tasks, 'add_to_rebuild_journal')
+    def test_unindex_task(self, add_to_rebuild_journal, unindex):
+        search_tasks.unindex_task(QuestionMappingType, [1, 2])
+
+        add_to_rebuild_journal.assert_called_once_with(
+            [(QuestionMappingType, 1, UNINDEX),
+             (QuestionMappingType, 2, UNINDEX)])
+
+    @mock.patch.object(search_tasks, 'add_to_rebuild_journal')
+    def test_redis_error(self, add_to_rebuild_journal):
+        """Indexing goes on when the journal is unavailable."""
+        add_to_rebuild_journal.side_effect = RedisError
+        search_tasks.journal_for_rebuild([(QuestionMappingType, 1, INDEX)])
+
+
+@override_settings(ES_LIVE_INDEXING=True)
+@mock.patch.object(search_tasks, 'add_to_rebuild_journal')
+@mock.patch.object(search_models, 'bulk')
+class TestBulkErrors(TestCase):
+    """Missing documents are skipped, other bulk errors raise."""
+
+    def test_update_missing(self, bulk, add_to_rebuild_journal):
+        bulk.return_value = (1, [{'update': {'_id': 2, 'status': 404}}])
+        QuestionMappingType.bulk_update_fields(
+            {1: {'question_num_votes': 1}, 2: {'question_num_votes': 2}},
+            es=mock.Mock(), index='index')
+        eq_(False, bulk.call_args[1]['raise_on_error'])
+
+    def test_delete_missing(self, bulk, add_to_rebuild_journal):
+        bulk.return_value = (0, [{'delete': {'_id': 1, 'status': 404}}])
+        QuestionMappingType.bulk_unindex([1], es=mock.Mock(), index='index')
+        eq_(False, bulk.call_args[1]['raise_on_error'])
+
+    def test_other_errors(self, bulk, add_to_rebuild_journal):
+        bulk.return_value = (0, [{'update': {'_id': 1, 'status': 500}}])
+        with self.assertRaises(BulkIndexError):
+            QuestionMappingType.bulk_update_fields(
+                {1: {'question_num_votes': 1}}, es=mock.Mock(),
+                index='index')
+
+
+class TestFlushOutbox(TestCase):
+    """Tests for flushing the indexing outbox."""
+
+    def setUp(self):
+        super(TestFlushOutbox, self).setUp()
+        try:
+            self.redis = redis_client('default')
+            self.redis.flushdb()
+        except RedisError:
+            raise SkipTest
+
+    def tearDown(self):
+        try:
+            self.redis.flushdb()
+        except (KeyError, AttributeError):
+            raise SkipTest
+        super(TestFlushOutbox, self).tearDown()
+
+    def fill_outbox(self, updates):
+        # Write straight to the outbox, since add_to_outbox would flush
+        # it right away with eager celery.
+        self.redis.hmset(search_tasks.OUTBOX_KEY,
+                         search_tasks._updates_hash(updates))
+
+    @override_settings(ES_LIVE_INDEXING=True)
+    @mock.patch.object(search_tasks, 'add_to_rebuild_journal')
+    @mock.patch.object(QuestionMappingType, 'bulk_unindex')
+    @mock.patch.object(search_tasks, 'index_chunk')
+    def test_flush(self, index_chunk, bulk_unindex, add_to_rebuild_journal):
+        """The latest action per object wins and all of them get applied."""
+        self.fill_outbox([(QuestionMappingType, 1, INDEX),
+                          (QuestionMappingType, 2, INDEX),
+                          (DocumentMappingType, 3, INDEX)])
+        self.fill_outbox([(QuestionMappingType, 2, UNINDEX)])
+
+        flush_outbox_task()
+
+        eq_(sorted((c[0][0], c[0][1]) for c in index_chunk.call_args_list),
+            sorted([(QuestionMappingType, [1]),
+                    (DocumentMappingType, [3])]))
+        bulk_unindex.assert_called_once_with([2])
+
+        # The flushed updates were journaled.
+        eq_(sorted(add_to_rebuild_journal.call_args[0][0]),
+            sorted([(QuestionMappingType, 1, INDEX),
+                    (QuestionMappingType, 2, UNINDEX),
+                    (DocumentMappingType, 3, INDEX)]))
+
+        # The outbox is empty now.
+        eq_({}, self.redis.hgetall(search_tasks.OUTBOX_KEY))
+        eq_(False, self.redis.exists(search_tasks.OUTBOX_FLUSH_KEY))
+
+    @override_settings(ES_LIVE_INDEXING=True)
+    @mock.patch.object(search_models, 'file_updates')
+    @mock.patch.object(search_tasks, 'index_chunk')
+    def test_flush_es_error(self, index_chunk, file_updates):
+        """When ES fails, the updates are handed to the indexing tasks."""
+        index_chunk.side_effect = Exception('ES is down')
+        updates = [(QuestionMappingType, 1, INDEX),
+                   (QuestionMappingType, 2, UNINDEX)]
+        self.fill_outbox(updates)
+
+        flush_outbox_task()
+
+        eq_(1, file_updates.call_count)
+        eq_(sorted(updates), sorted(file_updates.call_args[0][0]))
+
 
 class TestMappings(unittest.TestCase):
     def test_mappings(self):
@@ -134,6 +360,30 @@ class TestMappings(unittest.TestCase):
         # If we get here, then we're fine.
 
 
+@override_settings(ES_BULK_TARGET_SECONDS=1, ES_BULK_MAX_BYTES=10000)
+class TestAdaptiveBatchSize(unittest.TestCase):
+    def test_grows_when_fast(self):
+        batch_size = es_utils.AdaptiveBatchSize()
+        batch_size.record(80, 800, 0.1)
+        # Growth is limited to doubling per request.
+        eq_(batch_size.size, 160)
+
+    def test_shrinks_when_slow(self):
+        batch_size = es_utils.AdaptiveBatchSize()
+        batch_size.record(80, 8000, 4)
+        eq_(batch_size.size, 20)
+
+    def test_capped_by_bytes(self):
+        batch_size = es_utils.AdaptiveBatchSize()
+        batch_size.record(80, 80000, 0.1)
+        eq_(batch_size.size, batch_size.min_size)
+
+    def test_split_by_bytes(self):
+        sized = [('a', 4), ('b', 4), ('c', 20), ('d', 1)]
+        eq_(list(es_utils.split_by_bytes(sized, 10)),
+            [[('a', 4), ('b', 4)], [('c', 20)], [('d', 1)]])
+
+
 class TestAnalyzers(ElasticTestCase):
 
     def setUp(self):
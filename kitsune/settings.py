@@ -718,8 +718,18 @@ ES_WRITE_INDEXES = ES_INDEXES
 ES_INDEX_PREFIX = 'sumo'
 # Keep indexes up to date as objects are made/deleted.
 ES_LIVE_INDEXING = False
+# Number of seconds live indexing updates wait in the indexing outbox
+# (in the 'default' redis) so updates from many requests can be merged
+# and bulk indexed together. Set to 0 to file indexing tasks at the end
+# of each request instead.
+ES_LIVE_INDEXING_DELAY = 5
 # Timeout for querying requests
 ES_TIMEOUT = 5
+# Bulk indexing sizes its batches so requests take about this many
+# seconds...
+ES_BULK_TARGET_SECONDS = 1
+# ...and never sends more than this many bytes in one request.
+ES_BULK_MAX_BYTES = 5 * 1024 * 1024
 
 SEARCH_MAX_RESULTS = 1000
 SEARCH_RESULTS_PER_PAGE = 10
@@ -818,8 +828,21 @@ CELERYD_CONCURRENCY = 4
 CELERY_EAGER_PROPAGATES_EXCEPTIONS = True  # Explode loudly during tests.
 CELERYD_HIJACK_ROOT_LOGGER = False
 
+# Caching anonymous pages at the edge. The CDN keeps them for
+# EDGE_CACHE_MAX_AGE seconds unless they get purged by surrogate key by
+# POSTing to EDGE_PURGE_URL with EDGE_PURGE_HEADERS, for example
+# 'https://api.fastly.com/service/<service id>/purge' with
+# {'Fastly-Key': '<api key>'}. Requests with a session cookie must bypass
+# the CDN; see docs/deployments.rst.
+EDGE_CACHE_MAX_AGE = 60 * 60 * 24
+EDGE_CACHE_BROWSER_MAX_AGE = 60 * 5
+EDGE_PURGE_URL = None
+EDGE_PURGE_HEADERS = {}
+
 # Wiki rebuild settings
 WIKI_REBUILD_TOKEN = 'sumo:wiki:full-rebuild'
+WIKI_REBUILD_CHUNK_SIZE = 50
+WIKI_REBUILD_CHUNK_RATE_LIMIT = '60/m'
 
 # Anonymous user cookie
 ANONYMOUS_COOKIE_NAME = 'SUMO_ANONID'
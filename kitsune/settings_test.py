@@ -3,6 +3,7 @@
 import os
 
 ES_LIVE_INDEXING = False
+ES_LIVE_INDEXING_DELAY = 0
 ES_INDEX_PREFIX = 'sumotest'
 ES_INDEXES = {
     'default': 'test-default',
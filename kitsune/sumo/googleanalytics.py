@@ -1,6 +1,10 @@
 import logging
+import random
+import threading
+import time
+from Queue import Queue
 from datetime import timedelta
-from functools import wraps
+from multiprocessing.pool import ThreadPool
 
 from django.conf import settings
 
@@ -20,24 +24,16 @@ key = settings.GA_KEY
 account = settings.GA_ACCOUNT
 profile_id = settings.GA_PROFILE_ID
 
-
-def retry_503(f):
-    """Call `f`. If `f` raises an HTTP 503 exception, try again once.
-
-    This is what Google Analytics recommends:
-    https://developers.google.com/analytics/devguides/config/mgmt/v3/errors
-    """
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        try:
-            return f(*args, **kwargs)
-        except HttpError as e:
-            log.error('HTTP Error calling Google Analytics: %s', e)
-
-            if e.resp.status == 503:
-                return f(*args, **kwargs)
-
-    return wrapper
+# Fetching reports: how many requests to have in flight at once, how many
+# to start per second at most across all of them (GA allows 10 per second
+# per IP), how many rows to ask for per page, and how often to retry a
+# request that failed with one of RETRY_STATUSES.
+MAX_WORKERS = 4
+MAX_REQUESTS_PER_SECOND = 8
+MAX_RESULTS = 10000
+MAX_RETRIES = 4
+RETRY_STATUSES = (429, 500, 503)
+RETRY_BACKOFF = 1  # seconds, doubled on every retry
 
 
 def _build_request():
@@ -48,6 +44,114 @@ def _build_request():
     return service.data().ga()
 
 
+class _RateLimiter(object):
+    """Spaces out calls to ``wait`` across threads to a rate per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _date_windows(start_date, end_date, days=90):
+    """Yields (start, end) windows of at most ``days`` days, latest first.
+
+    Requesting a window at a time keeps the result sets small.
+    """
+    end_date_step = end_date
+    while True:
+        start_date_step = max(end_date_step - timedelta(days), start_date)
+        yield start_date_step, end_date_step
+
+        end_date_step = start_date_step - timedelta(1)
+        if start_date_step == start_date or end_date_step < start_date:
+            break
+
+
+def _fetch_reports(queries, handle_rows, verbose=False):
+    """Fetches every page of each query with a bounded pool of threads.
+
+    :arg queries: a list of dicts of arguments for the GA ``get`` request,
+        without the paging ones
+    :arg handle_rows: called with the rows of each page as it arrives.
+        It's always called from this thread, so it doesn't need locking.
+
+    The first page of every query is requested right away and the rest
+    once the first one says how many there are. Requests share a rate
+    limit, and ones that fail with a status in RETRY_STATUSES are
+    retried with exponential backoff. Other errors are raised.
+
+    """
+    limiter = _RateLimiter(MAX_REQUESTS_PER_SECOND)
+    # httplib2 isn't thread-safe, so every thread gets its own request.
+    local = threading.local()
+    done = Queue()
+
+    def fetch(query, start_index):
+        if getattr(local, 'request', None) is None:
+            local.request = _build_request()
+
+        attempt = 0
+        while True:
+            limiter.wait()
+            try:
+                return local.request.get(
+                    max_results=MAX_RESULTS, start_index=start_index,
+                    **query).execute()
+            except HttpError as e:
+                log.error('HTTP Error calling Google Analytics: %s', e)
+                if e.resp.status not in RETRY_STATUSES or (
+                        attempt >= MAX_RETRIES):
+                    raise
+            time.sleep(RETRY_BACKOFF * 2 ** attempt + random.random())
+            attempt += 1
+
+    def run(query, start_index):
+        try:
+            done.put((query, start_index, fetch(query, start_index), None))
+        except Exception as e:
+            done.put((query, start_index, None, e))
+
+    pool = ThreadPool(MAX_WORKERS)
+    try:
+        for query in queries:
+            if verbose:
+                print 'Fetching data for %s to %s:' % (query['start_date'],
+                                                       query['end_date'])
+            pool.apply_async(run, (query, 1))
+
+        pending = len(queries)
+        while pending:
+            query, start_index, results, error = done.get()
+            pending -= 1
+            if error is not None:
+                raise error
+
+            total = results.get('totalResults', 0)
+            if start_index == 1:
+                for index in xrange(1 + MAX_RESULTS, total + 1, MAX_RESULTS):
+                    pool.apply_async(run, (query, index))
+                    pending += 1
+
+            rows = results.get('rows', [])
+            if verbose:
+                print '- Got %s of %s results for %s to %s.' % (
+                    min(start_index + len(rows) - 1, total), total,
+                    query['start_date'], query['end_date'])
+
+            handle_rows(rows)
+    finally:
+        pool.terminate()
+
+
 def visitors(start_date, end_date):
     """Return the number of daily unique visitors for a given date range.
 
@@ -79,24 +183,20 @@ def visitors_by_locale(start_date, end_date):
          u'es': 830521,...}
     """
     visits_by_locale = {}
-    request = _build_request()
-
-    @retry_503
-    def _make_request():
-        return request.get(
-            ids='ga:' + profile_id,
-            start_date=str(start_date),
-            end_date=str(end_date),
-            metrics='ga:visitors',
-            dimensions='ga:pagePathLevel1').execute()
 
-    results = _make_request()
+    def add_rows(rows):
+        for result in rows:
+            path = result[0][1:-1]  # Strip leading and trailing slash.
+            visitors = int(result[1])
+            if path in settings.SUMO_LANGUAGES:
+                visits_by_locale[path] = visitors
 
-    for result in results['rows']:
-        path = result[0][1:-1]  # Strip leading and trailing slash.
-        visitors = int(result[1])
-        if path in settings.SUMO_LANGUAGES:
-            visits_by_locale[path] = visitors
+    _fetch_reports([dict(
+        ids='ga:' + profile_id,
+        start_date=str(start_date),
+        end_date=str(end_date),
+        metrics='ga:visitors',
+        dimensions='ga:pagePathLevel1')], add_rows)
 
     return visits_by_locale
 
@@ -113,66 +213,31 @@ def pageviews_by_document(start_date, end_date, verbose=False):
          7: 1337,...}
     """
     counts = {}
-    request = _build_request()
-    max_results = 10000
-
-    end_date_step = end_date
-
-    while True:  # To reduce the size of result set request 3 months at a time
-        start_date_step = end_date_step - timedelta(90)
-
-        if start_date_step < start_date:
-            start_date_step = start_date
-
-        if verbose:
-            print 'Fetching data for %s to %s:' % (start_date_step,
-                                                   end_date_step)
-
-        start_index = 1
-
-        while True:  # To deal with pagination
 
-            @retry_503
-            def _make_request():
-                return request.get(
-                    ids='ga:' + profile_id,
-                    start_date=str(start_date_step),
-                    end_date=str(end_date_step),
-                    metrics='ga:pageviews',
-                    dimensions='ga:pagePath',
-                    filters=('ga:pagePathLevel2==/kb/;'
-                             'ga:pagePathLevel1==/en-US/'),
-                    max_results=max_results,
-                    start_index=start_index).execute()
-
-            results = _make_request()
-
-            if verbose:
-                d = (max_results - 1
-                     if start_index + max_results - 1 < results['totalResults']
-                     else results['totalResults'] - start_index)
-                print '- Got %s of %s results.' % (start_index + d,
-                                                   results['totalResults'])
-
-            for result in results.get('rows', []):
-                path = result[0]
-                pageviews = int(result[1])
-                doc = Document.from_url(path, id_only=True, check_host=False)
-                if not doc:
-                    continue
-
-                # The same document can appear multiple times due to url params
-                counts[doc.pk] = counts.get(doc.pk, 0) + pageviews
-
-            # Move to next page of results.
-            start_index += max_results
-            if start_index > results.get('totalResults', 0):
-                break
-
-        end_date_step = start_date_step - timedelta(1)
-
-        if start_date_step == start_date or end_date_step < start_date:
-            break
+    # Resolving the paths in memory saves a query per row.
+    document_id_from_url = Document.id_resolver(check_host=False)
+
+    def add_rows(rows):
+        for result in rows:
+            path = result[0]
+            pageviews = int(result[1])
+            doc_id = document_id_from_url(path)
+            if not doc_id:
+                continue
+
+            # The same document can appear multiple times due to url params
+            counts[doc_id] = counts.get(doc_id, 0) + pageviews
+
+    _fetch_reports([dict(ids='ga:' + profile_id,
+                         start_date=str(start_date_step),
+                         end_date=str(end_date_step),
+                         metrics='ga:pageviews',
+                         dimensions='ga:pagePath',
+                         filters=('ga:pagePathLevel2==/kb/;'
+                                  'ga:pagePathLevel1==/en-US/'))
+                    for start_date_step, end_date_step in
+                    _date_windows(start_date, end_date)],
+                   add_rows, verbose=verbose)
 
     return counts
 
@@ -186,66 +251,28 @@ def pageviews_by_question(start_date, end_date, verbose=False):
          7: 1337,...}
     """
     counts = {}
-    request = _build_request()
-    max_results = 10000
-
-    end_date_step = end_date
-
-    while True:  # To reduce the size of result set request 3 months at a time
-        start_date_step = end_date_step - timedelta(90)
-
-        if start_date_step < start_date:
-            start_date_step = start_date
-
-        if verbose:
-            print 'Fetching data for %s to %s:' % (start_date_step,
-                                                   end_date_step)
-
-        start_index = 1
-
-        while True:  # To deal with pagination
 
-            @retry_503
-            def _make_request():
-                return request.get(
-                    ids='ga:' + profile_id,
-                    start_date=str(start_date_step),
-                    end_date=str(end_date_step),
-                    metrics='ga:pageviews',
-                    dimensions='ga:pagePath',
-                    filters='ga:pagePathLevel2==/questions/',
-                    max_results=max_results,
-                    start_index=start_index).execute()
-
-            results = _make_request()
-
-            if verbose:
-                d = (max_results - 1
-                     if start_index + max_results - 1 < results['totalResults']
-                     else results['totalResults'] - start_index)
-                print '- Got %s of %s results.' % (start_index + d,
-                                                   results['totalResults'])
-
-            for result in results['rows']:
-                path = result[0]
-                pageviews = int(result[1])
-                question_id = Question.from_url(path, id_only=True)
-                if not question_id:
-                    continue
-
-                # The same question can appear multiple times due to url params
-                # and locale.
-                counts[question_id] = counts.get(question_id, 0) + pageviews
-
-            # Move to next page of results.
-            start_index += max_results
-            if start_index > results['totalResults']:
-                break
-
-        end_date_step = start_date_step - timedelta(1)
-
-        if start_date_step == start_date or end_date_step < start_date:
-            break
+    def add_rows(rows):
+        for result in rows:
+            path = result[0]
+            pageviews = int(result[1])
+            question_id = Question.from_url(path, id_only=True)
+            if not question_id:
+                continue
+
+            # The same question can appear multiple times due to url params
+            # and locale.
+            counts[question_id] = counts.get(question_id, 0) + pageviews
+
+    _fetch_reports([dict(ids='ga:' + profile_id,
+                         start_date=str(start_date_step),
+                         end_date=str(end_date_step),
+                         metrics='ga:pageviews',
+                         dimensions='ga:pagePath',
+                         filters='ga:pagePathLevel2==/questions/')
+                    for start_date_step, end_date_step in
+                    _date_windows(start_date, end_date)],
+                   add_rows, verbose=verbose)
 
     return counts
 
@@ -101,9 +101,12 @@ class NoCacheHttpsMiddleware(object):
     """
     Sets no-cache headers when HTTPS META variable is set
     and not equal to 'off'.
+
+    Responses that were made cacheable at the edge on purpose with
+    patch_edge_cache are left alone.
     """
     def process_response(self, request, response):
-        if request.is_secure():
+        if request.is_secure() and 'Surrogate-Control' not in response:
             response['Expires'] = 'Thu, 19 Nov 1981 08:52:00 GMT'
             response['Cache-Control'] = 'no-cache, must-revalidate'
             response['Pragma'] = 'no-cache'
@@ -1,7 +1,9 @@
+import hashlib
 from os.path import basename
 from urlparse import urlparse, parse_qs
 
 from django.conf import settings
+from django.core.cache import cache
 from django.template.loader import render_to_string
 from django.utils.translation import ugettext_lazy as _lazy, ugettext as _
 
@@ -10,6 +12,7 @@ from wikimarkup.parser import Parser, ALLOWED_TAGS
 from kitsune.gallery.models import Image, Video
 from kitsune.sumo import email_utils
 from kitsune.sumo.urlresolvers import reverse
+from kitsune.sumo.utils import bump_cache_version, cache_version
 
 
 ALLOWED_ATTRIBUTES = {
@@ -41,6 +44,13 @@ IMAGE_PARAM_VALUES = {
 VIDEO_PARAMS = ['height', 'width', 'modal', 'title', 'placeholder']
 YOUTUBE_PLACEHOLDER = 'YOUTUBE_EMBED_PLACEHOLDER_%s'
 
+# Resolving a title to a document takes up to four queries and KB
+# articles link to lots of documents, so resolutions are cached. The
+# cache keys include a version that gets bumped whenever a Document or
+# Revision is saved or deleted, which invalidates all of them at once.
+RESOLUTION_VERSION_KEY = 'wiki:resolution:version'
+RESOLUTION_CACHE_TIMEOUT = 60 * 60 * 24
+
 
 def wiki_to_html(wiki_markup, locale=settings.WIKI_DEFAULT_LANGUAGE,
                  nofollow=True):
@@ -98,30 +108,92 @@ def get_object_fallback(cls, title, locale, default=None, **kwargs):
         return default
 
 
-def _get_wiki_link(title, locale):
+def resolution_version():
+    """Returns the current version of the title resolution cache."""
+    return cache_version(RESOLUTION_VERSION_KEY)
+
+
+def invalidate_resolutions():
+    """Invalidates all cached title resolutions."""
+    bump_cache_version(RESOLUTION_VERSION_KEY)
+
+
+def _resolution_cache_key(kind, title, locale, kwargs, version=None):
+    if version is None:
+        version = resolution_version()
+    key = u'%s:%s:%s:%s' % (kind, locale, title, sorted(kwargs.items()))
+    return 'wiki:resolution:%s:%s' % (
+        version, hashlib.md5(key.encode('utf-8')).hexdigest())
+
+
+def resolve_document(title, locale, version=None, **kwargs):
+    """Like get_object_fallback for Documents, but cached
+
+    The id of the resolved document is cached, so a cache hit costs
+    one query for the document (and its current revision) rather than
+    up to four.
+
+    :arg version: the resolution cache version to use. Defaults to the
+        current one.
+
+    :returns: a Document or None
+
+    """
+    # Prevent circular import.
+    from kitsune.wiki.models import Document
+
+    key = _resolution_cache_key('document', title, locale, kwargs, version)
+    doc_id = cache.get(key)
+    if doc_id == 0:
+        return None
+    if doc_id is not None:
+        try:
+            return (Document.objects.select_related('current_revision')
+                                    .get(pk=doc_id))
+        except Document.DoesNotExist:
+            pass
+
+    doc = get_object_fallback(Document, title, locale, **kwargs)
+    cache.set(key, doc.id if doc else 0, RESOLUTION_CACHE_TIMEOUT)
+    return doc
+
+
+def _get_wiki_link(title, locale, version=None):
     """Checks the page exists, and returns its URL or the URL to create it.
 
     Return value is a dict: {'found': boolean, 'url': string}.
     found is False if the document does not exist.
 
+    :arg version: the resolution cache version to use. Defaults to the
+        current one.
+
     """
     # Prevent circular import. sumo is conceptually a utils apps and
     # shouldn't have import-time (or really, any, but that's not going
     # to happen) dependencies on client apps.
     from kitsune.wiki.models import Document
 
-    d = get_object_fallback(Document, locale=locale, title=title,
-                            is_template=False)
-    if d:
-        # If the article redirects use its destination article
-        while d.redirect_document():
-            d = d.redirect_document()
-
+    key = _resolution_cache_key('link', title, locale, {}, version)
+    target = cache.get(key)
+    if target is None:
+        target = {}
+        d = get_object_fallback(Document, locale=locale, title=title,
+                                is_template=False)
+        if d:
+            # If the article redirects use its destination article
+            redirect = d.redirect_document()
+            while redirect:
+                d = redirect
+                redirect = d.redirect_document()
+            target = {'slug': d.slug, 'title': d.title}
+        cache.set(key, target, RESOLUTION_CACHE_TIMEOUT)
+
+    if target:
         # The locale in the link urls should always match the current
         # document's locale even if the document/slug being linked to
         # is in the default locale.
-        url = reverse('wiki.document', locale=locale, args=[d.slug])
-        return {'found': True, 'url': url, 'text': d.title}
+        url = reverse('wiki.document', locale=locale, args=[target['slug']])
+        return {'found': True, 'url': url, 'text': target['title']}
 
     # To avoid circular imports, wiki.models imports wiki_to_html
     from kitsune.sumo.templatetags.jinja_helpers import urlparams
@@ -202,6 +274,49 @@ class WikiParser(Parser):
 
         self.youtube_videos = []
 
+        # Memo of title lookups for the render in progress. This keeps
+        # a document that's linked to several times from being looked
+        # up several times.
+        self._lookups = {}
+        self._resolution_version = None
+        # How deep into parse() we are. Includes and templates parse
+        # recursively.
+        self._depth = 0
+
+    def _version(self):
+        if self._resolution_version is None:
+            self._resolution_version = resolution_version()
+        return self._resolution_version
+
+    def get_document(self, title, locale=None, **kwargs):
+        """Returns the Document a title resolves to or None
+
+        :arg locale: the locale to look in. Defaults to the parser's.
+
+        """
+        locale = locale or self.locale
+        key = ('document', title, locale, tuple(sorted(kwargs.items())))
+        if key not in self._lookups:
+            self._lookups[key] = resolve_document(
+                title, locale, version=self._version(), **kwargs)
+        return self._lookups[key]
+
+    def get_object(self, cls, title, default=None):
+        """Memoized get_object_fallback for the parser's locale"""
+        key = (cls, title, self.locale)
+        if key not in self._lookups:
+            self._lookups[key] = get_object_fallback(cls, title, self.locale)
+        obj = self._lookups[key]
+        return default if obj is None else obj
+
+    def get_wiki_link(self, title):
+        """Memoized _get_wiki_link for the parser's locale"""
+        key = ('link', title, self.locale)
+        if key not in self._lookups:
+            self._lookups[key] = _get_wiki_link(
+                title, self.locale, version=self._version())
+        return self._lookups[key]
+
     def parse(self, text, show_toc=None, tags=None, attributes=None,
               styles=None, locale=settings.WIKI_DEFAULT_LANGUAGE,
               nofollow=False, youtube_embeds=True, **kwargs):
@@ -244,7 +359,16 @@ class WikiParser(Parser):
                 strip_comments=True,
                 **kwargs)
 
-        html = _parse(locale)
+        if not self._depth:
+            # This is a new render, so start with a fresh memo.
+            self._lookups = {}
+            self._resolution_version = None
+
+        self._depth += 1
+        try:
+            html = _parse(locale)
+        finally:
+            self._depth -= 1
 
         if youtube_embeds:
             html = self.add_youtube_embeds(html)
@@ -285,7 +409,7 @@ class WikiParser(Parser):
                 text = hash.replace('_', ' ')
             return u'<a href="%s">%s</a>' % (hash, text)
 
-        link = _get_wiki_link(title, self.locale)
+        link = self.get_wiki_link(title)
         extra_a_attr = ''
         if not link['found']:
             extra_a_attr += (u' class="new" title="{tooltip}"'
@@ -301,7 +425,7 @@ class WikiParser(Parser):
                                           IMAGE_PARAM_VALUES)
 
         message = _lazy(u'The image "%s" does not exist.') % title
-        image = get_object_fallback(Image, title, self.locale, message)
+        image = self.get_object(Image, title, message)
         if isinstance(image, basestring):
             return image
 
@@ -337,7 +461,7 @@ class WikiParser(Parser):
 
             return YOUTUBE_PLACEHOLDER % video_id
 
-        v = get_object_fallback(Video, title, self.locale, message)
+        v = self.get_object(Video, title, message)
         if isinstance(v, basestring):
             return v
 
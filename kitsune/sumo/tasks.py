@@ -1,9 +1,20 @@
+import logging
 from datetime import datetime
 
+from django.conf import settings
+
+import requests
 from celery import task
 from statsd import statsd
 
 from kitsune.sumo.decorators import timeit
+from kitsune.sumo.utils import chunked
+
+
+log = logging.getLogger('k.task')
+
+# How many surrogate keys to purge per request to the CDN.
+PURGE_BATCH_SIZE = 256
 
 
 @task()
@@ -16,3 +27,28 @@ def measure_queue_lag(queued_time):
     lag = datetime.now() - queued_time
     lag = (lag.days * 3600 * 24) + lag.seconds
     statsd.gauge('rabbitmq.lag', max(lag, 0))
+
+
+@task()
+@timeit
+def purge_surrogate_keys(keys):
+    """Purges everything with any of these surrogate keys from the CDN.
+
+    See ``kitsune.sumo.utils.patch_edge_cache``. This does nothing if
+    ``EDGE_PURGE_URL`` isn't set.
+
+    """
+    if not settings.EDGE_PURGE_URL:
+        return
+
+    for chunk in chunked(sorted(set(keys)), PURGE_BATCH_SIZE):
+        headers = dict(settings.EDGE_PURGE_HEADERS)
+        headers['Surrogate-Key'] = ' '.join(chunk)
+        try:
+            requests.post(settings.EDGE_PURGE_URL, headers=headers,
+                          timeout=10).raise_for_status()
+        except requests.RequestException:
+            log.exception('Purging %s surrogate keys failed.' % len(chunk))
+            statsd.incr('sumo.edge.purge.error')
+            raise purge_surrogate_keys.retry(countdown=60)
+        statsd.incr('sumo.edge.purge', len(chunk))
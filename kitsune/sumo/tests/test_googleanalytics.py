@@ -1,6 +1,10 @@
-from datetime import date
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta
 
-from mock import patch
+import httplib2
+from apiclient.errors import HttpError
+from mock import Mock, patch
 from nose.tools import eq_
 
 from kitsune.sumo import googleanalytics
@@ -84,6 +88,61 @@ class GoogleAnalyticsTests(TestCase):
         eq_(74.88925980111263, ctr['2013-06-06'])
 
 
+class FakeGA(object):
+    """A local stand-in for the GA reporting API.
+
+    Every day has one pageview of the question with the day of the month
+    as its id. The first request for every page fails with a 503.
+
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = []
+
+    def get(self, start_date, end_date, max_results, start_index, **kwargs):
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        days = [start + timedelta(i) for i in range((end - start).days + 1)]
+        page = days[start_index - 1:start_index - 1 + max_results]
+
+        def execute():
+            with self.lock:
+                key = (start_date, start_index)
+                self.requests.append(key)
+                if self.requests.count(key) == 1:
+                    raise HttpError(httplib2.Response({'status': 503}), '')
+            return {
+                'totalResults': len(days),
+                'rows': [['/en-US/questions/%s' % d.day, '1'] for d in page],
+            }
+
+        return Mock(execute=execute)
+
+
+@patch.object(googleanalytics, 'MAX_RESULTS', 7)
+@patch.object(googleanalytics.time, 'sleep')
+class FetchReportsTests(TestCase):
+    """Tests for fetching reports concurrently."""
+
+    @patch.object(googleanalytics, '_build_request')
+    def test_pageviews_by_question(self, _build_request, sleep):
+        fake = FakeGA()
+        _build_request.return_value = fake
+        start, end = date(2013, 1, 1), date(2013, 6, 30)
+
+        pageviews = googleanalytics.pageviews_by_question(start, end)
+
+        expected = defaultdict(int)
+        day = start
+        while day <= end:
+            expected[day.day] += 1
+            day += timedelta(1)
+        eq_(dict(expected), pageviews)
+
+        # Every page was retried once and then fetched.
+        eq_(len(fake.requests), 2 * len(set(fake.requests)))
+
+
 VISITORS_RESPONSE = {
     u'kind': u'analytics#gaData',
     u'rows': [[u'382719']],  # <~ The number we are looking for.
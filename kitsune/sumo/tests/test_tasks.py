@@ -0,0 +1,27 @@
+from django.test.utils import override_settings
+
+import mock
+from nose.tools import eq_
+
+from kitsune.sumo import tasks
+from kitsune.sumo.tasks import purge_surrogate_keys
+from kitsune.sumo.tests import TestCase
+
+
+class PurgeSurrogateKeysTests(TestCase):
+    @mock.patch.object(tasks.requests, 'post')
+    def test_not_configured(self, post):
+        purge_surrogate_keys(['a'])
+        assert not post.called
+
+    @override_settings(EDGE_PURGE_URL='https://cdn.example.com/purge',
+                       EDGE_PURGE_HEADERS={'Fastly-Key': 'secret'})
+    @mock.patch.object(tasks, 'PURGE_BATCH_SIZE', 2)
+    @mock.patch.object(tasks.requests, 'post')
+    def test_batches(self, post):
+        purge_surrogate_keys(['c', 'a', 'b', 'a'])
+
+        eq_(2, post.call_count)
+        headers = [call[1]['headers'] for call in post.call_args_list]
+        eq_(['a b', 'c'], [h['Surrogate-Key'] for h in headers])
+        eq_('secret', headers[0]['Fastly-Key'])
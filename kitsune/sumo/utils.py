@@ -1,14 +1,18 @@
+import hashlib
 import json
 import re
 import sys
+import time
 from contextlib import contextmanager
 from datetime import datetime
 
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.db import models
 from django.db.models.signals import pre_delete
 from django.utils import translation
+from django.utils.cache import patch_vary_headers
 from django.utils.http import urlencode, is_safe_url
 
 import ratelimit.helpers
@@ -80,6 +84,88 @@ def chunked(seq, n, length=None):
         yield seq[i:i + n]
 
 
+def cache_version(key):
+    """Returns the version number kept in the cache under key.
+
+    Cache keys that include a version number can be invalidated all at
+    once by bumping it with ``bump_cache_version``.
+
+    """
+    version = cache.get(key)
+    if version is None:
+        # Start from the time rather than 1, so if the version gets
+        # evicted, we don't go back to a version with stale entries.
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_cache_version(key):
+    """Bumps the version number kept in the cache under key."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        # There's no version, so start a fresh one.
+        cache_version(key)
+
+
+def modified_time(key):
+    """Returns the timestamp kept in the cache under key.
+
+    Pages that can't tell when they last changed from the database keep
+    it with ``touch_modified_time``. If it got evicted, it starts again
+    from now, so the page looks modified rather than stale.
+
+    """
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, time.time(), None)
+        modified = cache.get(key) or time.time()
+    return modified
+
+
+def touch_modified_time(key):
+    """Sets the timestamp kept in the cache under key to now."""
+    cache.set(key, time.time(), None)
+
+
+def page_etag(request, *parts):
+    """Returns an ETag for a page built from the given parts.
+
+    The mobile flag, locale and query string of the request go into it
+    too, since they change how the page renders. Only use this for
+    pages that are the same for everyone sending the same cookies that
+    are in parts.
+
+    """
+    parts = parts + (request.MOBILE, request.LANGUAGE_CODE,
+                     request.META.get('QUERY_STRING', ''))
+    return hashlib.md5(repr(parts)).hexdigest()
+
+
+def patch_edge_cache(response, surrogate_keys):
+    """Makes a response cacheable at the edge.
+
+    The CDN keeps the response for ``EDGE_CACHE_MAX_AGE`` seconds, or
+    until one of its surrogate keys gets purged with
+    ``kitsune.sumo.tasks.purge_surrogate_keys``. Browsers keep it for
+    ``EDGE_CACHE_BROWSER_MAX_AGE`` seconds, since they don't get purged.
+
+    Only use this for responses that are the same for every anonymous
+    user. They vary on ``Cookie``, so a browser doesn't show its
+    anonymous copy once the user logs in. The CDN has to pass requests
+    with a session cookie through to us and leave the cookies of the
+    others out of its cache key. See ``docs/deployments.rst``.
+
+    """
+    response['Cache-Control'] = 'public, max-age=%d' % (
+        settings.EDGE_CACHE_BROWSER_MAX_AGE)
+    response['Surrogate-Control'] = 'max-age=%d' % settings.EDGE_CACHE_MAX_AGE
+    response['Surrogate-Key'] = ' '.join(surrogate_keys)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
 def smart_int(string, fallback=0):
     """Convert a string to int, with fallback for invalid strings or types."""
     try:
@@ -193,7 +193,7 @@ class ProfileSerializer(serializers.ModelSerializer):
     def get_avatar_url(self, profile):
         request = self.context.get('request')
         size = request.REQUEST.get('avatar_size', 48) if request else 48
-        return profile_avatar(profile.user, size=size)
+        return profile_avatar(profile.user, size=size, profile=profile)
 
     def get_question_count(self, profile):
         return num_questions(profile.user)
@@ -3,12 +3,14 @@ import logging
 import random
 import re
 import time
+from collections import defaultdict
 from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.contrib.auth.models import User, Group
 from django.contrib.sites.models import Site
 from django.db import models
+from django.db.models import Max
 from django.utils.translation import ugettext as _, ugettext_lazy as _lazy
 
 from celery.task import task
@@ -252,36 +254,119 @@ class UserMappingType(SearchMappingType):
         if not obj.user.is_active:
             raise UnindexMeBro()
 
-        d = {}
-        d['id'] = obj.pk
-        d['model'] = cls.get_mapping_type_name()
-        d['url'] = obj.get_absolute_url()
-        d['indexed_on'] = int(time.time())
+        return cls._documents_from_objects([obj])[0]
 
-        d['username'] = obj.user.username
-        d['display_name'] = obj.display_name
-        d['twitter_usernames'] = obj.twitter_usernames
+    @classmethod
+    def extract_documents(cls, ids):
+        """Extracts interesting things from a batch of Profiles"""
+        model = cls.get_model()
+        objs = list(model.objects.select_related('user').filter(pk__in=ids))
+
+        # Inactive users get unindexed. See extract_document.
+        ret = [(obj.pk, None) for obj in objs if not obj.user.is_active]
+        objs = [obj for obj in objs if obj.user.is_active]
+        ret.extend(zip([obj.pk for obj in objs],
+                       cls._documents_from_objects(objs)))
+        return ret
 
-        d['last_contribution_date'] = obj.last_contribution_date
+    @classmethod
+    def _documents_from_objects(cls, objs):
+        """Builds documents from a list of Profiles.
 
-        d['iusername'] = obj.user.username.lower()
-        d['idisplay_name'] = obj.display_name.lower()
-        d['itwitter_usernames'] = [u.lower() for u in obj.twitter_usernames]
+        The Profiles should have user already selected. Twitter
+        usernames and last contribution dates are pulled in with a
+        fixed number of queries for the whole list.
 
+        """
+        from kitsune.customercare.models import Reply
+        from kitsune.questions.models import Answer
         from kitsune.users.templatetags.jinja_helpers import profile_avatar
-        d['avatar'] = profile_avatar(obj.user, size=120)
-
-        d['suggest'] = {
-            'input': [
-                d['iusername'],
-                d['idisplay_name']
-            ],
-            'output': _(u'{displayname} ({username})').format(
-                displayname=d['display_name'], username=d['username']),
-            'payload': {'user_id': d['id']},
-        }
+        from kitsune.wiki.models import Revision
+
+        if not objs:
+            return []
+
+        user_ids = [obj.user_id for obj in objs]
+
+        twitter_usernames = defaultdict(list)
+        replies = (Reply.objects.filter(user__in=user_ids)
+                                .values_list('user', 'twitter_username')
+                                .order_by()
+                                .distinct())
+        for user_id, twitter_username in replies:
+            twitter_usernames[user_id].append(twitter_username)
+
+        # This is the batch version of Profile.last_contribution_date.
+        contribution_dates = defaultdict(list)
+        latest = [
+            Reply.objects.filter(user__in=user_ids)
+                         .values('user')
+                         .order_by()
+                         .annotate(latest=Max('created'))
+                         .values_list('user', 'latest'),
+            Answer.objects.filter(creator__in=user_ids)
+                          .values('creator')
+                          .order_by()
+                          .annotate(latest=Max('created'))
+                          .values_list('creator', 'latest'),
+            Revision.objects.filter(creator__in=user_ids)
+                            .values('creator')
+                            .order_by()
+                            .annotate(latest=Max('created'))
+                            .values_list('creator', 'latest'),
+        ]
+        for qs in latest:
+            for user_id, date in qs:
+                contribution_dates[user_id].append(date)
+
+        # Old revisions don't have the reviewed date.
+        reviewed = (Revision.objects.filter(reviewer__in=user_ids)
+                                    .values('reviewer')
+                                    .order_by()
+                                    .annotate(latest_reviewed=Max('reviewed'),
+                                              latest_created=Max('created'))
+                                    .values_list('reviewer', 'latest_reviewed',
+                                                 'latest_created'))
+        for user_id, latest_reviewed, latest_created in reviewed:
+            contribution_dates[user_id].append(latest_reviewed or
+                                               latest_created)
+
+        now = int(time.time())
+        documents = []
+        for obj in objs:
+            d = {}
+            d['id'] = obj.pk
+            d['model'] = cls.get_mapping_type_name()
+            d['url'] = obj.get_absolute_url()
+            d['indexed_on'] = now
+
+            d['username'] = obj.user.username
+            d['display_name'] = obj.display_name
+            d['twitter_usernames'] = twitter_usernames[obj.user_id]
+
+            dates = contribution_dates[obj.user_id]
+            d['last_contribution_date'] = max(dates) if dates else None
+
+            d['iusername'] = obj.user.username.lower()
+            d['idisplay_name'] = obj.display_name.lower()
+            d['itwitter_usernames'] = [u.lower()
+                                       for u in d['twitter_usernames']]
+
+            d['avatar'] = profile_avatar(obj.user, size=120, profile=obj)
+
+            d['suggest'] = {
+                'input': [
+                    d['iusername'],
+                    d['idisplay_name']
+                ],
+                'output': _(u'{displayname} ({username})').format(
+                    displayname=d['display_name'], username=d['username']),
+                'payload': {'user_id': d['id']},
+            }
+
+            documents.append(d)
 
-        return d
+        return documents
 
     @classmethod
     def suggest_completions(cls, text):
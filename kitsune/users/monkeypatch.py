@@ -4,15 +4,32 @@ from django.contrib.auth.models import User
 from kitsune.sumo.urlresolvers import reverse
 
 
+def _set_users_active(qs, is_active):
+    """Updates is_active of the users, and what depends on it."""
+    # Prevent circular import.
+    from kitsune.questions.models import QuestionListEntry
+
+    # The update can change what qs matches, so get the users first.
+    user_ids = list(qs.values_list('id', flat=True))
+    num = qs.update(is_active=is_active)
+    # The update skips the post_save signals, so bring the question list
+    # entries up to date by hand.
+    (QuestionListEntry.objects
+     .filter(creator__in=user_ids)
+     .exclude(creator_is_active=is_active)
+     .update(creator_is_active=is_active))
+    return num
+
+
 def _activate_users(admin, request, qs):
-    num = qs.update(is_active=True)
+    num = _set_users_active(qs, True)
     msg = '%s users activated.' % num if num != 1 else 'One user activated.'
     admin.message_user(request, msg)
 _activate_users.short_description = u'Activate selected users'
 
 
 def _deactivate_users(admin, request, qs):
-    num = qs.update(is_active=False)
+    num = _set_users_active(qs, False)
     msg = ('%s users deactivated.' % num if num != 1 else
            'One user deactivated.')
     admin.message_user(request, msg)
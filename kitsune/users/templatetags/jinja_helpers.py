@@ -30,15 +30,20 @@ def profile_url(user, edit=False):
 
 
 @library.global_function
-def profile_avatar(user, size=48):
-    """Return a URL to the user's avatar."""
-    try:  # This is mostly for tests.
-        profile = Profile.objects.get(user_id=user.id)
-    except (Profile.DoesNotExist, AttributeError):
-        avatar = settings.STATIC_URL + settings.DEFAULT_AVATAR
-    else:
-        avatar = (profile.avatar.url if profile and profile.avatar else
-                  settings.STATIC_URL + settings.DEFAULT_AVATAR)
+def profile_avatar(user, size=48, profile=None):
+    """Return a URL to the user's avatar.
+
+    If the caller already has the user's profile, it can pass it in as
+    `profile` to save a query.
+    """
+    if profile is None:
+        try:  # This is mostly for tests.
+            profile = Profile.objects.get(user_id=user.id)
+        except (Profile.DoesNotExist, AttributeError):
+            pass
+
+    avatar = (profile.avatar.url if profile and profile.avatar else
+              settings.STATIC_URL + settings.DEFAULT_AVATAR)
 
     if avatar.startswith('//'):
         avatar = 'https:%s' % avatar
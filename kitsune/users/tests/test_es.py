@@ -5,6 +5,7 @@ from nose.tools import eq_
 
 from kitsune.customercare.tests import ReplyFactory
 from kitsune.questions.tests import AnswerFactory
+from kitsune.search.tests import ExtractDocumentsTestCase
 from kitsune.search.tests.test_es import ElasticTestCase
 from kitsune.users.cron import reindex_users_that_contributed_yesterday
 from kitsune.users.models import UserMappingType
@@ -202,3 +203,19 @@ class UserSearchTests(ElasticTestCase):
 
         data = UserMappingType.search().query(username__match='reviewer')[0]
         eq_(data['last_contribution_date'].date(), yesterday.date())
+
+
+class UserExtractDocumentsTests(ExtractDocumentsTestCase):
+    def test_profiles_match_extract_document(self):
+        u1 = UserFactory()
+        ReplyFactory(user=u1, twitter_username='r1cardo')
+        AnswerFactory(creator=u1)
+        RevisionFactory(creator=u1)
+        u2 = UserFactory()
+        inactive = UserFactory(is_active=False)
+
+        extracted = self.assert_extract_documents(
+            UserMappingType, [u1.profile.pk, u2.profile.pk], 6,
+            skipped=[inactive.profile.pk])
+        eq_(extracted[u1.profile.pk]['twitter_usernames'], ['r1cardo'])
+        assert extracted[u1.profile.pk]['last_contribution_date'] is not None
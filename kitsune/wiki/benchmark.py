@@ -0,0 +1,298 @@
+"""Benchmarks for the wiki parsers.
+
+This generates a corpus of KB-style articles in the database and times
+rendering it. It's meant to be run through the ``wikibench`` command
+against a local database, so parser changes that make a full
+``rebuild_kb`` slower get noticed before they ship.
+
+"""
+import gc
+import logging
+import random
+import resource
+import time
+from collections import defaultdict
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from kitsune.gallery.models import Image, Video
+from kitsune.sumo import parser as sumo_parser
+from kitsune.sumo.parser import invalidate_resolutions
+from kitsune.wiki import parser as wiki_parser
+from kitsune.wiki.config import (
+    CATEGORIES, TEMPLATES_CATEGORY, TEMPLATE_TITLE_PREFIX)
+from kitsune.wiki.models import Document, Revision
+from kitsune.wiki.parser import ForParser, new_fragment_generation
+
+
+log = logging.getLogger('k.wiki')
+
+WORDS = (u'firefox profile bookmark sync tab window private browsing add-on '
+         u'extension theme download history cookie cache password '
+         u'certificate update menu toolbar button search engine homepage '
+         u'preferences options settings restart crash plugin'.split())
+FORS = [u'win', u'mac', u'linux', u'fx35', u'fx4', u'android', u'not mac']
+
+
+class PhaseTimer(object):
+    """Times calls to functions while it's active.
+
+    Each phase's time excludes the time spent in the other phases it
+    calls, so the parse phase doesn't include the templates it parses.
+
+    """
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+        self._patched = []
+        self._stack = []
+
+    def _timed(self, phase, func):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            self._stack.append(0.0)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.time() - start
+                inner = self._stack.pop()
+                self.times[phase] += elapsed - inner
+                self.calls[phase] += 1
+                if self._stack:
+                    self._stack[-1] += elapsed
+        return timed
+
+    def patch(self, phase, owner, name):
+        """Times calls to owner.name as the given phase."""
+        original = owner.__dict__[name]
+        if isinstance(original, (classmethod, staticmethod)):
+            timed = type(original)(self._timed(phase, original.__func__))
+        else:
+            timed = self._timed(phase, original)
+        setattr(owner, name, timed)
+        self._patched.append((owner, name, original))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        for owner, name, original in reversed(self._patched):
+            setattr(owner, name, original)
+        self._patched = []
+
+
+def wiki_phases():
+    """Returns a PhaseTimer for the phases of the wiki parser."""
+    timer = PhaseTimer()
+    timer.patch('strip fors', ForParser, 'strip_fors')
+    timer.patch('simple syntax', wiki_parser, 'parse_simple_syntax')
+    timer.patch('wikimarkup', sumo_parser.WikiParser, 'parse')
+    timer.patch('unstrip fors', ForParser, 'unstrip_fors')
+    timer.patch('html5lib', ForParser, '__init__')
+    timer.patch('expand fors', ForParser, 'expand_fors')
+    timer.patch('serialize', ForParser, 'to_unicode')
+    timer.patch('youtube', sumo_parser.WikiParser, 'add_youtube_embeds')
+    timer.patch('hook: link', sumo_parser.WikiParser, '_hook_internal_link')
+    timer.patch('hook: image', sumo_parser.WikiParser, '_hook_image_tag')
+    timer.patch('hook: video', sumo_parser.WikiParser, '_hook_video')
+    timer.patch('hook: template', wiki_parser.WikiParser, '_hook_template')
+    timer.patch('hook: include', wiki_parser.WikiParser, '_hook_include')
+    return timer
+
+
+def _words(rand, count):
+    return u' '.join(rand.choice(WORDS) for i in range(count))
+
+
+def _paragraph(rand):
+    return _words(rand, rand.randint(20, 60)).capitalize() + u'.'
+
+
+def _make_document(title, content, user, category=CATEGORIES[0][0]):
+    doc = Document.objects.create(
+        title=title, slug=u'bench-%s' % title.lower().replace(u' ', u'-')
+        .replace(u':', u''), category=category,
+        locale=settings.WIKI_DEFAULT_LANGUAGE)
+    rev = Revision.objects.create(
+        document=doc, content=content, creator=user, is_approved=True,
+        summary=title, keywords=u'', comment=u'')
+    doc.current_revision = rev
+    doc.save()
+    return rev
+
+
+def generate_corpus(num_docs, seed=0):
+    """Creates a corpus of articles, with the templates, includes, images
+    and videos they use.
+
+    Returns the revisions of the articles.
+
+    """
+    rand = random.Random(seed)
+    user, created = User.objects.get_or_create(username='wikibench')
+
+    templates = []
+    for i in range(10):
+        title = u'%sBench %s' % (TEMPLATE_TITLE_PREFIX, i)
+        if i % 2:
+            content = u'{for win}Press {key Ctrl+%s}.{/for}' % i
+            content += u'{for mac}Press {key Cmd+%s}.{/for}' % i
+            content += u' {{{1}}}'
+        else:
+            content = u'{note}%s{/note}\n\n%s' % (
+                _paragraph(rand), _paragraph(rand))
+        _make_document(title, content, user, category=TEMPLATES_CATEGORY)
+        templates.append(title[len(TEMPLATE_TITLE_PREFIX):])
+
+    includes = []
+    for i in range(5):
+        title = u'Bench include %s' % i
+        content = u'%s\n\n* %s\n* %s' % (
+            _paragraph(rand), _words(rand, 5), _words(rand, 5))
+        _make_document(title, content, user)
+        includes.append(title)
+
+    images = []
+    for i in range(5):
+        image = Image.objects.create(
+            title=u'bench-%s.png' % i, description=u'', creator=user,
+            file=u'%sbench-%s.png' % (settings.GALLERY_IMAGE_PATH, i))
+        images.append(image.title)
+
+    videos = []
+    for i in range(2):
+        video = Video.objects.create(
+            title=u'bench video %s' % i, description=u'', creator=user,
+            webm=u'%sbench-%s.webm' % (settings.GALLERY_VIDEO_PATH, i),
+            ogv=u'%sbench-%s.ogv' % (settings.GALLERY_VIDEO_PATH, i))
+        videos.append(video.title)
+
+    titles = [u'Bench article %s' % i for i in range(num_docs)]
+    revisions = []
+    for title in titles:
+        sections = []
+        for j in range(rand.randint(3, 8)):
+            section = [u'== %s ==' % _words(rand, 3).capitalize(),
+                       _paragraph(rand)]
+            if rand.random() < 0.5:
+                section.append(u'{for %s}\n%s\n{/for}' % (
+                    rand.choice(FORS), _paragraph(rand)))
+            if rand.random() < 0.5:
+                section.append(u'# %s [[%s]]\n# {menu %s} > {button %s}' % (
+                    _words(rand, 4), rand.choice(titles), _words(rand, 1),
+                    _words(rand, 2)))
+            if rand.random() < 0.4:
+                section.append(u'[[T:%s|%s]]' % (rand.choice(templates),
+                                                 _words(rand, 2)))
+            if rand.random() < 0.2:
+                section.append(u'[[Include:%s]]' % rand.choice(includes))
+            if rand.random() < 0.3:
+                section.append(u'[[Image:%s]]' % rand.choice(images))
+            if rand.random() < 0.1:
+                section.append(u'[[V:%s]]' % rand.choice(videos))
+            sections.append(u'\n\n'.join(section))
+        revisions.append(_make_document(title, u'\n\n'.join(sections), user))
+    return revisions
+
+
+def _change_templates(iteration, seed=0):
+    """Gives the block templates of the corpus a new revision, like an
+    edit that makes render_document_cascade re-render the articles."""
+    rand = random.Random(seed + iteration)
+    user = User.objects.get(username='wikibench')
+    templates = Document.objects.filter(
+        title__startswith=TEMPLATE_TITLE_PREFIX + u'Bench',
+        category=TEMPLATES_CATEGORY)
+    for doc in templates:
+        if u'{note}' not in doc.current_revision.content:
+            continue
+        rev = Revision.objects.create(
+            document=doc, creator=user, is_approved=True, summary=doc.title,
+            keywords=u'', comment=u'', content=u'{note}%s{/note}\n\n%s' % (
+                _paragraph(rand), _paragraph(rand)))
+        doc.current_revision = rev
+        doc.save()
+        wiki_parser.invalidate_fragments(doc.id)
+
+
+def _measure(name, revisions, render, timer=None, log=log):
+    """Renders every revision and logs how it went."""
+    gc.collect()
+    objects = len(gc.get_objects())
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    for rev in revisions:
+        render(rev)
+    elapsed = max(time.time() - start, 0.001)
+    objects = len(gc.get_objects()) - objects
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+
+    log.info('%-24s %8.1f docs/s  %+8d objects  %+8d KB max rss',
+             name, len(revisions) / elapsed, objects, rss)
+    if timer is not None:
+        for phase, seconds in sorted(timer.times.items(),
+                                     key=lambda item: -item[1]):
+            log.info('    %-20s %8.1f ms/doc %5.1f%% %8d calls',
+                     phase, seconds * 1000 / len(revisions),
+                     seconds * 100 / elapsed, timer.calls[phase])
+    return elapsed
+
+
+def run_benchmark(num_docs=200, iterations=3, seed=0, log=log):
+    """Generates a corpus and times the parsers on it.
+
+    Call this in a transaction that gets rolled back, unless you want to
+    keep the corpus.
+
+    """
+    log.info('Generating %s articles...', num_docs)
+    revisions = generate_corpus(num_docs, seed)
+    html = {}
+
+    def cold():
+        # Start every iteration without cached fragments and titles.
+        new_fragment_generation()
+        invalidate_resolutions()
+
+    def wiki_render(rev):
+        html[rev.id] = wiki_parser.wiki_to_html(rev.content)
+
+    def compiled_render(rev):
+        wiki_parser.wiki_to_html(rev.content, revision_id=rev.id)
+
+    def sumo_render(rev):
+        sumo_parser.wiki_to_html(rev.content)
+
+    def for_render(rev):
+        parser = ForParser(html[rev.id])
+        parser.expand_fors()
+        parser.to_unicode()
+
+    for i in range(iterations):
+        log.info('Iteration %s:', i + 1)
+        cold()
+        with wiki_phases() as timer:
+            _measure('wiki (cold)', revisions, wiki_render, timer, log)
+        with wiki_phases() as timer:
+            _measure('wiki (warm)', revisions, wiki_render, timer, log)
+
+        # Compile first, so this measures re-rendering.
+        for rev in revisions:
+            compiled_render(rev)
+        cold()
+        _measure('wiki (compiled)', revisions, compiled_render, log=log)
+
+        # Re-render after a template edit, the way a cascade does, with
+        # and without the compiled forms. The plain parse goes second, so
+        # both start with the templates' fragments not cached.
+        _change_templates(i, seed)
+        _measure('wiki (cascade, compiled)', revisions, compiled_render,
+                 log=log)
+        _change_templates(i + iterations, seed)
+        _measure('wiki (cascade)', revisions, wiki_render, log=log)
+
+        _measure('sumo', revisions, sumo_render, log=log)
+        _measure('ForParser', revisions, for_render, log=log)
@@ -102,4 +102,26 @@ REDIRECT_SLUG = _lazy(u'%(old)s-redirect-%(number)i')
 # Template for the cache key of the full article html.
 DOC_HTML_CACHE_KEY = u'doc_html:{mobile}:{locale}:{slug}:{minimal}'
 
+# Cache keys of the navigation index. It has the ordered documents for
+# each (locale, product, topic), where topic may be None, and the entries
+# each document belongs in, so they get rebuilt when it changes.
+NAVIGATION_INDEX_KEY = u'wiki:nav:{locale}:{product}:{topic}'
+NAVIGATION_MEMBERSHIP_KEY = u'wiki:nav:doc:%s'
+NAVIGATION_INDEX_TIMEOUT = 60 * 60 * 48
+NAVIGATION_INDEX_SIZE = 100
+
+# Cache key of the topics with documents for a product, and of the
+# version number that invalidates all of them.
+TOPICS_FOR_KEY = u'wiki:topics_for:{version}:{product}:{parent}'
+TOPICS_FOR_VERSION_KEY = u'wiki:topics_for:version'
+
+# Cache key of when the article html last changed, for conditional GETs.
+DOC_PAGE_MODIFIED_KEY = u'doc_page:modified:%s'
+
+# Surrogate keys for caching KB pages at the edge. Every KB page has
+# KB_SURROGATE_KEY, plus DOC_SURROGATE_KEY for its document and for each
+# template or include it uses.
+KB_SURROGATE_KEY = 'kb'
+DOC_SURROGATE_KEY = 'kb-doc-%s'
+
 SIMPLE_WIKI_LANDING_PAGE_SLUG = 'frequently-asked-questions'
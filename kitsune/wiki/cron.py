@@ -14,7 +14,7 @@ from django.utils.translation import ugettext as _, pgettext
 from kitsune.products.models import Product
 from kitsune.search.tasks import index_task
 from kitsune.sumo import email_utils
-from kitsune.wiki import tasks
+from kitsune.wiki import facets, tasks
 from kitsune.wiki.config import REDIRECT_HTML
 from kitsune.wiki.models import Document, DocumentMappingType, Revision, Locale
 from kitsune.wiki.config import (HOW_TO_CATEGORY, TROUBLESHOOTING_CATEGORY,
@@ -53,6 +53,12 @@ def reindex_kb():
     index_task.delay(DocumentMappingType, DocumentMappingType.get_indexable())
 
 
+@cronjobs.register
+def rebuild_navigation_index():
+    """Rebuild the navigation index, so recent helpful votes are current."""
+    facets.rebuild_navigation_index()
+
+
 @cronjobs.register
 def send_weekly_ready_for_review_digest():
     """Sends out the weekly "Ready for review" digest email."""
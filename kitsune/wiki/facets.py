@@ -1,14 +1,29 @@
 import hashlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from threading import local
 
 from django.conf import settings
+from django.core import signals
 from django.core.cache import cache
-from django.db.models import Count
+from django.db.models import Count, Q
 
 from elasticsearch.exceptions import TransportError
 from statsd import statsd
 
 from kitsune.products.models import Topic
-from kitsune.wiki.models import Document, DocumentMappingType
+from kitsune.sumo.urlresolvers import reverse
+from kitsune.sumo.utils import cache_version
+from kitsune.wiki.config import (
+    REDIRECT_HTML, NAVIGATION_INDEX_KEY, NAVIGATION_MEMBERSHIP_KEY,
+    NAVIGATION_INDEX_TIMEOUT, NAVIGATION_INDEX_SIZE, TOPICS_FOR_KEY,
+    TOPICS_FOR_VERSION_KEY)
+from kitsune.wiki.models import Document, DocumentMappingType, HelpfulVote
+
+
+# Holds the threadlocal ids of documents whose navigation index entries
+# need rebuilding after the request.
+_local = local()
 
 
 def topics_for(product, parent=False):
@@ -16,7 +31,18 @@ def topics_for(product, parent=False):
 
     :arg product: a Product instance
     :arg parent: (optional) limit to topics with the given parent
+
+    The list is cached until a topic or an en-US document changes.
     """
+    key = TOPICS_FOR_KEY.format(
+        version=cache_version(TOPICS_FOR_VERSION_KEY),
+        product=product.id if product else None,
+        parent=parent.id if parent else parent)
+    topics = cache.get(key)
+    if topics is not None:
+        statsd.incr('wiki.facets.topics_for.cache')
+        return topics
+
     statsd.incr('wiki.facets.topics_for.db')
 
     docs = Document.objects.filter(
@@ -34,7 +60,9 @@ def topics_for(product, parent=False):
     if parent or parent is None:
         qs = qs.filter(parent=parent)
 
-    return qs
+    topics = list(qs)
+    cache.set(key, topics, NAVIGATION_INDEX_TIMEOUT)
+    return topics
 
 
 def documents_for(locale, topics=None, products=None):
@@ -54,7 +82,14 @@ def documents_for(locale, topics=None, products=None):
         document_title
         url
         document_parent_id
+
+    Lookups for one product and at most one topic, which is what the
+    product and topic landing pages do, come from the navigation index.
     """
+    if products and len(products) == 1 and len(topics or []) <= 1:
+        topic = topics[0] if topics else None
+        return _navigation_documents_for(locale, products[0], topic)
+
     documents = _documents_for(locale, topics, products)
 
     # For locales that aren't en-US, get the en-US documents
@@ -123,7 +158,11 @@ def _es_documents_for(locale, topics=None, products=None):
 
 
 def _db_documents_for(locale, topics=None, products=None):
-    """DB implementation of documents_for."""
+    """DB implementation of documents_for.
+
+    This is one query regardless of how many documents there are.
+
+    """
     qs = Document.objects.filter(
         locale=locale,
         is_archived=False,
@@ -134,15 +173,18 @@ def _db_documents_for(locale, topics=None, products=None):
     for product in products or []:
         qs = qs.filter(products=product)
 
-    # Convert the results to a dicts to look like the ES results.
+    # Convert the results to a dicts to look like the ES results. The
+    # urls are built by hand like get_absolute_url does, so we don't
+    # need instances.
     doc_dicts = []
-    for d in qs.distinct():
+    for d in qs.values('id', 'title', 'slug', 'parent_id',
+                       'current_revision__summary').distinct():
         doc_dicts.append(dict(
-            id=d.id,
-            document_title=d.title,
-            url=d.get_absolute_url(),
-            document_parent_id=d.parent_id,
-            document_summary=d.current_revision.summary))
+            id=d['id'],
+            document_title=d['title'],
+            url=reverse('wiki.document', locale=locale, args=[d['slug']]),
+            document_parent_id=d['parent_id'],
+            document_summary=d['current_revision__summary']))
 
     return doc_dicts
 
@@ -156,3 +198,235 @@ def _documents_for_cache_key(locale, topics, products):
 
     m.update(key)
     return 'documents_for:%s' % m.hexdigest()
+
+
+def _navigation_documents_for(locale, product, topic=None):
+    """Navigation index implementation of documents_for.
+
+    This is a single cache read for the locale and en-US entries. Missing
+    entries are built from the database and stored.
+
+    """
+    entries = [(locale, product.id, topic.id if topic else None)]
+    if locale != settings.WIKI_DEFAULT_LANGUAGE:
+        entries.append((settings.WIKI_DEFAULT_LANGUAGE,) + entries[0][1:])
+
+    keys = [_navigation_index_key(*entry) for entry in entries]
+    cached = cache.get_many(keys)
+    missing = [entry for entry, key in zip(entries, keys)
+               if key not in cached]
+    if missing:
+        statsd.incr('wiki.facets.navigation.miss')
+        built = _store_navigation_entries(missing)
+        for entry in missing:
+            cached[_navigation_index_key(*entry)] = built[entry]
+    else:
+        statsd.incr('wiki.facets.navigation.hit')
+
+    documents = cached[keys[0]]
+    if locale == settings.WIKI_DEFAULT_LANGUAGE:
+        return documents, None
+
+    l10n_document_ids = set(d['document_parent_id'] for d in documents)
+    fallback_documents = [d for d in cached[keys[1]] if
+                          d['id'] not in l10n_document_ids]
+    return documents, fallback_documents
+
+
+def _navigation_index_key(locale, product_id, topic_id):
+    return NAVIGATION_INDEX_KEY.format(
+        locale=locale, product=product_id, topic=topic_id)
+
+
+def _navigation_memberships(original_ids):
+    """Returns the entries the documents belong in, keyed by locale.
+
+    :arg original_ids: ids of the documents, or of their parents for
+        translations, since they inherit topics and products
+
+    Returns a dict of original id -> list of (product id, topic id)
+    pairs, which become entries with the locale of each document. This
+    is two queries.
+
+    """
+    through = Document.products.through
+    products = defaultdict(list)
+    for doc_id, product_id in (through.objects
+                               .filter(document__in=original_ids)
+                               .values_list('document', 'product')):
+        products[doc_id].append(product_id)
+
+    topics = defaultdict(list)
+    for doc_id, topic_id, product_id in (
+            Topic.objects.filter(document__in=original_ids)
+                         .values_list('document', 'id', 'product')):
+        topics[doc_id].append((topic_id, product_id))
+
+    pairs = {}
+    for doc_id in original_ids:
+        pairs[doc_id] = (
+            [(p, None) for p in products[doc_id]] +
+            [(p, t) for t, p in topics[doc_id] if p in products[doc_id]])
+    return pairs
+
+
+def _build_navigation_entries(entries=None):
+    """Builds navigation index entries from the database.
+
+    :arg entries: (optional) (locale, product id, topic id) tuples to
+        build. If None, this builds all of them.
+
+    Returns a tuple of a dict of entry -> list of document dicts, like
+    the ones ``documents_for`` returns, in the order ES would return
+    them, and a dict of document id -> entries it belongs in for the
+    documents that were looked at.
+
+    This does a fixed number of queries regardless of how many entries
+    or documents there are.
+
+    """
+    docs = (Document.objects
+            .filter(is_archived=False,
+                    current_revision__isnull=False,
+                    category__in=settings.IA_DEFAULT_CATEGORIES)
+            .exclude(html__startswith=REDIRECT_HTML))
+    if entries is not None:
+        if not entries:
+            return {}, {}
+        product_ids = set(e[1] for e in entries)
+        docs = (docs.filter(locale__in=set(e[0] for e in entries))
+                    .filter(Q(products__in=product_ids) |
+                            Q(parent__products__in=product_ids)))
+    docs = list(docs.values(
+        'id', 'title', 'slug', 'locale', 'parent_id', 'display_order',
+        'parent__display_order', 'current_revision__summary').distinct())
+
+    # Helpful votes in the last 30 days, like document_recent_helpful_votes
+    # in the search index.
+    votes = (HelpfulVote.objects
+             .filter(created__gt=datetime.now() - timedelta(days=30),
+                     helpful=True))
+    if entries is not None:
+        votes = votes.filter(revision__document__in=[d['id'] for d in docs])
+    votes = dict(votes.values('revision__document')
+                      .order_by()
+                      .annotate(num=Count('id'))
+                      .values_list('revision__document', 'num'))
+
+    pairs = _navigation_memberships(
+        set(d['parent_id'] or d['id'] for d in docs))
+
+    built = defaultdict(list)
+    memberships = {}
+    for d in docs:
+        doc_entries = [(d['locale'], p, t)
+                       for p, t in pairs[d['parent_id'] or d['id']]]
+        memberships[d['id']] = doc_entries
+        for entry in doc_entries:
+            built[entry].append(d)
+
+    def sort_key(d):
+        if d['parent_id']:
+            display_order = d['parent__display_order']
+        else:
+            display_order = d['display_order']
+        return display_order, -votes.get(d['id'], 0), d['id']
+
+    ret = {}
+    for entry in (built if entries is None else entries):
+        ret[entry] = [
+            dict(id=d['id'],
+                 document_title=d['title'],
+                 url=reverse('wiki.document', locale=d['locale'],
+                             args=[d['slug']]),
+                 document_parent_id=d['parent_id'],
+                 document_summary=d['current_revision__summary'])
+            for d in sorted(built[entry], key=sort_key)[:NAVIGATION_INDEX_SIZE]]
+
+    return ret, memberships
+
+
+def _store_navigation_entries(entries=None):
+    """Builds navigation index entries and stores them in the cache.
+
+    This also stores the entries each of the documents belongs in, so
+    that they get rebuilt when it changes.
+
+    Returns the built entries.
+
+    """
+    built, memberships = _build_navigation_entries(entries)
+    data = dict((_navigation_index_key(*entry), docs)
+                for entry, docs in built.items())
+    data.update((NAVIGATION_MEMBERSHIP_KEY % id_, doc_entries)
+                for id_, doc_entries in memberships.items())
+    cache.set_many(data, NAVIGATION_INDEX_TIMEOUT)
+    return built
+
+
+def update_navigation_index(document_ids):
+    """Rebuilds the navigation index entries these documents are in.
+
+    That's the entries they were in when they were last stored and the
+    ones they belong in now, for them and for their translations, which
+    inherit their topics and products. Documents that were deleted are
+    dropped from the entries they were in.
+
+    """
+    ids = set(document_ids)
+    docs = list(Document.objects.filter(Q(id__in=ids) | Q(parent__in=ids))
+                                .values_list('id', 'locale', 'parent_id'))
+    ids.update(d[0] for d in docs)
+
+    pairs = _navigation_memberships(set(d[2] or d[0] for d in docs))
+    entries = set()
+    for id_, locale, parent_id in docs:
+        entries.update((locale, p, t) for p, t in pairs[parent_id or id_])
+
+    membership_keys = [NAVIGATION_MEMBERSHIP_KEY % id_ for id_ in ids]
+    for old_entries in cache.get_many(membership_keys).values():
+        entries.update(tuple(entry) for entry in old_entries)
+
+    # Documents that don't belong anywhere now won't get their
+    # memberships overwritten, so drop them.
+    cache.delete_many(membership_keys)
+    _store_navigation_entries(entries)
+    statsd.incr('wiki.facets.navigation.update', len(entries))
+
+
+def rebuild_navigation_index():
+    """Rebuilds all the navigation index entries.
+
+    Run this periodically so recent helpful vote counts don't go stale.
+
+    """
+    _store_navigation_entries()
+
+
+def _pending_navigation_updates():
+    """(Create and) return the threadlocal set of pending document ids."""
+    if getattr(_local, 'document_ids', None) is None:
+        _local.document_ids = set()
+    return _local.document_ids
+
+
+def navigation_changed(document_id):
+    """Registers a document's navigation index entries to be rebuilt at
+    the end of the request."""
+    _pending_navigation_updates().add(document_id)
+
+
+def file_navigation_updates(**kwargs):
+    """Files one task to rebuild the pending navigation index entries."""
+    # Import here to avoid a circular import.
+    from kitsune.wiki import tasks
+
+    document_ids = _pending_navigation_updates()
+    if not document_ids:
+        return
+
+    tasks.update_navigation_index.delay(sorted(document_ids))
+    document_ids.clear()
+
+
+signals.request_finished.connect(file_navigation_updates)
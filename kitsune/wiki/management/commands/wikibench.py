@@ -0,0 +1,35 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from kitsune.search.utils import FakeLogger
+from kitsune.wiki.benchmark import run_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the wiki parsers on a generated corpus.'
+    option_list = BaseCommand.option_list + (
+        make_option('--docs', type='int', dest='docs', default=200,
+                    help='Number of articles to generate'),
+        make_option('--iterations', type='int', dest='iterations',
+                    default=3, help='Number of times to render the corpus'),
+        make_option('--seed', type='int', dest='seed', default=0,
+                    help='Seed for generating the corpus'),
+        make_option('--keep', action='store_true', dest='keep',
+                    help='Keeps the corpus in the database afterwards'),
+        )
+
+    def handle(self, *args, **options):
+        if options['docs'] < 1 or options['iterations'] < 1:
+            raise CommandError('docs and iterations should be at least 1')
+
+        # The corpus is made in a transaction that gets rolled back, so
+        # this can run against a development database.
+        with transaction.atomic():
+            run_benchmark(num_docs=options['docs'],
+                          iterations=options['iterations'],
+                          seed=options['seed'],
+                          log=FakeLogger(self.stdout))
+            if not options['keep']:
+                transaction.set_rollback(True)
@@ -2,6 +2,7 @@ import hashlib
 import itertools
 import logging
 import time
+from collections import defaultdict
 from datetime import datetime, timedelta
 from urlparse import urlparse
 
@@ -11,7 +12,8 @@ from django.core.cache import cache
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.core.urlresolvers import resolve
 from django.db import models, IntegrityError
-from django.db.models import Q
+from django.db.models import Count, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.http import Http404
 from django.utils.encoding import smart_str
 
@@ -28,13 +30,17 @@ from kitsune.search.models import (
     register_mapping_type)
 from kitsune.sumo import ProgrammingError
 from kitsune.sumo.models import ModelBase, LocaleField
+from kitsune.sumo.tasks import purge_surrogate_keys
 from kitsune.sumo.urlresolvers import reverse, split_path
+from kitsune.sumo.utils import bump_cache_version, touch_modified_time
 from kitsune.tags.models import BigVocabTaggableMixin
 from kitsune.wiki.config import (
     CATEGORIES, SIGNIFICANCES, TYPO_SIGNIFICANCE, MEDIUM_SIGNIFICANCE,
     MAJOR_SIGNIFICANCE, REDIRECT_HTML, REDIRECT_CONTENT, REDIRECT_TITLE,
     REDIRECT_SLUG, CANNED_RESPONSES_CATEGORY, ADMINISTRATION_CATEGORY,
-    TEMPLATES_CATEGORY, DOC_HTML_CACHE_KEY, TEMPLATE_TITLE_PREFIX)
+    TEMPLATES_CATEGORY, DOC_HTML_CACHE_KEY, TEMPLATE_TITLE_PREFIX,
+    DOC_SURROGATE_KEY, KB_SURROGATE_KEY, DOC_PAGE_MODIFIED_KEY,
+    TOPICS_FOR_VERSION_KEY)
 from kitsune.wiki.permissions import DocumentPermissionMixin
 
 
@@ -430,6 +436,49 @@ class Document(NotificationsMixin, ModelBase, BigVocabTaggableMixin,
                 return None
         return doc
 
+    @classmethod
+    def id_resolver(cls, check_host=True):
+        """Return a function that maps URLs to Document ids.
+
+        The function returns what ``from_url(url, id_only=True)`` would
+        return the id of, or None. It resolves everything in memory from
+        the locale, slug and parent of every Document, which this loads
+        with one query, so use it for resolving lots of URLs at once.
+
+        Slugs match case-insensitively, like they do in the db for
+        ``from_url``.
+
+        """
+        by_slug = {}
+        translations = {}
+        for id_, locale, slug, parent_id in cls.objects.values_list(
+                'id', 'locale', 'slug', 'parent_id'):
+            by_slug[(locale, slug.lower())] = id_
+            if parent_id:
+                translations[(parent_id, locale)] = id_
+
+        def resolve(url):
+            try:
+                components = _doc_components_from_url(url,
+                                                      check_host=check_host)
+            except _NotDocumentView:
+                return None
+            if not components:
+                return None
+            locale, path, slug = components
+            slug = slug.lower()
+
+            id_ = by_slug.get((locale, slug))
+            if id_ is None:
+                # Fall back to the translation of the default language
+                # document with that slug, or to that document itself.
+                id_ = by_slug.get((settings.WIKI_DEFAULT_LANGUAGE, slug))
+                if id_ is not None:
+                    id_ = translations.get((id_, locale), id_)
+            return id_
+
+        return resolve
+
     def redirect_url(self, source_locale=settings.LANGUAGE_CODE):
         """If I am a redirect, return the URL to which I redirect.
 
@@ -621,20 +670,14 @@ class Document(NotificationsMixin, ModelBase, BigVocabTaggableMixin,
         if not self.current_revision:
             return ''
 
-        # Remove "what links here" reverse links, because they might be
-        # stale and re-rendering will re-add them. This cannot be done
-        # reliably in the parser's parse() function, because that is
-        # often called multiple times per document.
-        self.links_from().delete()
-
-        # Also delete the DocumentImage instances for this document.
-        DocumentImage.objects.filter(document=self).delete()
-
+        # WhatLinksHereParser updates the links and images of this
+        # document to match what it finds.
         from kitsune.wiki.parser import wiki_to_html, WhatLinksHereParser
         return wiki_to_html(self.current_revision.content,
                             locale=self.locale,
                             doc_id=self.id,
-                            parser_cls=WhatLinksHereParser)
+                            parser_cls=WhatLinksHereParser,
+                            revision_id=self.current_revision_id)
 
     def links_from(self):
         """Get a query set of links that are from this document to another."""
@@ -662,10 +705,34 @@ class Document(NotificationsMixin, ModelBase, BigVocabTaggableMixin,
             # This DocumentImage already exists, ok.
             pass
 
-    def clear_cached_html(self):
+    def clear_cached_html(self, purge=True):
+        """Clears the cached pages of this document.
+
+        Pass ``purge=False`` to leave the pages at the edge alone, for
+        callers that purge many documents at once.
+
+        """
         # Clear out both mobile and desktop templates.
         for mobile, minimal in itertools.product([True, False], repeat=2):
             cache.delete(doc_html_cache_key(self.locale, self.slug, mobile, minimal))
+        # Browsers revalidating their copies should get the new html.
+        touch_modified_time(DOC_PAGE_MODIFIED_KEY % self.id)
+        if purge:
+            # And the pages at the edge, including the ones that use this.
+            purge_surrogate_keys.delay([DOC_SURROGATE_KEY % self.id])
+
+    def surrogate_keys(self):
+        """Returns the surrogate keys for pages showing this document.
+
+        Purging the key of a template purges the pages of the documents
+        that use it.
+
+        """
+        dependencies = (self.links_from()
+                        .filter(kind__in=['template', 'include'])
+                        .values_list('linked_to_id', flat=True))
+        return ([KB_SURROGATE_KEY, DOC_SURROGATE_KEY % self.id] +
+                [DOC_SURROGATE_KEY % id_ for id_ in dependencies])
 
 
 @register_mapping_type
@@ -736,60 +803,121 @@ class DocumentMappingType(SearchMappingType):
             obj = model.objects.select_related(
                 'current_revision', 'parent').get(pk=obj_id)
 
-        if obj.html.startswith(REDIRECT_HTML):
+        if not cls._is_indexable(obj):
             # It's possible this document is indexed and was turned
             # into a redirect, so now we want to explicitly unindex
             # it. The way we do that is by throwing an exception
             # which gets handled by the indexing machinery.
             raise UnindexMeBro()
 
-        d = {}
-        d['id'] = obj.id
-        d['model'] = cls.get_mapping_type_name()
-        d['url'] = obj.get_absolute_url()
-        d['indexed_on'] = int(time.time())
-
-        d['topic'] = [t.slug for t in obj.get_topics()]
-        d['product'] = [p.slug for p in obj.get_products()]
-
-        d['document_title'] = obj.title
-        d['document_locale'] = obj.locale
-        d['document_parent_id'] = obj.parent.id if obj.parent else None
-        d['document_content'] = obj.html
-        d['document_category'] = obj.category
-        d['document_slug'] = obj.slug
-        d['document_is_archived'] = obj.is_archived
-        d['document_display_order'] = obj.original.display_order
-
-        d['document_summary'] = obj.summary
-        if obj.current_revision is not None:
+        return cls._documents_from_objects([obj])[0]
+
+    @classmethod
+    def extract_documents(cls, ids):
+        """Extracts indexable attributes for a batch of Documents.
+
+        This does a fixed number of queries regardless of how many ids
+        there are.
+
+        """
+        model = cls.get_model()
+        objs = list(model.objects.select_related('current_revision', 'parent')
+                                 .filter(pk__in=ids))
+
+        # Redirects get unindexed. See extract_document.
+        ret = [(obj.id, None) for obj in objs if not cls._is_indexable(obj)]
+        objs = [obj for obj in objs if cls._is_indexable(obj)]
+        ret.extend(zip([obj.id for obj in objs],
+                       cls._documents_from_objects(objs)))
+        return ret
+
+    @classmethod
+    def _is_indexable(cls, obj):
+        """Returns whether a Document belongs in the index.
+
+        Documents without a current revision and redirects don't. This
+        mirrors what index does, for code that bulk indexes.
+
+        """
+        return (obj.current_revision_id is not None and
+                not obj.html.startswith(REDIRECT_HTML))
+
+    @classmethod
+    def _documents_from_objects(cls, objs):
+        """Builds documents from a list of Documents.
+
+        The Documents should be indexable and have current_revision and
+        parent already selected. Topics, products and helpful votes are pulled in
+        with one query each for the whole list.
+
+        """
+        if not objs:
+            return []
+
+        # Translations inherit topics and products from their parent.
+        original_ids = set(obj.original.id for obj in objs)
+
+        topics = defaultdict(list)
+        for doc_id, slug in (Topic.objects.filter(document__in=original_ids)
+                                          .values_list('document', 'slug')):
+            topics[doc_id].append(slug)
+
+        products = defaultdict(list)
+        for doc_id, slug in (Product.objects.filter(document__in=original_ids)
+                                            .values_list('document', 'slug')):
+            products[doc_id].append(slug)
+
+        # Don't query for helpful votes if the document is a template
+        # or is in Navigation category (50).
+        voteable_ids = [obj.id for obj in objs
+                        if not obj.is_template and not obj.category == 50]
+        helpful_votes = {}
+        if voteable_ids:
+            start = datetime.now() - timedelta(days=30)
+            helpful_votes = dict(
+                HelpfulVote.objects
+                           .filter(revision__document__in=voteable_ids,
+                                   created__gt=start, helpful=True)
+                           .values('revision__document')
+                           .order_by()
+                           .annotate(num=Count('id'))
+                           .values_list('revision__document', 'num'))
+
+        now = int(time.time())
+        documents = []
+        for obj in objs:
+            d = {}
+            d['id'] = obj.id
+            d['model'] = cls.get_mapping_type_name()
+            d['url'] = obj.get_absolute_url()
+            d['indexed_on'] = now
+
+            d['topic'] = topics[obj.original.id]
+            d['product'] = products[obj.original.id]
+
+            d['document_title'] = obj.title
+            d['document_locale'] = obj.locale
+            d['document_parent_id'] = obj.parent.id if obj.parent else None
+            d['document_content'] = obj.html
+            d['document_category'] = obj.category
+            d['document_slug'] = obj.slug
+            d['document_is_archived'] = obj.is_archived
+            d['document_display_order'] = obj.original.display_order
+
+            d['document_summary'] = obj.summary
             d['document_keywords'] = obj.current_revision.keywords
             d['updated'] = int(time.mktime(
                 obj.current_revision.created.timetuple()))
             d['document_current_id'] = obj.current_revision.id
-            d['document_recent_helpful_votes'] = obj.recent_helpful_votes
-        else:
-            d['document_summary'] = None
-            d['document_keywords'] = None
-            d['updated'] = None
-            d['document_current_id'] = None
-            d['document_recent_helpful_votes'] = 0
-
-        # Don't query for helpful votes if the document doesn't have a current
-        # revision, or is a template, or is a redirect, or is in Navigation
-        # category (50).
-        if (obj.current_revision and
-                not obj.is_template and
-                not obj.html.startswith(REDIRECT_HTML) and
-                not obj.category == 50):
-            d['document_recent_helpful_votes'] = obj.recent_helpful_votes
-        else:
-            d['document_recent_helpful_votes'] = 0
 
-        # Select a locale-appropriate default analyzer for all strings.
-        d['_analyzer'] = es_analyzer_for_locale(obj.locale)
+            d['document_recent_helpful_votes'] = helpful_votes.get(obj.id, 0)
+
+            # Select a locale-appropriate default analyzer for all strings.
+            d['_analyzer'] = es_analyzer_for_locale(obj.locale)
 
-        return d
+            documents.append(d)
+
+        return documents
 
     @classmethod
     def get_indexable(cls):
@@ -1101,54 +1229,110 @@ class RevisionMetricsMappingType(SearchMappingType):
             }
         }
 
+    _extract_fields = ['id', 'created', 'creator_id', 'reviewed',
+                       'reviewer_id', 'is_approved', 'document_id']
+    _extract_composed_fields = ['document__locale', 'document__slug',
+                                'document__parent_id']
+
     @classmethod
     def extract_document(cls, obj_id, obj=None):
-        """Extracts indexable attributes from an Answer."""
-        fields = ['id', 'created', 'creator_id', 'reviewed', 'reviewer_id',
-                  'is_approved', 'document_id']
-        composed_fields = ['document__locale', 'document__slug']
-        all_fields = fields + composed_fields
-
+        """Extracts indexable attributes from a Revision."""
         if obj is None:
             model = cls.get_model()
-            obj_dict = model.objects.values(*all_fields).get(pk=obj_id)
+            obj_dict = model.objects.values(
+                *cls._extract_fields + cls._extract_composed_fields).get(
+                    pk=obj_id)
         else:
             obj_dict = dict([(field, getattr(obj, field))
-                             for field in fields])
+                             for field in cls._extract_fields])
             obj_dict['document__locale'] = obj.document.locale
             obj_dict['document__slug'] = obj.document.slug
+            obj_dict['document__parent_id'] = obj.document.parent_id
 
-        d = {}
-        d['id'] = obj_dict['id']
-        d['model'] = cls.get_mapping_type_name()
+        return cls._documents_from_values([obj_dict])[0]
 
-        # We do this because get_absolute_url is an instance method
-        # and we don't want to create an instance because it's a DB
-        # hit and expensive. So we do it by hand. get_absolute_url
-        # doesn't change much, so this is probably ok.
-        d['url'] = reverse('wiki.revision', kwargs={
-            'revision_id': obj_dict['id'],
-            'document_slug': obj_dict['document__slug']})
+    @classmethod
+    def extract_documents(cls, ids):
+        """Extracts indexable attributes for a batch of Revisions."""
+        model = cls.get_model()
+        obj_dicts = list(model.objects.filter(pk__in=ids).values(
+            *cls._extract_fields + cls._extract_composed_fields))
+        return zip([obj_dict['id'] for obj_dict in obj_dicts],
+                   cls._documents_from_values(obj_dicts))
+
+    @classmethod
+    def _documents_from_values(cls, obj_dicts):
+        """Builds documents from a list of Revision values dicts."""
+        if not obj_dicts:
+            return []
+
+        # Translations inherit products from their parent, so we look
+        # products up by the original document.
+        def original_id(obj_dict):
+            return obj_dict['document__parent_id'] or obj_dict['document_id']
+
+        products = defaultdict(list)
+        original_ids = set(original_id(obj_dict) for obj_dict in obj_dicts)
+        for doc_id, slug in (Product.objects.filter(document__in=original_ids)
+                                            .values_list('document', 'slug')):
+            products[doc_id].append(slug)
+
+        now = int(time.time())
+        documents = []
+        for obj_dict in obj_dicts:
+            d = {}
+            d['id'] = obj_dict['id']
+            d['model'] = cls.get_mapping_type_name()
+
+            # We do this because get_absolute_url is an instance method
+            # and we don't want to create an instance because it's a DB
+            # hit and expensive. So we do it by hand. get_absolute_url
+            # doesn't change much, so this is probably ok.
+            d['url'] = reverse('wiki.revision', kwargs={
+                'revision_id': obj_dict['id'],
+                'document_slug': obj_dict['document__slug']})
 
-        d['indexed_on'] = int(time.time())
+            d['indexed_on'] = now
 
-        d['created'] = obj_dict['created']
-        d['reviewed'] = obj_dict['reviewed']
+            d['created'] = obj_dict['created']
+            d['reviewed'] = obj_dict['reviewed']
 
-        d['locale'] = obj_dict['document__locale']
-        d['is_approved'] = obj_dict['is_approved']
-        d['creator_id'] = obj_dict['creator_id']
-        d['reviewer_id'] = obj_dict['reviewer_id']
+            d['locale'] = obj_dict['document__locale']
+            d['is_approved'] = obj_dict['is_approved']
+            d['creator_id'] = obj_dict['creator_id']
+            d['reviewer_id'] = obj_dict['reviewer_id']
 
-        doc = Document.objects.get(id=obj_dict['document_id'])
-        d['product'] = [p.slug for p in doc.get_products()]
+            d['product'] = products[original_id(obj_dict)]
 
-        return d
+            documents.append(d)
+
+        return documents
 
 
 register_for_indexing('revisions', Revision)
 
 
+def invalidate_title_resolutions(sender, instance, **kw):
+    """Titles may resolve to different documents now, so drop the
+    cached resolutions the wiki parser uses."""
+    # Import here to avoid a circular import.
+    from kitsune.sumo.parser import invalidate_resolutions
+    invalidate_resolutions()
+
+post_save.connect(
+    invalidate_title_resolutions, sender=Document,
+    dispatch_uid='wiki_document_save_invalidate_resolutions')
+post_delete.connect(
+    invalidate_title_resolutions, sender=Document,
+    dispatch_uid='wiki_document_delete_invalidate_resolutions')
+post_save.connect(
+    invalidate_title_resolutions, sender=Revision,
+    dispatch_uid='wiki_revision_save_invalidate_resolutions')
+post_delete.connect(
+    invalidate_title_resolutions, sender=Revision,
+    dispatch_uid='wiki_revision_delete_invalidate_resolutions')
+
+
 class HelpfulVote(ModelBase):
     """Helpful or Not Helpful vote on Revision."""
     revision = models.ForeignKey(Revision, related_name='poll_votes')
@@ -1169,6 +1353,82 @@ class HelpfulVoteMetadata(ModelBase):
     value = models.CharField(max_length=1000)
 
 
+def _navigation_changed(document_ids):
+    # Import here to avoid a circular import.
+    from kitsune.wiki.facets import navigation_changed
+    for id_ in document_ids:
+        navigation_changed(id_)
+
+
+def document_navigation_changed(sender, instance, **kw):
+    """The document may be in different navigation index entries now."""
+    if not kw.get('raw'):
+        _navigation_changed([instance.id])
+
+
+def document_facets_changed(sender, instance, action, reverse, pk_set, **kw):
+    """The document's topics or products changed, so it moves between
+    navigation index entries."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        _navigation_changed([instance.id])
+    elif pk_set:
+        _navigation_changed(pk_set)
+
+
+def helpful_vote_navigation_changed(sender, instance, **kw):
+    """Helpful votes change the order of navigation index entries."""
+    if instance.helpful and not kw.get('raw'):
+        _navigation_changed([instance.revision.document_id])
+
+post_save.connect(
+    document_navigation_changed, sender=Document,
+    dispatch_uid='wiki_document_save_navigation')
+post_delete.connect(
+    document_navigation_changed, sender=Document,
+    dispatch_uid='wiki_document_delete_navigation')
+m2m_changed.connect(
+    document_facets_changed, sender=Document.topics.through,
+    dispatch_uid='wiki_document_topics_navigation')
+m2m_changed.connect(
+    document_facets_changed, sender=Document.products.through,
+    dispatch_uid='wiki_document_products_navigation')
+post_save.connect(
+    helpful_vote_navigation_changed, sender=HelpfulVote,
+    dispatch_uid='wiki_helpfulvote_save_navigation')
+
+
+def invalidate_topics_for(sender, instance, **kw):
+    """Topics may have different documents now, so drop the cached
+    topics_for lists."""
+    if kw.get('action', 'post_save')[:5] != 'post_':
+        return
+    if (isinstance(instance, Document) and
+            instance.locale != settings.WIKI_DEFAULT_LANGUAGE):
+        return
+    bump_cache_version(TOPICS_FOR_VERSION_KEY)
+
+post_save.connect(
+    invalidate_topics_for, sender=Document,
+    dispatch_uid='wiki_document_save_invalidate_topics_for')
+post_delete.connect(
+    invalidate_topics_for, sender=Document,
+    dispatch_uid='wiki_document_delete_invalidate_topics_for')
+m2m_changed.connect(
+    invalidate_topics_for, sender=Document.topics.through,
+    dispatch_uid='wiki_document_topics_invalidate_topics_for')
+m2m_changed.connect(
+    invalidate_topics_for, sender=Document.products.through,
+    dispatch_uid='wiki_document_products_invalidate_topics_for')
+post_save.connect(
+    invalidate_topics_for, sender=Topic,
+    dispatch_uid='wiki_topic_save_invalidate_topics_for')
+post_delete.connect(
+    invalidate_topics_for, sender=Topic,
+    dispatch_uid='wiki_topic_delete_invalidate_topics_for')
+
+
 class ImportantDate(ModelBase):
     """Important date that shows up globally on metrics graphs."""
     text = models.CharField(max_length=100)
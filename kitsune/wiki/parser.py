@@ -1,9 +1,14 @@
+import hashlib
 import re
+from collections import namedtuple
 from itertools import count
 from xml.sax.saxutils import quoteattr
 
 from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
 
+import bleach
 from html5lib import HTMLParser
 from html5lib.serializer.htmlserializer import HTMLSerializer
 from html5lib.treebuilders import getTreeBuilder
@@ -11,12 +16,13 @@ from html5lib.treewalkers import getTreeWalker
 from lxml.etree import Element
 from statsd import statsd
 from django.utils.translation import ugettext as _, ugettext_lazy as _lazy
+from wikimarkup.parser import ALLOWED_TAGS
 
 from kitsune.gallery.models import Image
 from kitsune.sumo import parser as sumo_parser
-from kitsune.sumo.parser import ALLOWED_ATTRIBUTES, get_object_fallback
-from kitsune.sumo.utils import uselocale
-from kitsune.wiki.models import Document
+from kitsune.sumo.parser import ALLOWED_ATTRIBUTES, ALLOWED_STYLES
+from kitsune.sumo.utils import bump_cache_version, cache_version, uselocale
+from kitsune.wiki.models import Document, DocumentImage, DocumentLink
 
 
 # block elements wikimarkup knows about (and thus preserves)
@@ -26,10 +32,54 @@ BLOCK_LEVEL_ELEMENTS = ['table', 'blockquote', 'h1', 'h2', 'h3', 'h4', 'h5',
                         'section']
 TEMPLATE_ARG_REGEX = re.compile('{{{([^{]+?)}}}')
 
+# Parsed templates and includes are cached, so a template that's in lots
+# of documents gets parsed once per locale rather than once per document.
+# The cache keys include the fragment's revision and a version for its
+# document that render_document_cascade bumps when something it includes
+# changes. They also include a generation that rebuild_kb bumps, so each
+# rebuild starts fresh.
+FRAGMENT_GENERATION_KEY = 'wiki:fragment:generation'
+FRAGMENT_VERSION_KEY = 'wiki:fragment:version:%s'
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# rebuild_kb skips documents that haven't changed since they were last
+# rendered. Bump this when a change to the parser changes the html it
+# makes, so the next rebuild renders everything.
+RENDER_VERSION = 1
+# The titles a document looked up that didn't resolve to a document in
+# its own locale, so rebuild_kb can tell when creating or translating a
+# document changes what they resolve to.
+UNRESOLVED_TITLES_KEY = 'wiki:unresolved-titles:%s'
+
+# Revisions get compiled into their rendered html split up around the
+# hooks ([[...]]) in them, so documents can be re-rendered by running the
+# hooks again without parsing the whole revision. While compiling, hook
+# output that is safe to swap out gets wrapped in these markers. The slot
+# number is spelled with private use characters too, so parsing that
+# drops the markers can't leave digits behind.
+COMPILED_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+SLOT_OPEN = u'\ue000%s\ue001'
+SLOT_CLOSE = u'\ue002'
+SLOT_DIGIT_ZERO = 0xe003
+SLOT_RE = re.compile(u'\ue000([\ue003-\ue00c]+)\ue001(.*?)\ue002', re.DOTALL)
+SLOT_CHARS_RE = re.compile(u'[\ue000-\ue00c]')
+BLOCK_LEVEL_RE = re.compile(
+    r'<(?:%s)\b' % '|'.join(BLOCK_LEVEL_ELEMENTS), re.IGNORECASE)
+# Heading ids are made from the heading text, so markers in a heading can
+# change its id.
+HEADING_RE = re.compile(r'<h[1-6]\b.*?</h[1-6]>', re.IGNORECASE | re.DOTALL)
+
+HookCall = namedtuple('HookCall', 'tag space name output slotted')
+
 
 def wiki_to_html(wiki_markup, locale=settings.WIKI_DEFAULT_LANGUAGE,
-                 doc_id=None, parser_cls=None):
-    """Wiki Markup -> HTML with the wiki app's enhanced parser"""
+                 doc_id=None, parser_cls=None, revision_id=None):
+    """Wiki Markup -> HTML with the wiki app's enhanced parser
+
+    Pass the id of the revision the markup comes from to re-render it
+    from its compiled form when possible.
+
+    """
     if parser_cls is None:
         parser_cls = WikiParser
 
@@ -37,10 +87,97 @@ def wiki_to_html(wiki_markup, locale=settings.WIKI_DEFAULT_LANGUAGE,
         with uselocale(locale):
             content = parser_cls(doc_id=doc_id).parse(
                 wiki_markup, show_toc=False, locale=locale,
-                toc_string=_('Table of Contents'))
+                toc_string=_('Table of Contents'), revision_id=revision_id)
     return content
 
 
+def _compiled_cache_key(revision_id, kwargs):
+    options = repr(sorted((k, unicode(v)) for k, v in kwargs.items()))
+    return 'wiki:compiled:%s:%s:%s' % (
+        RENDER_VERSION, revision_id, hashlib.md5(options).hexdigest())
+
+
+def _is_inline(html):
+    """Whether swapping this hook output for another can't change how the
+    html around it gets parsed."""
+    return ('\n' not in html and '{for' not in html and
+            not BLOCK_LEVEL_RE.search(html) and
+            not SLOT_CHARS_RE.search(html))
+
+
+def _slot_open(index):
+    return SLOT_OPEN % u''.join(
+        unichr(SLOT_DIGIT_ZERO + int(digit)) for digit in str(index))
+
+
+def _slot_index(digits):
+    return int(''.join(str(ord(digit) - SLOT_DIGIT_ZERO) for digit in digits))
+
+
+def _split_slots(marked, calls, html=None):
+    """Splits the html of a revision into static segments and slots.
+
+    :arg marked: the html with the slotted hook output marked
+    :arg calls: the hook calls recorded while rendering marked
+    :arg html: the html rendered without markers, to check the markers
+        didn't change anything else against
+
+    Returns False if there are no slots, or if the markers didn't come
+    through parsing intact. Markers that end up anywhere but around the
+    hook output, like in an attribute, show up twice or on their own.
+
+    """
+    segments = []
+    slots = []
+    pos = 0
+    for match in SLOT_RE.finditer(marked):
+        segments.append(marked[pos:match.start()])
+        slots.append((_slot_index(match.group(1)), match.group(2)))
+        pos = match.end()
+    segments.append(marked[pos:])
+
+    slotted = [i for i, call in enumerate(calls) if call.slotted]
+    if not slotted:
+        return False
+    if [index for index, output in slots] != slotted:
+        return False
+    if any(SLOT_CHARS_RE.search(segment) for segment in segments):
+        return False
+    if (html is not None and
+            _join_slots(segments, [output for index, output in slots]) != html):
+        return False
+
+    return {'calls': calls, 'segments': segments, 'slots': slots}
+
+
+def _join_slots(segments, outputs):
+    parts = [segments[0]]
+    for output, segment in zip(outputs, segments[1:]):
+        parts.append(output)
+        parts.append(segment)
+    return u''.join(parts)
+
+
+def invalidate_fragments(doc_id):
+    """Invalidates the cached fragments of a document."""
+    bump_cache_version(FRAGMENT_VERSION_KEY % doc_id)
+
+
+def new_fragment_generation():
+    """Invalidates all cached fragments."""
+    bump_cache_version(FRAGMENT_GENERATION_KEY)
+
+
+def _fragment_cache_key(kind, doc, locale):
+    return 'wiki:fragment:%s:%s:%s:%s:%s:%s' % (
+        cache_version(FRAGMENT_GENERATION_KEY),
+        kind,
+        doc.id,
+        cache_version(FRAGMENT_VERSION_KEY % doc.id),
+        doc.current_revision_id,
+        locale)
+
+
 def _format_template_content(content, params):
     """Formats a template's content using passed in arguments"""
 
@@ -348,14 +485,49 @@ class WikiParser(sumo_parser.WikiParser):
         # Stack of document IDs to prevent Include or Template recursion:
         self.inclusions = [doc_id] if doc_id else []
 
+        # Stack of lists of notes for the fragments being parsed. See
+        # note().
+        self._fragment_notes = []
+        # Number of times recursion was caught. Fragments parsed while
+        # that happens depend on what included them, so they don't get
+        # cached.
+        self._recursions = 0
+        # Hook calls recorded while compiling a revision.
+        self._calls = None
+
         # The wiki has additional hooks not used elsewhere
         self.registerInternalLinkHook('Include', self._hook_include)
         self.registerInternalLinkHook('I', self._hook_include)
         self.registerInternalLinkHook('Template', self._hook_template)
         self.registerInternalLinkHook('T', self._hook_template)
 
-    def parse(self, text, **kwargs):
+    def registerInternalLinkHook(self, tag, function):
+        """Registers a hook, and records calls to it while compiling."""
+        if not hasattr(self, '_hooks'):
+            self._hooks = {}
+        self._hooks[tag] = function
+
+        def hook(parser, space, name):
+            output = function(parser, space, name)
+            # Only hooks in the revision itself get recorded, not ones in
+            # the templates and includes it uses.
+            if self._calls is None or self._depth != 1:
+                return output
+
+            output = unicode(output)
+            slotted = _is_inline(output)
+            self._calls.append(HookCall(tag, space, name, output, slotted))
+            if slotted:
+                return (_slot_open(len(self._calls) - 1) + output +
+                        SLOT_CLOSE)
+            return output
+
+        super(WikiParser, self).registerInternalLinkHook(tag, hook)
+
+    def parse(self, text, revision_id=None, **kwargs):
         """Wrap SUMO's parse() to support additional wiki-only features."""
+        if revision_id is not None and not self._depth:
+            return self._parse_revision(text, revision_id, **kwargs)
 
         # Replace fors with inline tokens the wiki formatter will tolerate:
         text, data = ForParser.strip_fors(text)
@@ -382,22 +554,165 @@ class WikiParser(sumo_parser.WikiParser):
 
         return html
 
+    def _parse_revision(self, text, revision_id, **kwargs):
+        """Renders a revision from its compiled form, compiling it first if
+        need be."""
+        key = _compiled_cache_key(revision_id, kwargs)
+        compiled = cache.get(key)
+        if compiled is False:
+            # This revision has nothing to swap out, or can't be compiled.
+            return WikiParser.parse(self, text, **kwargs)
+        if compiled is not None:
+            html = self._render_compiled(compiled, **kwargs)
+            if html is not None:
+                statsd.incr('wiki.compiled.hit')
+                return html
+
+        statsd.incr('wiki.compiled.miss')
+        html, compiled = self._compile(text, **kwargs)
+        cache.set(key, compiled, COMPILED_CACHE_TIMEOUT)
+        return html
+
+    def _compile(self, text, **kwargs):
+        """Returns the html of a revision and its compiled form.
+
+        The compiled form is False for revisions without any hook output
+        that can be swapped out, so they get parsed the usual way.
+
+        """
+        self._calls = []
+        try:
+            marked = WikiParser.parse(self, text, **kwargs)
+        finally:
+            calls, self._calls = self._calls, None
+        if not any(call.slotted for call in calls):
+            # Nothing got marked, so this is the html.
+            return marked, False
+
+        html = None
+        if any(SLOT_CHARS_RE.search(heading)
+               for heading in HEADING_RE.findall(marked)):
+            # A hook in a heading becomes part of the heading's id, so
+            # check the markers didn't change it.
+            html = WikiParser.parse(self, text, **kwargs)
+        compiled = _split_slots(marked, calls, html)
+        if html is None:
+            if compiled:
+                html = _join_slots(
+                    compiled['segments'],
+                    [output for index, output in compiled['slots']])
+            else:
+                html = WikiParser.parse(self, text, **kwargs)
+        return html, compiled
+
+    def _render_compiled(self, compiled, locale=settings.WIKI_DEFAULT_LANGUAGE,
+                         tags=None, attributes=None, styles=None, **kwargs):
+        """Renders a compiled revision by running its hooks again.
+
+        Returns None if some hook output changed in a way that needs the
+        whole revision to be parsed again.
+
+        """
+        self.locale = locale
+        self._lookups = {}
+        self._resolution_version = None
+        calls = compiled['calls']
+        outputs = [None] * len(calls)
+        # Hooks whose output can't be swapped out go first, so when one of
+        # them changed, like a block template in a cascade, this gives up
+        # before running the rest.
+        self._depth += 1
+        try:
+            for i in sorted(range(len(calls)), key=lambda i: calls[i].slotted):
+                call = calls[i]
+                outputs[i] = unicode(
+                    self._hooks[call.tag](self, call.space, call.name))
+                if outputs[i] != call.output and not call.slotted:
+                    return None
+        finally:
+            self._depth -= 1
+
+        slot_outputs = []
+        for index, processed in compiled['slots']:
+            output, new = compiled['calls'][index].output, outputs[index]
+            if new != output:
+                # Only swap output that went through parsing unchanged
+                # for output that would too.
+                if (processed != output or not _is_inline(new) or
+                        bleach.clean(new, tags=tags or ALLOWED_TAGS,
+                                     attributes=attributes or
+                                     ALLOWED_ATTRIBUTES,
+                                     styles=styles or ALLOWED_STYLES,
+                                     strip_comments=True) != new or
+                        ForParser(new).to_unicode() != new):
+                    return None
+                processed = new
+            slot_outputs.append(processed)
+
+        return _join_slots(compiled['segments'], slot_outputs)
+
+    def note(self, note):
+        """Notes something parsing did besides producing html.
+
+        Parsing a fragment might do things, like record a link. When
+        the fragment comes out of the cache, its notes get applied
+        again, so those things still happen.
+
+        :arg note: a (kind, value) tuple
+
+        """
+        for notes in self._fragment_notes:
+            notes.append(note)
+        self.apply_note(note)
+
+    def apply_note(self, note):
+        """Does what a note says. Subclasses that note things do this."""
+        pass
+
+    def _parse_fragment(self, kind, doc, content, **kwargs):
+        """Parses the content of an included document, with caching."""
+        key = _fragment_cache_key(kind, doc, self.locale)
+        fragment = cache.get(key)
+        if fragment is not None:
+            statsd.incr('wiki.fragment.hit')
+            for note in fragment['notes']:
+                self.note(note)
+            self.youtube_videos.extend(fragment['youtube_videos'])
+            return fragment['html']
+
+        statsd.incr('wiki.fragment.miss')
+        recursions = self._recursions
+        num_videos = len(self.youtube_videos)
+        self._fragment_notes.append([])
+        self.inclusions.append(doc.id)
+        try:
+            html = self.parse(content, show_toc=False, locale=self.locale,
+                              **kwargs)
+        finally:
+            self.inclusions.pop()
+            notes = self._fragment_notes.pop()
+
+        if self._recursions == recursions:
+            cache.set(key, {
+                'html': html,
+                'notes': notes,
+                'youtube_videos': self.youtube_videos[num_videos:],
+            }, FRAGMENT_CACHE_TIMEOUT)
+        return html
+
     def _hook_include(self, parser, space, title):
         """Returns the document's parsed content."""
         message = _('The document "%s" does not exist.') % title
-        include = get_object_fallback(Document, title, locale=self.locale)
+        include = self.get_document(title)
         if not include or not include.current_revision:
             return message
 
         if include.id in parser.inclusions:
+            self._recursions += 1
             return RECURSION_MESSAGE % title
-        else:
-            parser.inclusions.append(include.id)
-        ret = parser.parse(include.current_revision.content, show_toc=False,
-                           locale=self.locale)
-        parser.inclusions.pop()
 
-        return ret
+        return self._parse_fragment(
+            'include', include, include.current_revision.content)
 
     # Wiki templates are documents that receive arguments.
     #
@@ -414,22 +729,22 @@ class WikiParser(sumo_parser.WikiParser):
 
         message = _('The template "%s" does not exist or has no approved '
                     'revision.') % short_title
-        template = get_object_fallback(Document, template_title,
-                                       locale=self.locale, is_template=True)
+        template = self.get_document(template_title, is_template=True)
 
         if not template or not template.current_revision:
             return message
 
         if template.id in parser.inclusions:
+            self._recursions += 1
             return RECURSION_MESSAGE % template_title
-        else:
-            parser.inclusions.append(template.id)
+
         c = template.current_revision.content.rstrip()
         # Note: this completely ignores the allowed attributes passed to the
         # WikiParser.parse() method and defaults to ALLOWED_ATTRIBUTES.
-        parsed = parser.parse(c, show_toc=False, attributes=ALLOWED_ATTRIBUTES,
-                              locale=self.locale)
-        parser.inclusions.pop()
+        # The arguments get substituted after parsing, so the parsed
+        # template is the same whatever the arguments are.
+        parsed = self._parse_fragment('template', template, c,
+                                      attributes=ALLOWED_ATTRIBUTES)
 
         # Special case for inline templates
         if '\n' not in c:
@@ -439,23 +754,110 @@ class WikiParser(sumo_parser.WikiParser):
         return _format_template_content(parsed, _build_template_params(params))
 
 
+def _bulk_create(model, objs):
+    """Creates objects in bulk, skipping ones that exist already."""
+    if not objs:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create(objs)
+    except IntegrityError:
+        # Something else created some of these in the meantime. Create
+        # the rest one at a time.
+        for obj in objs:
+            try:
+                with transaction.atomic():
+                    obj.save()
+            except IntegrityError:
+                # This one exists already, ok.
+                pass
+
+
 class WhatLinksHereParser(WikiParser):
     """An extension of the wiki that deals with what links here data."""
 
     def __init__(self, doc_id, **kwargs):
         self.current_doc = Document.objects.get(pk=doc_id)
+        # (kind, document id) of the links parsing comes across.
+        self.links = set()
+        self.image_ids = set()
+        # (title, locale) of the lookups that didn't find a document in
+        # the locale.
+        self.titles = set()
         return (super(WhatLinksHereParser, self)
                 .__init__(doc_id=doc_id, **kwargs))
 
+    def parse(self, *args, **kwargs):
+        """Parses, and then saves the links and images of the document."""
+        if self._depth:
+            return super(WhatLinksHereParser, self).parse(*args, **kwargs)
+
+        self.links = set()
+        self.image_ids = set()
+        self.titles = set()
+        html = super(WhatLinksHereParser, self).parse(*args, **kwargs)
+        self.save_links()
+        return html
+
+    def apply_note(self, note):
+        """Collects the links and images parsing comes across."""
+        kind, id_ = note
+        if kind == 'image':
+            self.image_ids.add(id_)
+        elif kind == 'title':
+            self.titles.add(id_)
+        else:
+            self.links.add(note)
+
+    def _note_resolution(self, title, locale, doc):
+        """Notes a title that didn't resolve to a document in locale."""
+        if doc is None or doc.locale != locale:
+            self.note(('title', (title, locale)))
+
+    def save_links(self):
+        """Makes the document's links and images match what was parsed.
+
+        Only the rows that changed get written. The titles that didn't
+        resolve don't have rows, so they go in the cache.
+
+        """
+        doc = self.current_doc
+        cache.set(UNRESOLVED_TITLES_KEY % doc.id, sorted(self.titles), None)
+
+        existing = dict(
+            ((kind, linked_to_id), pk) for pk, kind, linked_to_id in
+            DocumentLink.objects.filter(linked_from=doc)
+            .values_list('id', 'kind', 'linked_to_id'))
+        stale = [pk for key, pk in existing.iteritems()
+                 if key not in self.links]
+        if stale:
+            DocumentLink.objects.filter(id__in=stale).delete()
+        _bulk_create(DocumentLink, [
+            DocumentLink(linked_from=doc, linked_to_id=id_, kind=kind)
+            for kind, id_ in self.links - set(existing)])
+
+        existing = dict(
+            (image_id, pk) for pk, image_id in
+            DocumentImage.objects.filter(document=doc)
+            .values_list('id', 'image_id'))
+        stale = [pk for image_id, pk in existing.iteritems()
+                 if image_id not in self.image_ids]
+        if stale:
+            DocumentImage.objects.filter(id__in=stale).delete()
+        _bulk_create(DocumentImage, [
+            DocumentImage(document=doc, image_id=image_id)
+            for image_id in self.image_ids - set(existing)])
+
     def _hook_internal_link(self, parser, space, name):
         """Records links between documents, and then calls super()."""
 
         title = name.split('|')[0]
         locale = self.current_doc.locale
 
-        linked_doc = get_object_fallback(Document, title, locale)
+        linked_doc = self.get_document(title, locale=locale)
         if linked_doc is not None:
-            self.current_doc.add_link_to(linked_doc, 'link')
+            self.note(('link', linked_doc.id))
+        self._note_resolution(title, locale, linked_doc)
 
         return (super(WhatLinksHereParser, self)
                 ._hook_internal_link(parser, space, name))
@@ -464,21 +866,23 @@ class WhatLinksHereParser(WikiParser):
         """Record a template link between documents, and then call super()."""
 
         params = name.split('|')
-        template = get_object_fallback(Document, 'Template:' + params[0],
-                                       locale=self.locale, is_template=True)
+        template_title = 'Template:' + params[0]
+        template = self.get_document(template_title, is_template=True)
 
         if template:
-            self.current_doc.add_link_to(template, 'template')
+            self.note(('template', template.id))
+        self._note_resolution(template_title, self.locale, template)
 
         return (super(WhatLinksHereParser, self)
                 ._hook_template(parser, space, name))
 
     def _hook_include(self, parser, space, name):
         """Record an include link between documents, and then call super()."""
-        include = get_object_fallback(Document, name, locale=self.locale)
+        include = self.get_document(name)
 
         if include:
-            self.current_doc.add_link_to(include, 'include')
+            self.note(('include', include.id))
+        self._note_resolution(name, self.locale, include)
 
         return (super(WhatLinksHereParser, self)
                 ._hook_include(parser, space, name))
@@ -486,10 +890,10 @@ class WhatLinksHereParser(WikiParser):
     def _hook_image_tag(self, parser, space, name):
         """Record an image is included in a document, then call super()."""
         title = name.split('|')[0]
-        image = get_object_fallback(Image, title, self.locale)
+        image = self.get_object(Image, title)
 
         if image:
-            self.current_doc.add_image(image)
+            self.note(('image', image.id))
 
         return (super(WhatLinksHereParser, self)
                 ._hook_image_tag(parser, space, name))
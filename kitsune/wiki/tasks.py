@@ -1,5 +1,7 @@
+import hashlib
 import logging
 import time
+from collections import defaultdict
 from datetime import date
 
 from django.conf import settings
@@ -19,11 +21,18 @@ from django.utils.translation import ugettext as _
 from kitsune.kbadge.utils import get_or_create_badge
 from kitsune.sumo import email_utils
 from kitsune.sumo.decorators import timeit
+from kitsune.sumo.tasks import purge_surrogate_keys
 from kitsune.sumo.urlresolvers import reverse
 from kitsune.sumo.utils import chunked
+from kitsune.wiki import facets
 from kitsune.wiki.badges import WIKI_BADGES
+from kitsune.wiki.config import DOC_SURROGATE_KEY
 from kitsune.wiki.models import (
-    Document, points_to_document_view, SlugCollision, TitleCollision, Revision)
+    Document, DocumentImage, DocumentLink, points_to_document_view,
+    SlugCollision, TitleCollision, Revision)
+from kitsune.wiki.parser import (
+    invalidate_fragments, new_fragment_generation, RENDER_VERSION,
+    UNRESOLVED_TITLES_KEY)
 from kitsune.wiki.utils import generate_short_url, BitlyRateLimitException
 
 
@@ -150,7 +159,11 @@ def schedule_rebuild_kb():
 
     cache.set(settings.WIKI_REBUILD_TOKEN, True)
 
-    rebuild_kb.delay()
+    # Rebuilds get scheduled when titles or images change, which can fix
+    # links and images that didn't go anywhere. Images that didn't go
+    # anywhere aren't part of what a document was rendered from, so
+    # render everything.
+    rebuild_kb.delay(force=True)
 
 
 @task
@@ -175,22 +188,243 @@ def add_short_links(doc_ids):
         unpin_this_thread()
 
 
+# rebuild_kb keeps the plan for a rebuild in the cache while it's running.
+REBUILD_PLAN_KEY = 'wiki:rebuild:%s:plan'
+REBUILD_PENDING_KEY = 'wiki:rebuild:%s:%s:pending'
+REBUILD_STARTED_KEY = 'wiki:rebuild:%s:%s:started'
+REBUILD_TIMEOUT = 60 * 60 * 24
+# What a document was rendered from, so rebuild_kb can skip it if that
+# hasn't changed.
+RENDERED_FROM_KEY = 'wiki:rendered-from:%s'
+
+
+def _rendered_from(revision_id, links, image_ids, title_states):
+    """Returns a fingerprint of what a document gets rendered from.
+
+    :arg revision_id: the document's current revision id
+    :arg links: (kind, id, current revision id, slug, title) tuples for
+        the documents it links to. Because nested links are recorded on
+        the including document, these cover the whole tree of templates
+        and includes.
+    :arg image_ids: ids of the images it shows
+    :arg title_states: ((title, locale), state) tuples for the titles it
+        looked up that didn't resolve in its locale. See
+        ``_title_states``.
+
+    """
+    return hashlib.md5(repr(
+        (RENDER_VERSION, revision_id, sorted(links), sorted(image_ids),
+         sorted(title_states))
+    )).hexdigest()
+
+
+def _title_states(titles):
+    """Returns a dict of (title, locale) -> what it could resolve to now.
+
+    That's the documents with the title in the locale and in the default
+    language, and the translations of the latter to the locale. Creating
+    or translating a document a link couldn't find, or fell back to the
+    default language for, changes it.
+
+    """
+    default = settings.WIKI_DEFAULT_LANGUAGE
+    names = list(set(title.lower() for title, locale in titles))
+    locales = set(locale for title, locale in titles) | set([default])
+
+    # Titles compare case-insensitively in the db.
+    by_title = defaultdict(list)
+    for chunk in chunked(names, 1000):
+        rows = (Document.objects.using('default')
+                .filter(title__in=chunk, locale__in=locales)
+                .values_list('title', 'locale', 'id', 'current_revision_id'))
+        for title, locale, id_, revision_id in rows.iterator():
+            by_title[(title.lower(), locale)].append(
+                (id_, revision_id is not None))
+
+    default_ids = [id_ for (name, locale), docs in by_title.iteritems()
+                   if locale == default for id_, approved in docs]
+    translations = defaultdict(list)
+    for chunk in chunked(default_ids, 1000):
+        rows = (Document.objects.using('default')
+                .filter(parent_id__in=chunk)
+                .values_list('parent_id', 'locale', 'id',
+                             'current_revision_id'))
+        for parent_id, locale, id_, revision_id in rows.iterator():
+            translations[(parent_id, locale)].append(
+                (id_, revision_id is not None))
+
+    states = {}
+    for title, locale in titles:
+        name = title.lower()
+        defaults = sorted(by_title.get((name, default), []))
+        states[(title, locale)] = (
+            sorted(by_title.get((name, locale), [])),
+            defaults,
+            sorted(t for id_, approved in defaults
+                   for t in translations.get((id_, locale), [])))
+    return states
+
+
+def _document_links(**filters):
+    """Returns a dict of document id -> list of links from it."""
+    links = defaultdict(list)
+    rows = (DocumentLink.objects.using('default').filter(**filters)
+            .values_list('linked_from_id', 'kind', 'linked_to_id',
+                         'linked_to__current_revision_id',
+                         'linked_to__slug', 'linked_to__title'))
+    for row in rows.iterator():
+        links[row[0]].append(row[1:])
+    return links
+
+
+def _document_images():
+    """Returns a dict of document id -> list of image ids it shows."""
+    images = defaultdict(list)
+    rows = (DocumentImage.objects.using('default')
+            .values_list('document_id', 'image_id'))
+    for document_id, image_id in rows.iterator():
+        images[document_id].append(image_id)
+    return images
+
+
+def _dependency_levels(doc_ids, links):
+    """Sorts documents so templates and includes come first.
+
+    Returns a list of lists of document ids. Documents in each list only
+    include documents in earlier lists. Documents that are part of a
+    cycle of includes end up together in the last list.
+
+    """
+    doc_ids = set(doc_ids)
+    deps = dict((id_, set(l[1] for l in links.get(id_, [])
+                          if l[0] in ('template', 'include') and
+                          l[1] in doc_ids and l[1] != id_))
+                for id_ in doc_ids)
+    levels = []
+    done = set()
+    while deps:
+        level = [id_ for id_, d in deps.iteritems() if d <= done]
+        if not level:
+            # Whatever is left includes itself somewhere along the way.
+            levels.append(sorted(deps))
+            break
+        levels.append(sorted(level))
+        done.update(level)
+        for id_ in level:
+            del deps[id_]
+    return levels
+
+
+def _remember_rendered_from(document):
+    """Remembers what a document that was just rendered was rendered from."""
+    links = _document_links(linked_from=document.id)[document.id]
+    image_ids = (DocumentImage.objects.using('default')
+                 .filter(document=document).values_list('image_id', flat=True))
+    titles = cache.get(UNRESOLVED_TITLES_KEY % document.id) or []
+    states = _title_states(titles)
+    cache.set(RENDERED_FROM_KEY % document.id,
+              _rendered_from(document.current_revision_id, links, image_ids,
+                             [(t, states[t]) for t in titles]),
+              None)
+
+
 @task(rate_limit='3/h')
 @timeit
-def rebuild_kb():
-    """Re-render all documents in the KB in chunks."""
+def rebuild_kb(force=False):
+    """Re-render the documents in the KB that changed, in chunks.
+
+    Documents are rendered in order of their dependencies, a level at a
+    time, so templates and includes get parsed and cached once before the
+    documents that use them get rendered in parallel.
+
+    :arg force: whether to render documents that haven't changed since
+        they were last rendered
+
+    """
     cache.delete(settings.WIKI_REBUILD_TOKEN)
+    # Start with fresh fragments, so each template gets parsed once per
+    # locale during the rebuild.
+    new_fragment_generation()
+
+    revisions = dict(Document.objects.using('default')
+                     .filter(current_revision__isnull=False)
+                     .values_list('id', 'current_revision_id'))
+    links = _document_links()
+    images = _document_images()
+
+    if force:
+        changed = set(revisions)
+    else:
+        rendered = cache.get_many(
+            [RENDERED_FROM_KEY % id_ for id_ in revisions] +
+            [UNRESOLVED_TITLES_KEY % id_ for id_ in revisions])
+        titles = dict((id_, rendered.get(UNRESOLVED_TITLES_KEY % id_))
+                      for id_ in revisions)
+        states = _title_states(
+            set(t for ts in titles.itervalues() if ts for t in ts))
+        # Documents whose titles fell out of the cache get rendered again,
+        # since we can't tell what they resolve to.
+        changed = set(
+            id_ for id_, revision_id in revisions.iteritems()
+            if titles[id_] is None or
+            rendered.get(RENDERED_FROM_KEY % id_) != _rendered_from(
+                revision_id, links.get(id_, []), images.get(id_, []),
+                [(t, states[t]) for t in titles[id_]]))
+    statsd.gauge('wiki.rebuild.changed', len(changed))
+    statsd.gauge('wiki.rebuild.unchanged', len(revisions) - len(changed))
+
+    levels = [[id_ for id_ in level if id_ in changed]
+              for level in _dependency_levels(revisions, links)]
+    levels = [level for level in levels if level]
+    if not levels:
+        return
+
+    log.info('Rebuilding %s of %s documents in %s levels.' % (
+        len(changed), len(revisions), len(levels)))
+    rebuild_id = int(time.time() * 1000)
+    cache.set(REBUILD_PLAN_KEY % rebuild_id, levels, REBUILD_TIMEOUT)
+    _rebuild_kb_level.delay(rebuild_id, 0)
 
-    d = (Document.objects.using('default')
-         .filter(current_revision__isnull=False).values_list('id', flat=True))
 
-    for chunk in chunked(d, 50):
-        _rebuild_kb_chunk.apply_async(args=[chunk])
+@task()
+@timeit
+def _rebuild_kb_level(rebuild_id, level):
+    """Renders one level of a rebuild's plan in parallel chunks."""
+    levels = cache.get(REBUILD_PLAN_KEY % rebuild_id)
+    if levels is None:
+        log.error('Rebuild plan %s is missing.' % rebuild_id)
+        return
+    if level >= len(levels):
+        cache.delete(REBUILD_PLAN_KEY % rebuild_id)
+        return
+
+    chunks = list(chunked(levels[level], settings.WIKI_REBUILD_CHUNK_SIZE))
+    cache.set(REBUILD_PENDING_KEY % (rebuild_id, level), len(chunks),
+              REBUILD_TIMEOUT)
+    for chunk in chunks:
+        _rebuild_kb_chunk.apply_async(args=[chunk, rebuild_id, level])
 
 
-@task(rate_limit='5/m')
+def _finish_rebuild_chunk(rebuild_id, level):
+    """Starts the next level of a rebuild when this one is done."""
+    try:
+        pending = cache.decr(REBUILD_PENDING_KEY % (rebuild_id, level))
+    except ValueError:
+        # The counter fell out of the cache, so carry on rather than
+        # leaving the rebuild hanging.
+        log.warn('Lost count of rebuild %s level %s.' % (rebuild_id, level))
+        pending = 0
+
+    # Only start the next level once.
+    if pending <= 0 and cache.add(
+            REBUILD_STARTED_KEY % (rebuild_id, level + 1), True,
+            REBUILD_TIMEOUT):
+        _rebuild_kb_level.delay(rebuild_id, level + 1)
+
+
+@task(rate_limit=settings.WIKI_REBUILD_CHUNK_RATE_LIMIT)
 @timeit
-def _rebuild_kb_chunk(data):
+def _rebuild_kb_chunk(data, rebuild_id=None, level=None):
     """Re-render a chunk of documents.
 
     Note: Don't use host components when making redirects to wiki pages; those
@@ -201,55 +435,68 @@ def _rebuild_kb_chunk(data):
 
     pin_this_thread()  # Stick to master.
 
-    messages = []
-    start = time.time()
-    for pk in data:
-        message = None
-        try:
-            document = Document.objects.get(pk=pk)
-
-            # If we know a redirect link to be broken (i.e. if it looks like a
-            # link to a document but the document isn't there), log an error:
-            url = document.redirect_url()
-            if (url and points_to_document_view(url) and
-                    not document.redirect_document()):
-                log.warn('Invalid redirect document: %d' % pk)
-
-            html = document.parse_and_calculate_links()
-            if document.html != html:
-                # We are calling update here to so we only update the html
-                # column instead of all of them. This bypasses post_save
-                # signal handlers like the one that triggers reindexing.
-                # See bug 797038 and bug 797352.
-                Document.objects.filter(pk=pk).update(html=html)
-                statsd.incr('wiki.rebuild_chunk.change')
-            else:
-                statsd.incr('wiki.rebuild_chunk.nochange')
-        except Document.DoesNotExist:
-            message = 'Missing document: %d' % pk
-        except Revision.DoesNotExist:
-            message = 'Missing revision for document: %d' % pk
-        except ValidationError as e:
-            message = 'ValidationError for %d: %s' % (pk, e.messages[0])
-        except SlugCollision:
-            message = 'SlugCollision: %d' % pk
-        except TitleCollision:
-            message = 'TitleCollision: %d' % pk
-
-        if message:
-            log.debug(message)
-            messages.append(message)
-    d = time.time() - start
-    statsd.timing('wiki.rebuild_chunk', int(round(d * 1000)))
-
-    if messages:
-        subject = ('[%s] Exceptions raised in _rebuild_kb_chunk()' %
-                   settings.PLATFORM_NAME)
-        mail_admins(subject=subject, message='\n'.join(messages))
-    if not transaction.get_connection().in_atomic_block:
-        transaction.commit()
-
-    unpin_this_thread()  # Not all tasks need to do use the master.
+    # Whatever happens, the rebuild has to move on to the next level.
+    try:
+        messages = []
+        changed = []
+        start = time.time()
+        for pk in data:
+            message = None
+            try:
+                document = Document.objects.get(pk=pk)
+
+                # If we know a redirect link to be broken (i.e. if it looks like a
+                # link to a document but the document isn't there), log an error:
+                url = document.redirect_url()
+                if (url and points_to_document_view(url) and
+                        not document.redirect_document()):
+                    log.warn('Invalid redirect document: %d' % pk)
+
+                html = document.parse_and_calculate_links()
+                if document.html != html:
+                    # We are calling update here to so we only update the html
+                    # column instead of all of them. This bypasses post_save
+                    # signal handlers like the one that triggers reindexing.
+                    # See bug 797038 and bug 797352.
+                    Document.objects.filter(pk=pk).update(html=html)
+                    # The edge is purged for the whole chunk below.
+                    document.clear_cached_html(purge=False)
+                    changed.append(DOC_SURROGATE_KEY % pk)
+                    statsd.incr('wiki.rebuild_chunk.change')
+                else:
+                    statsd.incr('wiki.rebuild_chunk.nochange')
+                _remember_rendered_from(document)
+            except Document.DoesNotExist:
+                message = 'Missing document: %d' % pk
+            except Revision.DoesNotExist:
+                message = 'Missing revision for document: %d' % pk
+            except ValidationError as e:
+                message = 'ValidationError for %d: %s' % (pk, e.messages[0])
+            except SlugCollision:
+                message = 'SlugCollision: %d' % pk
+            except TitleCollision:
+                message = 'TitleCollision: %d' % pk
+
+            if message:
+                log.debug(message)
+                messages.append(message)
+        d = time.time() - start
+        statsd.timing('wiki.rebuild_chunk', int(round(d * 1000)))
+
+        if changed:
+            purge_surrogate_keys.delay(changed)
+
+        if messages:
+            subject = ('[%s] Exceptions raised in _rebuild_kb_chunk()' %
+                       settings.PLATFORM_NAME)
+            mail_admins(subject=subject, message='\n'.join(messages))
+        if not transaction.get_connection().in_atomic_block:
+            transaction.commit()
+    finally:
+        unpin_this_thread()  # Not all tasks need to do use the master.
+
+        if rebuild_id is not None:
+            _finish_rebuild_chunk(rebuild_id, level)
 
 
 @task()
@@ -289,29 +536,54 @@ def render_document_cascade(base):
 
     # This walks along the graph of links between documents. If there is
     # a document A that includes another document B as a template, then
-    # there is an edge from A to B in this graph. The goal here is to
-    # process every node exactly once. This is robust to cycles and
-    # diamonds in the graph, since it keeps track of what nodes have
-    # been visited already.
+    # there is an edge from A to B in this graph. It finds every document
+    # affected before rendering any, so a document that includes two of
+    # them (a diamond in the graph) can't pick up a stale fragment of the
+    # one that hasn't been rendered yet. This is robust to cycles, since
+    # it keeps track of what nodes have been visited already.
 
     # In case any thing goes wrong, this guarantees we unpin the DB
     try:
         # Sends all writes to the master DB. Slaves are readonly.
         pin_this_thread()
 
-        todo = set([base])
-        done = set()
-
+        docs = {base.id: base}
+        todo = [base]
         while todo:
             d = todo.pop()
-            if d in done:
-                # Don't process a node twice.
-                continue
-            d.html = d.parse_and_calculate_links()
-            d.save()
-            done.add(d)
-            todo.update(l.linked_from for l in d.links_to()
-                        .filter(kind__in=['template', 'include']))
+            for l in (d.links_to().filter(kind__in=['template', 'include'])
+                      .select_related('linked_from')):
+                if l.linked_from_id not in docs:
+                    docs[l.linked_from_id] = l.linked_from
+                    todo.append(l.linked_from)
+
+        for id_ in docs:
+            invalidate_fragments(id_)
+
+        # Documents that include others get rendered after them, so they
+        # use their new fragments.
+        links = _document_links(linked_from__in=docs.keys())
+        for level in _dependency_levels(docs.keys(), links):
+            for id_ in level:
+                d = docs[id_]
+                d.html = d.parse_and_calculate_links()
+                d.save()
+                _remember_rendered_from(d)
+
+        # Pages of documents that use this one have its surrogate key, so
+        # this purges all of them now that they're rendered.
+        purge_surrogate_keys.delay([DOC_SURROGATE_KEY % base.id])
+
+    finally:
+        unpin_this_thread()
 
+
+@task()
+@timeit
+def update_navigation_index(document_ids):
+    """Rebuilds the navigation index entries of these documents."""
+    pin_this_thread()  # Stick to master.
+    try:
+        facets.update_navigation_index(document_ids)
     finally:
         unpin_this_thread()
@@ -0,0 +1,48 @@
+from StringIO import StringIO
+
+from nose.tools import eq_
+
+from kitsune.search.utils import FakeLogger
+from kitsune.sumo.tests import TestCase
+from kitsune.wiki.benchmark import PhaseTimer, run_benchmark
+from kitsune.wiki.models import Document
+
+
+class Outer(object):
+    def run(self):
+        return Inner.run() + 1
+
+
+class Inner(object):
+    @staticmethod
+    def run():
+        return 1
+
+
+class PhaseTimerTests(TestCase):
+    def test_patch_and_restore(self):
+        original = Outer.__dict__['run']
+        with PhaseTimer() as timer:
+            timer.patch('outer', Outer, 'run')
+            timer.patch('inner', Inner, 'run')
+            eq_(2, Outer().run())
+            eq_(2, Outer().run())
+
+        eq_({'outer': 2, 'inner': 2}, dict(timer.calls))
+        assert timer.times['outer'] >= 0
+        eq_(original, Outer.__dict__['run'])
+        eq_(1, Inner.run())
+
+
+class RunBenchmarkTests(TestCase):
+    def test_run_benchmark(self):
+        out = StringIO()
+        run_benchmark(num_docs=3, iterations=1, log=FakeLogger(out))
+
+        eq_(3, Document.objects.filter(
+            title__startswith='Bench article').count())
+        output = out.getvalue()
+        assert 'wiki (cold)' in output
+        assert 'wikimarkup' in output
+        assert 'wiki (cascade, compiled)' in output
+        assert 'ForParser' in output
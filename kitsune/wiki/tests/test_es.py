@@ -3,9 +3,11 @@ from datetime import datetime, timedelta
 from nose.tools import eq_
 
 from kitsune.products.tests import ProductFactory, TopicFactory
+from kitsune.search.tests import ExtractDocumentsTestCase
 from kitsune.search.tests.test_es import ElasticTestCase
 from kitsune.wiki.tests import (
-    DocumentFactory, RevisionFactory, HelpfulVoteFactory, RedirectRevisionFactory)
+    DocumentFactory, RevisionFactory, HelpfulVoteFactory, RedirectRevisionFactory,
+    ApprovedRevisionFactory, TranslatedRevisionFactory)
 from kitsune.wiki.models import DocumentMappingType, RevisionMetricsMappingType
 
 
@@ -197,3 +199,29 @@ class RevisionMetricsTests(ElasticTestCase):
         eq_(data['locale'], d.locale)
         eq_(data['product'], [p.slug])
         eq_(data['creator_id'], r.creator_id)
+
+
+class ExtractDocumentsTests(ExtractDocumentsTestCase):
+    def test_documents_match_extract_document(self):
+        t = TopicFactory()
+        p = ProductFactory()
+        rev = ApprovedRevisionFactory(document__products=[p], document__topics=[t])
+        HelpfulVoteFactory(revision=rev, helpful=True)
+        translation = TranslatedRevisionFactory(document__parent=rev.document).document
+        redirect = RedirectRevisionFactory().document
+
+        extracted = self.assert_extract_documents(
+            DocumentMappingType, [rev.document.id, translation.id], 4,
+            skipped=[redirect.id])
+        eq_(extracted[translation.id]['topic'], [t.slug])
+        eq_(extracted[translation.id]['product'], [p.slug])
+        eq_(extracted[rev.document.id]['document_recent_helpful_votes'], 1)
+
+    def test_revisions_match_extract_document(self):
+        p = ProductFactory()
+        rev = ApprovedRevisionFactory(document__products=[p])
+        translated = TranslatedRevisionFactory(document__parent=rev.document)
+
+        extracted = self.assert_extract_documents(
+            RevisionMetricsMappingType, [rev.id, translated.id], 2)
+        eq_(extracted[translated.id]['product'], [p.slug])
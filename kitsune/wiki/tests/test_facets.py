@@ -4,9 +4,11 @@ from kitsune.products.tests import ProductFactory, TopicFactory
 from kitsune.search.tests.test_es import ElasticTestCase
 from kitsune.sumo.tests import TestCase
 from kitsune.wiki.facets import (
-    topics_for, documents_for, _documents_for, _db_documents_for)
+    topics_for, documents_for, _documents_for, _db_documents_for,
+    update_navigation_index)
 from kitsune.wiki.tests import (
-    DocumentFactory, TemplateDocumentFactory, RevisionFactory, ApprovedRevisionFactory)
+    DocumentFactory, TemplateDocumentFactory, RevisionFactory, ApprovedRevisionFactory,
+    HelpfulVoteFactory)
 
 
 class TestFacetHelpersMixin(object):
@@ -26,11 +28,12 @@ class TestFacetHelpersMixin(object):
         # Set up documents.
         doc1 = DocumentFactory(products=[self.desktop], topics=[self.general_d, self.bookmarks_d])
         ApprovedRevisionFactory(document=doc1)
+        self.doc1 = doc1
 
         doc2 = DocumentFactory(
             products=[self.desktop, self.mobile],
             topics=[self.bookmarks_d, self.bookmarks_m, self.sync_d, self.sync_m])
-        ApprovedRevisionFactory(document=doc2)
+        self.doc2_rev = ApprovedRevisionFactory(document=doc2)
 
         # An archived article shouldn't show up
         doc3 = DocumentFactory(
@@ -67,6 +70,68 @@ class TestFacetHelpers(TestCase, TestFacetHelpersMixin):
         mobile_topics = topics_for(product=self.mobile)
         eq_(len(mobile_topics), 2)
 
+    def test_topics_for_cached(self):
+        """topics_for() is cached until a document changes."""
+        eq_(3, len(topics_for(product=self.desktop)))
+        with self.assertNumQueries(0):
+            topics_for(product=self.desktop)
+
+        self.doc1.topics.remove(self.general_d)
+        eq_(2, len(topics_for(product=self.desktop)))
+
+    def test_db_documents_for_queries(self):
+        """The DB fallback is one query however many documents match."""
+        with self.assertNumQueries(1):
+            docs = _db_documents_for(locale='en-US', topics=[self.bookmarks_d])
+        eq_(2, len(docs))
+        eq_(self.doc1.get_absolute_url(),
+            [d for d in docs if d['id'] == self.doc1.id][0]['url'])
+
+    def test_navigation_index(self):
+        """documents_for() for a product and topic uses the index."""
+        docs, fallback = documents_for(
+            locale='en-US', products=[self.desktop], topics=[self.bookmarks_d])
+        eq_(2, len(docs))
+        eq_(None, fallback)
+
+        docs, fallback = documents_for(locale='en-US', products=[self.mobile])
+        eq_(1, len(docs))
+
+        # The second time is a single cache read.
+        with self.assertNumQueries(0):
+            documents_for(
+                locale='en-US', products=[self.desktop], topics=[self.bookmarks_d])
+
+    def test_navigation_index_fallback(self):
+        ApprovedRevisionFactory(document__locale='es', document__parent=self.doc1)
+        docs, fallback = documents_for(
+            locale='es', products=[self.desktop], topics=[self.bookmarks_d])
+        eq_(1, len(docs))
+        eq_(self.doc1.id, docs[0]['document_parent_id'])
+        eq_(1, len(fallback))
+
+    def test_navigation_index_update(self):
+        """Documents move between entries when they change."""
+        documents_for(locale='en-US', products=[self.desktop], topics=[self.general_d])
+        self.doc1.topics.remove(self.general_d)
+        self.doc1.topics.add(self.sync_d)
+        update_navigation_index([self.doc1.id])
+
+        docs, _ = documents_for(
+            locale='en-US', products=[self.desktop], topics=[self.general_d])
+        eq_(0, len(docs))
+        docs, _ = documents_for(
+            locale='en-US', products=[self.desktop], topics=[self.sync_d])
+        eq_(2, len(docs))
+
+    def test_navigation_index_votes(self):
+        """Documents are ordered by recent helpful votes."""
+        HelpfulVoteFactory(revision=self.doc2_rev, helpful=True)
+        update_navigation_index([self.doc2_rev.document_id])
+        docs, _ = documents_for(
+            locale='en-US', products=[self.desktop], topics=[self.bookmarks_d])
+        eq_([self.doc2_rev.document_id, self.doc1.id], [d['id'] for d in docs])
+
 
 class TestFacetHelpersES(ElasticTestCase, TestFacetHelpersMixin):
     def setUp(self):
@@ -401,6 +401,33 @@ class FromUrlTests(TestCase):
         self.assertIsNone(from_url(invalid_url))
         self.assertEqual(d_en, from_url(invalid_url, check_host=False))
 
+    def test_id_resolver(self):
+        """id_resolver() resolves like from_url() without queries."""
+        d_en = DocumentFactory(locale='en-US', title=u'How to delete Google Chrome?')
+        d_tr = DocumentFactory(locale='tr', parent=d_en)
+        d_untranslated = DocumentFactory(locale='en-US')
+        resolve = Document.id_resolver(check_host=False)
+
+        with self.assertNumQueries(0):
+            eq_(d_en.id, resolve(d_en.get_absolute_url()))
+            eq_(d_tr.id, resolve(
+                reverse('wiki.document', locale='tr', args=[d_en.slug])))
+            eq_(d_untranslated.id, resolve(
+                reverse('wiki.document', locale='de', args=[d_untranslated.slug])))
+            eq_(d_en.id, resolve(urlparse.urljoin(
+                'https://support.mozilla.org', d_en.get_absolute_url())))
+            eq_(None, resolve('/en-US/kb/does-not-exist'))
+            eq_(None, resolve('/en-US/questions/1'))
+
+    def test_id_resolver_case_insensitive(self):
+        """id_resolver() matches slugs regardless of case like from_url()."""
+        d = DocumentFactory(locale='en-US', slug='Mixed-Case')
+        url = reverse('wiki.document', locale='en-US', args=['mixed-CASE'])
+        resolve = Document.id_resolver(check_host=False)
+        eq_(d.id, resolve(url))
+        eq_(d.id, resolve(d.get_absolute_url()))
+        eq_(d, Document.from_url(url))
+
 
 class LocalizableOrLatestRevisionTests(TestCase):
     """Tests for Document.localizable_or_latest_revision"""
@@ -3,6 +3,7 @@ import re
 from django.conf import settings
 from django.test.utils import override_settings
 
+import mock
 from nose.tools import eq_
 from pyquery import PyQuery as pq
 
@@ -11,10 +12,12 @@ from kitsune.gallery.models import Video
 from kitsune.gallery.tests import ImageFactory, VideoFactory
 from kitsune.sumo.tests import TestCase
 from kitsune.wiki.config import TEMPLATES_CATEGORY, TEMPLATE_TITLE_PREFIX
-from kitsune.wiki.models import Document
+from kitsune.wiki.models import Document, DocumentLink
 from kitsune.wiki.parser import (
     WikiParser, ForParser, PATTERNS, RECURSION_MESSAGE, _key_split,
+    wiki_to_html,
     _build_template_params as _btp, _format_template_content as _ftc)
+from kitsune.wiki.tasks import render_document_cascade
 from kitsune.wiki.tests import (
     DocumentFactory, TemplateDocumentFactory, RevisionFactory, ApprovedRevisionFactory)
 
@@ -410,6 +413,135 @@ class TestWikiInclude(TestCase):
             re.sub(r'</?p>|\n', '', boo.content_parsed))
 
 
+class TestTitleResolution(TestCase):
+    def test_links_cached_across_renders(self):
+        ApprovedRevisionFactory(document__title='Linked')
+        markup = '[[Linked]] and [[Missing]]'
+        html = WikiParser().parse(markup)
+
+        with self.assertNumQueries(0):
+            eq_(html, WikiParser().parse(markup))
+
+    def test_includes_memoized_in_render(self):
+        doc_rev_parser('Included content', 'Included')
+        markup = '[[Include:Included]] [[Include:Included]]'
+        WikiParser().parse(markup)
+
+        # One query for the document and its current revision. The
+        # second include is memoized.
+        with self.assertNumQueries(1):
+            WikiParser().parse(markup)
+
+    def test_invalidated_on_save(self):
+        p = WikiParser()
+        eq_('new', pq(p.parse('[[Later]]'))('a').attr('class'))
+
+        ApprovedRevisionFactory(document__title='Later')
+        eq_(None, pq(p.parse('[[Later]]'))('a').attr('class'))
+
+
+class TestFragmentCache(TestCase):
+    def test_template_parsed_once(self):
+        """A template used with different arguments is parsed once."""
+        doc_rev_parser('Hi {{{1}}}', TEMPLATE_TITLE_PREFIX + 'test',
+                       category=TEMPLATES_CATEGORY)
+        markup = '[[T:test|Ann]] [[T:test|Bob]]'
+        with mock.patch.object(WikiParser, 'parse', autospec=True,
+                               side_effect=WikiParser.parse) as parse:
+            html = WikiParser().parse(markup)
+        # One call for the markup and one for the template.
+        eq_(2, parse.call_count)
+        assert 'Hi Ann' in html
+        assert 'Hi Bob' in html
+
+    def test_cascade_invalidates(self):
+        """Rendering the cascade rerenders fragments of fragments."""
+        inner, _, _ = doc_rev_parser('Old inner', title='Inner')
+        outer, _, _ = doc_rev_parser('[[Include:Inner]]', title='Outer')
+        doc = ApprovedRevisionFactory(content='[[Include:Outer]]').document
+        doc.html = doc.parse_and_calculate_links()
+        doc.save()
+        outer.html = outer.parse_and_calculate_links()
+        outer.save()
+        assert 'Old inner' in doc.html
+
+        ApprovedRevisionFactory(document=inner, content='New inner')
+        render_document_cascade(Document.objects.get(pk=inner.pk))
+        assert 'New inner' in Document.objects.get(pk=doc.pk).html
+
+    def test_links_recorded_from_cached_fragment(self):
+        """Links inside a cached include still get recorded."""
+        linked, _, _ = doc_rev_parser('', title='Linked')
+        doc_rev_parser('[[Linked]]', title='Included')
+        first = ApprovedRevisionFactory(content='[[Include:Included]]').document
+        first.html = first.parse_and_calculate_links()
+        second = ApprovedRevisionFactory(content='[[Include:Included]]').document
+        second.html = second.parse_and_calculate_links()
+
+        eq_(1, DocumentLink.objects.filter(
+            linked_from=second, linked_to=linked, kind='link').count())
+
+
+class TestCompiledRender(TestCase):
+    def test_link_target_changed(self):
+        """Changed links get swapped in without parsing again."""
+        target = ApprovedRevisionFactory(document__title='Target').document
+        rev = ApprovedRevisionFactory(
+            content='Go to [[Target]] and [[Missing]].\n\n* one\n* two')
+        wiki_to_html(rev.content, revision_id=rev.id)
+
+        target.slug = 'new-slug'
+        target.save()
+        with mock.patch.object(ForParser, 'strip_fors',
+                               wraps=ForParser.strip_fors) as strip_fors:
+            html = wiki_to_html(rev.content, revision_id=rev.id)
+            assert not strip_fors.called
+
+        assert 'new-slug' in html
+        eq_(wiki_to_html(rev.content), html)
+
+    def test_block_template_parses_again(self):
+        """Output that changes the structure around it gets parsed."""
+        t, _, _ = doc_rev_parser('inline', TEMPLATE_TITLE_PREFIX + 'test',
+                                 category=TEMPLATES_CATEGORY)
+        rev = ApprovedRevisionFactory(content='Before [[T:test]] after')
+        wiki_to_html(rev.content, revision_id=rev.id)
+
+        ApprovedRevisionFactory(document=t, content='* one\n* two')
+        html = wiki_to_html(rev.content, revision_id=rev.id)
+        eq_(2, len(pq(html)('li')))
+        eq_(wiki_to_html(rev.content), html)
+
+    def test_compiled_in_one_parse(self):
+        """Compiling doesn't parse the revision twice."""
+        ApprovedRevisionFactory(document__title='Target')
+        rev = ApprovedRevisionFactory(content='Go to [[Target]].')
+        with mock.patch.object(ForParser, 'strip_fors',
+                               wraps=ForParser.strip_fors) as strip_fors:
+            html = wiki_to_html(rev.content, revision_id=rev.id)
+            eq_(1, strip_fors.call_count)
+        eq_(wiki_to_html(rev.content), html)
+
+    def test_link_in_heading(self):
+        """Markers don't end up in heading ids."""
+        ApprovedRevisionFactory(document__title='Target')
+        rev = ApprovedRevisionFactory(content='== Go to [[Target]] ==\n\nText')
+        html = wiki_to_html(rev.content, revision_id=rev.id)
+        eq_(wiki_to_html(rev.content), html)
+        eq_(html, wiki_to_html(rev.content, revision_id=rev.id))
+
+    def test_nothing_to_swap_not_compiled(self):
+        """Revisions with only block hook output get parsed as usual."""
+        doc_rev_parser('* one\n* two', title='Block')
+        rev = ApprovedRevisionFactory(content='[[Include:Block]]')
+        wiki_to_html(rev.content, revision_id=rev.id)
+
+        with mock.patch.object(WikiParser, '_render_compiled') as render:
+            html = wiki_to_html(rev.content, revision_id=rev.id)
+            assert not render.called
+        eq_(wiki_to_html(rev.content), html)
+
+
 class TestWikiVideo(TestCase):
     """Video hook."""
     def tearDown(self):
@@ -936,6 +1068,23 @@ class WhatLinksHereTests(TestCase):
         eq_(len(img.documents), 1)
         eq_(img.documents[0], d1)
 
+    def test_rerender_updates_changed_rows(self):
+        """Re-rendering keeps links that are still there."""
+        img = ImageFactory(title='image-file.png')
+        doc_rev_parser('', title='D1')
+        d2, _, _ = doc_rev_parser('', title='D2')
+        d3, _, _ = doc_rev_parser(
+            '[[D1]] [[D2]] [[Image:image-file.png]]', title='D3')
+        kept = DocumentLink.objects.get(linked_from=d3, linked_to=d2)
+
+        ApprovedRevisionFactory(document=d3, content='[[D2]]')
+        d3 = Document.objects.get(pk=d3.pk)
+        d3.html = d3.parse_and_calculate_links()
+
+        eq_([kept.id], [l.id for l in d3.links_from()])
+        eq_(0, len(d3.images))
+        eq_(0, len(img.documents))
+
 
 class TestLazyWikiImageTags(TestCase):
     def setUp(self):
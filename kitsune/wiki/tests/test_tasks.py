@@ -15,12 +15,15 @@ from nose.tools import eq_
 
 from kitsune.sumo.tests import TestCase
 from kitsune.users.tests import add_permission, UserFactory
-from kitsune.wiki.config import TEMPLATES_CATEGORY, TEMPLATE_TITLE_PREFIX
-from kitsune.wiki.models import Revision, Document
+from kitsune.wiki.config import (
+    TEMPLATES_CATEGORY, TEMPLATE_TITLE_PREFIX, DOC_PAGE_MODIFIED_KEY)
+from kitsune.wiki.models import Revision, Document, doc_html_cache_key
 from kitsune.wiki.tasks import (
     send_reviewed_notification, rebuild_kb, schedule_rebuild_kb,
-    _rebuild_kb_chunk, render_document_cascade)
-from kitsune.wiki.tests import TestCaseBase, RevisionFactory
+    _dependency_levels, _rebuild_kb_chunk, _rebuild_kb_level,
+    render_document_cascade, REBUILD_PENDING_KEY)
+from kitsune.wiki.tests import (
+    TestCaseBase, RevisionFactory, TranslatedRevisionFactory)
 from kitsune.wiki.tests.test_parser import doc_rev_parser
 
 
@@ -105,6 +108,92 @@ class RebuildTestCase(TestCase):
         # There should be 4 documents with an approved revision
         eq_(4, len(apply_async.call_args[1]['args'][0]))
 
+    def test_rebuild_skips_unchanged(self):
+        rebuild_kb()
+
+        with mock.patch.object(_rebuild_kb_chunk, 'apply_async') as chunk:
+            rebuild_kb()
+            assert not chunk.called
+
+            rebuild_kb(force=True)
+            eq_(4, len(chunk.call_args[1]['args'][0]))
+
+    def test_rebuild_changed_dependency(self):
+        rebuild_kb()
+        d = Document.objects.all()[0]
+        RevisionFactory(document=d, is_approved=True)
+
+        with mock.patch.object(_rebuild_kb_chunk, 'apply_async') as chunk:
+            rebuild_kb()
+            eq_([d.id], chunk.call_args[1]['args'][0])
+
+    def test_rebuild_chunk_clears_cached_html(self):
+        d = Document.objects.filter(current_revision__isnull=False)[0]
+        Document.objects.filter(pk=d.pk).update(html='stale')
+        key = doc_html_cache_key(d.locale, d.slug, False, False)
+        cache.set(key, 'stale page')
+
+        _rebuild_kb_chunk([d.id])
+
+        assert cache.get(key) is None
+        assert cache.get(DOC_PAGE_MODIFIED_KEY % d.id)
+
+    @mock.patch.object(_rebuild_kb_level, 'delay')
+    @mock.patch.object(Document, 'parse_and_calculate_links')
+    def test_rebuild_chunk_error_finishes_level(self, parse, level_delay):
+        parse.side_effect = RuntimeError
+        ids = list(Document.objects.values_list('id', flat=True))
+        cache.set(REBUILD_PENDING_KEY % (42, 0), 1)
+
+        try:
+            _rebuild_kb_chunk(ids, 42, 0)
+        except RuntimeError:
+            pass
+        else:
+            assert False, 'The error should be raised.'
+
+        # The next level runs even though the chunk failed.
+        level_delay.assert_called_once_with(42, 1)
+
+    def test_rebuild_missing_link_target_created(self):
+        d = RevisionFactory(content='[[Missing Target]]',
+                            is_approved=True).document
+        rebuild_kb()
+        assert 'class="new"' in Document.objects.get(pk=d.pk).html
+
+        target = RevisionFactory(document__title='Missing Target',
+                                 is_approved=True).document
+        rebuild_kb()
+        html = Document.objects.get(pk=d.pk).html
+        assert 'class="new"' not in html
+        assert '/kb/%s"' % target.slug in html
+
+    def test_rebuild_fallback_link_translated(self):
+        en = RevisionFactory(document__title='Fallback Target',
+                             is_approved=True).document
+        d = RevisionFactory(document__locale='de',
+                            content='[[Fallback Target]]',
+                            is_approved=True).document
+        rebuild_kb()
+
+        TranslatedRevisionFactory(document__locale='de', document__parent=en,
+                                  based_on=en.current_revision)
+        with mock.patch.object(_rebuild_kb_chunk, 'apply_async') as chunk:
+            rebuild_kb()
+            rebuilt = [id_ for call in chunk.call_args_list
+                       for id_ in call[1]['args'][0]]
+            assert d.id in rebuilt
+
+    def test_dependency_levels(self):
+        links = {
+            1: [('template', 2, 1, 'b', 'B'), ('link', 3, 1, 'c', 'C')],
+            2: [('include', 3, 1, 'c', 'C')],
+            4: [('include', 5, 1, 'e', 'E')],
+            5: [('include', 4, 1, 'd', 'D')],
+        }
+        eq_([[3], [2], [1], [4, 5]],
+            _dependency_levels([1, 2, 3, 4, 5], links))
+
 
 class ReviewMailTestCase(TestCaseBase):
     """Test that the review mail gets sent."""
@@ -204,3 +293,21 @@ class TestDocumentRenderCascades(TestCaseBase):
         eq_(self._clean(d1), u'ONE')
         eq_(self._clean(d2), u'ONE two')
         eq_(self._clean(d3), u'ONE ONE two three')
+
+    def test_diamond(self):
+        d1, _, _ = doc_rev_parser(
+            'one ', title=TEMPLATE_TITLE_PREFIX + 'D1', category=TEMPLATES_CATEGORY)
+        d2, _, _ = doc_rev_parser(
+            '[[T:D1]] two', title=TEMPLATE_TITLE_PREFIX + 'D2', category=TEMPLATES_CATEGORY)
+        d3, _, _ = doc_rev_parser(
+            '[[T:D1]] three', title=TEMPLATE_TITLE_PREFIX + 'D3', category=TEMPLATES_CATEGORY)
+        d4, _, _ = doc_rev_parser('[[T:D2]] [[T:D3]] four', title='D4')
+
+        eq_(self._clean(d4), u'one two one three four')
+
+        RevisionFactory(document=d1, content='ONE', is_approved=True)
+        render_document_cascade(d1)
+
+        eq_(self._clean(d2), u'ONE two')
+        eq_(self._clean(d3), u'ONE three')
+        eq_(self._clean(d4), u'ONE two ONE three four')
@@ -12,17 +12,19 @@ from pyquery import PyQuery as pq
 
 from kitsune.products.tests import ProductFactory
 from kitsune.sumo.redis_utils import redis_client, RedisError
+from kitsune.sumo.tasks import purge_surrogate_keys
 from kitsune.sumo.tests import SkipTest, TestCase, LocalizingClient, MobileTestCase, template_used
 from kitsune.sumo.urlresolvers import reverse
 from kitsune.users.tests import UserFactory, add_permission
 from kitsune.wiki.config import (
     CATEGORIES, TEMPLATES_CATEGORY, TYPO_SIGNIFICANCE, MEDIUM_SIGNIFICANCE, MAJOR_SIGNIFICANCE,
-    TEMPLATE_TITLE_PREFIX)
+    TEMPLATE_TITLE_PREFIX, DOC_SURROGATE_KEY)
 from kitsune.wiki.models import Document, HelpfulVoteMetadata, HelpfulVote, DraftRevision
 from kitsune.wiki.tests import (
     HelpfulVoteFactory, new_document_data, RevisionFactory, TranslatedRevisionFactory,
     TemplateDocumentFactory, DocumentFactory, DraftRevisionFactory, ApprovedRevisionFactory,
     RedirectRevisionFactory)
+from kitsune.wiki.tasks import render_document_cascade
 from kitsune.wiki.views import (
     _document_lock_check, _document_lock_clear, _document_lock_steal)
 
@@ -871,6 +873,91 @@ class MinimalViewTests(TestCase):
         eq_(res.get('X-Frame-Options', 'ALLOW').lower(), 'allow')
 
 
+class EdgeCacheTests(TestCase):
+
+    def setUp(self):
+        super(EdgeCacheTests, self).setUp()
+        template = ApprovedRevisionFactory(
+            document__title=TEMPLATE_TITLE_PREFIX + 'Edge',
+            document__category=TEMPLATES_CATEGORY,
+            content='Template content').document
+        self.doc = ApprovedRevisionFactory(content='[[T:Edge]]').document
+        self.doc.html = self.doc.parse_and_calculate_links()
+        self.doc.save()
+        self.template = template
+        self.url = reverse('wiki.document', args=[self.doc.slug],
+                           locale='en-US')
+
+    def test_anonymous(self):
+        res = self.client.get(self.url)
+        assert 'public' in res['Cache-Control']
+        assert 'Surrogate-Control' in res
+        keys = res['Surrogate-Key'].split()
+        assert DOC_SURROGATE_KEY % self.doc.id in keys
+        assert DOC_SURROGATE_KEY % self.template.id in keys
+        assert 'ETag' in res
+        assert 'Last-Modified' in res
+        assert 'Cookie' in res['Vary']
+
+        # The cached copy has the same headers.
+        cached = self.client.get(self.url)
+        eq_(res['Surrogate-Key'], cached['Surrogate-Key'])
+        assert 'Cookie' in cached['Vary']
+
+    def test_secure_anonymous(self):
+        res = self.client.get(self.url, secure=True)
+        assert 'public' in res['Cache-Control']
+
+    def test_authenticated(self):
+        self.client.login(username=UserFactory().username, password='testpass')
+        res = self.client.get(self.url)
+        assert 'Surrogate-Key' not in res
+        assert 'public' not in res.get('Cache-Control', '')
+
+    @mock.patch.object(purge_surrogate_keys, 'delay')
+    def test_purged_on_cascade(self, delay):
+        render_document_cascade(self.template)
+        assert mock.call([DOC_SURROGATE_KEY % self.template.id]) in (
+            delay.call_args_list)
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        super(ConditionalGetTests, self).setUp()
+        self.doc = ApprovedRevisionFactory().document
+        self.url = reverse('wiki.document', args=[self.doc.slug],
+                           locale='en-US')
+
+    def test_not_modified(self):
+        res = self.client.get(self.url)
+        eq_(200, res.status_code)
+        etag = res['ETag']
+
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        eq_(304, res.status_code)
+        eq_('', res.content)
+
+    def test_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        # Saving clears the cached html, so the page changed.
+        self.doc.save()
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        eq_(200, res.status_code)
+        assert res['ETag'] != etag
+
+    def test_mobile(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.cookies[settings.MOBILE_COOKIE] = 'on'
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        eq_(200, res.status_code)
+
+    def test_authenticated(self):
+        self.client.login(username=UserFactory().username, password='testpass')
+        res = self.client.get(self.url)
+        assert 'ETag' not in res
+
+
 class MobileDocumentTests(MobileTestCase):
 
     def setUp(self):
@@ -18,8 +18,8 @@ from django.shortcuts import get_object_or_404, render
 from django.template.loader import render_to_string
 from django.utils.translation import ugettext_lazy as _lazy, ugettext as _
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import (require_GET, require_POST,
-                                          require_http_methods)
+from django.views.decorators.http import (condition, require_GET,
+                                          require_POST, require_http_methods)
 
 from mobility.decorators import mobile_template
 from statsd import statsd
@@ -31,10 +31,12 @@ from kitsune.sumo.decorators import ratelimit
 from kitsune.sumo.templatetags.jinja_helpers import urlparams
 from kitsune.sumo.redis_utils import redis_client, RedisError
 from kitsune.sumo.urlresolvers import reverse
-from kitsune.sumo.utils import paginate, smart_int, get_next_url, truncated_json_dumps, get_browser
+from kitsune.sumo.utils import (
+    paginate, smart_int, get_next_url, truncated_json_dumps, get_browser,
+    patch_edge_cache, modified_time, page_etag)
 from kitsune.wiki.config import (
     CATEGORIES, MAJOR_SIGNIFICANCE, TEMPLATES_CATEGORY, DOCUMENTS_PER_PAGE,
-    COLLAPSIBLE_DOCUMENTS, FALLBACK_LOCALES)
+    COLLAPSIBLE_DOCUMENTS, FALLBACK_LOCALES, DOC_PAGE_MODIFIED_KEY)
 from kitsune.wiki.events import (
     EditDocumentEvent, ReviewableRevisionInLocaleEvent,
     ApproveRevisionInLocaleEvent, ApprovedOrReadyUnion,
@@ -84,13 +86,55 @@ def doc_page_cache(view):
 
         # We only cache if the response returns HTTP 200.
         if response.status_code == 200:
+            # This is the same for every anonymous user, so the CDN can
+            # cache it too.
+            if hasattr(response, 'surrogate_keys'):
+                patch_edge_cache(response, response.surrogate_keys)
             cache.set(cache_key, (response.content, dict(response._headers.values())))
 
         return response
     return _doc_page_cache_view
 
 
+def _document_validators(request, document_slug):
+    """Returns the ETag and modified time of the document page.
+
+    They come from one lookup of the document, and when its html last
+    changed. Returns None for pages we can't validate that cheaply:
+    pages for authed users or with messages, and documents that fall
+    back to another locale.
+
+    """
+    if not hasattr(request, '_document_validators'):
+        request._document_validators = None
+        if (not request.user.is_authenticated() and
+                not request.COOKIES.get('messages')):
+            doc = (Document.objects
+                   .filter(locale=request.LANGUAGE_CODE, slug=document_slug,
+                           current_revision__isnull=False)
+                   .values_list('id', 'current_revision_id')[:1])
+            if doc:
+                doc_id, revision_id = doc[0]
+                modified = modified_time(DOC_PAGE_MODIFIED_KEY % doc_id)
+                request._document_validators = (
+                    page_etag(request, doc_id, revision_id, modified),
+                    datetime.utcfromtimestamp(modified))
+    return request._document_validators
+
+
+def _document_etag(request, document_slug, **kwargs):
+    validators = _document_validators(request, document_slug)
+    return validators and validators[0]
+
+
+def _document_last_modified(request, document_slug, **kwargs):
+    validators = _document_validators(request, document_slug)
+    return validators and validators[1]
+
+
 @require_GET
+@condition(etag_func=_document_etag,
+           last_modified_func=_document_last_modified)
 @doc_page_cache
 @mobile_template('wiki/{mobile/}')
 def document(request, document_slug, template=None, document=None):
@@ -255,6 +299,8 @@ def document(request, document_slug, template=None, document=None):
     response = render(request, template, data)
     if minimal:
         response['X-Frame-Options'] = 'ALLOW'
+    # For doc_page_cache.
+    response.surrogate_keys = doc.surrogate_keys()
     return response
 
 
@@ -14,6 +14,7 @@ HOME = /tmp
 
 # Every 10 minutes!
 */10 * * * * {{ cron }} enqueue_lag_monitor_task
+*/10 * * * * {{ cron }} reconcile_recent_counts
 
 # Every hour.
 30 * * * * {{ cron }} send_welcome_emails
@@ -38,6 +39,7 @@ HOME = /tmp
 30 03 * * * {{ cron }} send_postatus_errors
 00 04 * * * {{ cron }} auto_archive_old_questions
 00 05 * * * {{ cron }} reindex_kb
+30 05 * * * {{ cron }} rebuild_navigation_index
 00 06 * * * {{ cron }} process_exit_surveys
 00 07 * * * {{ cron }} survey_recent_askers
 00 08 * * * {{ cron }} clear_expired_auth_tokens